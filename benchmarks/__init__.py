@@ -0,0 +1,2 @@
+# -*- coding: utf-8 -*-
+"""Benchmarks for Sanic-Auth, run with :code:`python -m benchmarks.<name>`"""
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""Run all benchmarks and emit the results as JSON.
+
+Usage: :code:`python -m benchmarks [-o results.json]`, compare results of
+different releases to track regressions.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import platform
+import sys
+
+import sanic
+
+import sanic_auth
+
+from . import (
+    bench_decorator, bench_password, bench_request_path, bench_serialize,
+    bench_stateless)
+
+
+def collect(quick=False):
+    scale = 10 if quick else 1
+    return {
+        'environment': {
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'platform': platform.platform(),
+            'sanic': sanic.__version__,
+            'sanic_auth': sanic_auth.__version__,
+        },
+        'request_path': asyncio.run(
+            bench_request_path.run(2000 // scale)),
+        'stateless': asyncio.run(bench_stateless.run(5000 // scale, 0.0)),
+        'serialize': bench_serialize.run(100000 // scale),
+        'decorator': bench_decorator.run(100000 // scale),
+        'password': asyncio.run(bench_password.run(50 // scale, 100000)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-o', '--output', help='write results to file')
+    parser.add_argument('--quick', action='store_true',
+                        help='fewer iterations, for smoke testing')
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+    results = json.dumps(collect(args.quick), indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(results + '\n')
+    else:
+        sys.stdout.write(results + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""Drive a Sanic application in-process through direct ASGI calls."""
+import asyncio
+from time import perf_counter
+
+
+class ASGIDriver:
+    """Minimal ASGI client, no network, no server process."""
+    def __init__(self, app):
+        self.app = app
+        self._lifespan = None
+        self._events = None
+
+    async def startup(self):
+        self._events = asyncio.Queue()
+        messages = []
+
+        async def send(message):
+            messages.append(message)
+
+        await self._events.put({'type': 'lifespan.startup'})
+        scope = {'type': 'lifespan', 'asgi': {'version': '3.0'}}
+        self._lifespan = asyncio.ensure_future(
+            self.app(scope, self._events.get, send))
+        while not messages:
+            await asyncio.sleep(0)
+
+    async def shutdown(self):
+        await self._events.put({'type': 'lifespan.shutdown'})
+        await self._lifespan
+
+    async def request(self, path, method='GET', headers=None, body=b''):
+        """Send a request, return :code:`(status, headers, body)`"""
+        raw_headers = [(b'host', b'localhost')]
+        for name, value in (headers or {}).items():
+            raw_headers.append((name.lower().encode(), value.encode()))
+        path, _, query = path.partition('?')
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'},
+            'http_version': '1.1', 'method': method, 'scheme': 'http',
+            'path': path, 'raw_path': path.encode(),
+            'query_string': query.encode(), 'root_path': '',
+            'headers': raw_headers,
+            'server': ('127.0.0.1', 8000), 'client': ('127.0.0.1', 50000),
+        }
+        sent = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': body, 'more_body': False}
+
+        async def send(message):
+            sent.append(message)
+
+        await self.app(scope, receive, send)
+        start = sent[0]
+        return (start['status'], list(start['headers']),
+                b''.join(m.get('body', b'') for m in sent[1:]))
+
+
+async def measure(driver, path, number, **kwargs):
+    """Issue :code:`number` sequential requests, return requests per second"""
+    return 1 / await per_request(driver, path, number, 1, **kwargs)
+
+
+async def per_request(driver, path, number, repeat=3, **kwargs):
+    """Return the best of :code:`repeat` rounds of seconds per request"""
+    request = driver.request
+    await request(path, **kwargs)
+    best = float('inf')
+    for _ in range(repeat):
+        start = perf_counter()
+        for _ in range(number):
+            await request(path, **kwargs)
+        best = min(best, (perf_counter() - start) / number)
+    return best
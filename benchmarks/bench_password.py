@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""Event loop latency during a login storm.
+
+A ticker coroutine measures how late the event loop wakes it up, while
+:code:`--logins` password verifications run concurrently, either inline in
+the event loop or in the pool of :class:`~sanic_auth.PasswordHasher`.
+"""
+import argparse
+import asyncio
+from time import perf_counter
+
+from sanic_auth import PasswordHasher
+from sanic_auth.password import hash_password, verify_password
+
+TICK = 0.001
+
+
+async def _ticker(lags, stop):
+    while not stop.is_set():
+        start = perf_counter()
+        await asyncio.sleep(TICK)
+        lags.append(perf_counter() - start - TICK)
+
+
+def _percentile(values, percent):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+
+async def _storm(logins, verify):
+    lags = []
+    stop = asyncio.Event()
+    ticker = asyncio.ensure_future(_ticker(lags, stop))
+    await asyncio.sleep(TICK)
+    start = perf_counter()
+    await asyncio.gather(*(verify() for _ in range(logins)))
+    elapsed = perf_counter() - start
+    stop.set()
+    await ticker
+    return {
+        'logins_per_second': logins / elapsed,
+        'loop_lag_p50_ms': _percentile(lags, 50) * 1000,
+        'loop_lag_p99_ms': _percentile(lags, 99) * 1000,
+        'loop_lag_max_ms': max(lags) * 1000,
+    }
+
+
+async def run(logins, iterations):
+    hashed = hash_password('pbkdf2_sha256', (iterations,), 'secret')
+
+    async def inline():
+        return verify_password('secret', hashed)
+
+    hasher = PasswordHasher(params=(iterations,))
+    results = {
+        'inline': await _storm(logins, inline),
+        'pool': await _storm(
+            logins, lambda: hasher.verify('secret', hashed)),
+    }
+    hasher.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--logins', type=int, default=200)
+    parser.add_argument('--iterations', type=int, default=100000,
+                        help='PBKDF2 iterations of each hash')
+    args = parser.parse_args()
+    results = asyncio.run(run(args.logins, args.iterations))
+    for name, result in results.items():
+        print('%-7s %8.1f logins/s  loop lag p50 %7.2f ms  p99 %7.2f ms  '
+              'max %7.2f ms' % (
+                  name, result['logins_per_second'],
+                  result['loop_lag_p50_ms'], result['loop_lag_p99_ms'],
+                  result['loop_lag_max_ms']))
+
+
+if __name__ == '__main__':
+    main()
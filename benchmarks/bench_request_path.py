@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""Per-request overhead of Sanic-Auth on the request path.
+
+Every scenario is a route of the same application, driven in-process with
+direct ASGI calls, and compared against an unprotected baseline route.  The
+wrappers made by :code:`login_required` are also called directly, to measure
+their own overhead without the noise of request handling.
+"""
+import argparse
+import asyncio
+import json
+import logging
+from time import perf_counter
+from types import SimpleNamespace
+
+from sanic import Sanic, response
+
+from sanic_auth import Auth, User
+
+from .asgi import ASGIDriver, per_request
+
+
+def make_app(name, async_loader):
+    app = Sanic(name)
+    app.config.AUTH_LOGIN_ENDPOINT = 'login_form'
+    sessions = {'anonymous': {}, 'demo': {}}
+
+    @app.middleware('request')
+    async def add_session(request):
+        request.ctx.session = sessions[request.headers.get('x-user', 'demo')]
+
+    auth = Auth(app)
+
+    if async_loader:
+        @auth.user_loader
+        async def load_user(token):
+            return User(*token)
+
+    def handle_no_auth(request):
+        return response.text('unauthorized', status=401)
+
+    @app.route('/login')
+    async def login_form(request):
+        return response.text('login')
+
+    @app.route('/baseline')
+    async def baseline(request):
+        return response.text('okay')
+
+    @app.route('/plain')
+    @auth.login_required
+    async def plain(request):
+        return response.text('okay')
+
+    @app.route('/user_keyword')
+    @auth.login_required(user_keyword='user')
+    async def user_keyword(request, user):
+        return response.text('okay')
+
+    @app.route('/handle_no_auth')
+    @auth.login_required(handle_no_auth=handle_no_auth)
+    async def custom_handle_no_auth(request):
+        return response.text('okay')
+
+    @app.route('/login_user')
+    async def login(request):
+        auth.login_user(request, User(id=1, name='demo'))
+        return response.text('okay')
+
+    @app.route('/logout_user')
+    async def logout(request):
+        auth.logout_user(request)
+        return response.text('okay')
+
+    sessions['demo'][auth.auth_session_key] = User(id=1, name='demo')
+    app.ctx.auth = auth
+    return app
+
+
+#: scenario name -> (path, user)
+SCENARIOS = {
+    'baseline': ('/baseline', 'demo'),
+    'login_required': ('/plain', 'demo'),
+    'user_keyword': ('/user_keyword', 'demo'),
+    'redirect': ('/plain', 'anonymous'),
+    'custom_handle_no_auth': ('/handle_no_auth', 'anonymous'),
+    'login_user': ('/login_user', 'anonymous'),
+    'logout_user': ('/logout_user', 'anonymous'),
+}
+
+
+async def run_direct(number, repeat):
+    """Call the handlers directly, without any HTTP machinery"""
+    app = make_app('bench_request_path_direct', False)
+    handlers = {route.name.rpartition('.')[2]: route.handler
+                for route in app.router.routes}
+    session = {'_auth': User(id=1, name='demo')}
+    request = SimpleNamespace(ctx=SimpleNamespace(session=session))
+    results = {}
+    for name in ('baseline', 'plain', 'user_keyword'):
+        handler = handlers[name]
+        best = float('inf')
+        for _ in range(repeat):
+            start = perf_counter()
+            for _ in range(number):
+                vars(request.ctx).pop('_auth_user', None)
+                await handler(request)
+            best = min(best, (perf_counter() - start) / number)
+        results[name] = best
+    results = _report(results)
+
+    # redirect to login view, with the login url built per call vs. cached
+    auth = app.ctx.auth
+    request = SimpleNamespace(app=app, path='/plain', query_string='')
+    timings = {}
+
+    def build_url_per_call(request):
+        return response.redirect(request.app.url_for('login_form'))
+
+    for name, handle_no_auth in (('url_for', build_url_per_call),
+                                 ('cached', auth.handle_no_auth)):
+        best = float('inf')
+        for _ in range(repeat):
+            start = perf_counter()
+            for _ in range(number):
+                handle_no_auth(request)
+            best = min(best, (perf_counter() - start) / number)
+        timings[name] = best * 1e6
+    results['handle_no_auth_us'] = timings
+    return results
+
+
+async def run_asgi(number, repeat):
+    """Drive the application through direct ASGI calls"""
+    results = {}
+    for loader in ('sync', 'async'):
+        driver = ASGIDriver(make_app('bench_request_path_' + loader,
+                                     loader == 'async'))
+        await driver.startup()
+        timings = dict.fromkeys(SCENARIOS, float('inf'))
+        # interleave scenarios, so that they are equally affected by noise
+        for _ in range(repeat):
+            for name, (path, user) in SCENARIOS.items():
+                timings[name] = min(timings[name], await per_request(
+                    driver, path, number, 1, headers={'X-User': user}))
+        await driver.shutdown()
+        results[loader + '_loader'] = _report(timings)
+    return results
+
+
+def _report(timings):
+    baseline = timings['baseline']
+    return {
+        name: {
+            'us_per_request': seconds * 1e6,
+            'overhead_us': (seconds - baseline) * 1e6,
+        }
+        for name, seconds in timings.items()
+    }
+
+
+async def run(number, repeat=5):
+    results = await run_asgi(number, repeat)
+    results['direct_call'] = await run_direct(number * 10, repeat)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-n', '--number', type=int, default=2000)
+    parser.add_argument('-r', '--repeat', type=int, default=5)
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+    print(json.dumps(asyncio.run(run(args.number, args.repeat)), indent=2))
+
+
+if __name__ == '__main__':
+    main()
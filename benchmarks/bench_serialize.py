@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""Default user token formats: legacy dict vs. compact tuple.
+
+Measures :code:`serialize` + :code:`load_user` round trips, both with an
+in-memory session (token stored as is) and with a JSON session backend,
+along with the size of the JSON encoded token.
+"""
+import argparse
+import json
+from timeit import repeat
+
+from sanic_auth import Auth, User
+
+
+def legacy_serialize(user):
+    return {'uid': user.id, 'name': user.name}
+
+
+def legacy_load_user(token):
+    if token is not None:
+        return User(id=token['uid'], name=token['name'])
+
+
+def bench(serialize, load_user, number):
+    user = User(id=1, name='demo')
+    encoded = json.dumps(serialize(user))
+
+    def in_memory():
+        load_user(serialize(user))
+
+    def json_backend():
+        load_user(json.loads(json.dumps(serialize(user))))
+
+    return {
+        'in_memory_ns': min(repeat(in_memory, number=number)) / number * 1e9,
+        'json_ns': min(repeat(json_backend, number=number)) / number * 1e9,
+        'json_bytes': len(encoded),
+    }
+
+
+def run(number):
+    auth = Auth()
+    return {
+        'legacy': bench(legacy_serialize, legacy_load_user, number),
+        'compact': bench(auth.serialize, auth.load_user, number),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-n', '--number', type=int, default=100000)
+    args = parser.parse_args()
+    for name, result in run(args.number).items():
+        print('%-8s in-memory %7.0f ns  json %7.0f ns  %3d bytes' % (
+            name, result['in_memory_ns'], result['json_ns'],
+            result['json_bytes']))
+
+
+if __name__ == '__main__':
+    main()
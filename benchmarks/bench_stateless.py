@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""Stateless signed tokens vs. session-backed authentication.
+
+The session-backed app loads its session from an asynchronous store in a
+request middleware, :code:`--store-latency` simulates the round trip to an
+external store such as Redis.
+"""
+import argparse
+import asyncio
+import logging
+
+from sanic import Sanic, response
+
+from sanic_auth import Auth, User
+
+from .asgi import ASGIDriver, measure
+
+
+def make_app(name, stateless, store_latency):
+    app = Sanic(name)
+    app.config.AUTH_LOGIN_URL = '/login'
+    if stateless:
+        app.config.AUTH_STATELESS = True
+        app.config.AUTH_SECRET_KEYS = ['benchmark secret']
+    else:
+        store = {'sid': {}}
+
+        @app.middleware('request')
+        async def load_session(request):
+            if store_latency:
+                await asyncio.sleep(store_latency)
+            request.ctx.session = store[request.cookies.get('sid', 'sid')]
+
+    auth = Auth(app)
+
+    @app.post('/login')
+    async def login(request):
+        signed = auth.login_user(request, User(id=1, name='demo'))
+        return response.text(signed or '')
+
+    @app.route('/user')
+    @auth.login_required(user_keyword='user')
+    async def user(request, user):
+        return response.text(user.name)
+
+    return app
+
+
+async def run(number, store_latency):
+    results = {}
+    for stateless in (False, True):
+        name = 'stateless' if stateless else 'session'
+        driver = ASGIDriver(make_app('bench_' + name, stateless,
+                                     store_latency))
+        await driver.startup()
+        status, headers, body = await driver.request('/login', 'POST')
+        headers = {'Cookie': 'sid=sid'}
+        if stateless:
+            headers = {'Authorization': 'Bearer ' + body.decode()}
+        results[name] = await measure(driver, '/user', number,
+                                      headers=headers)
+        await driver.shutdown()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-n', '--number', type=int, default=5000)
+    parser.add_argument('--store-latency', type=float, default=0.0,
+                        help='seconds spent on each session store read')
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+    results = asyncio.run(run(args.number, args.store_latency))
+    for name, rps in results.items():
+        print('%-10s %10.0f req/s' % (name, rps))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,7 @@
 from sanic import Sanic
 
+from sanic_auth import InMemorySessionBackend
+
 from core import auth
 
 from home_bp import home
@@ -9,6 +11,12 @@ from user_bp import user
 
 app = Sanic(__name__)
 app.config.AUTH_LOGIN_ENDPOINT = 'user.login'
+# NOTE
+# For demonstration purpose, sessions are kept in memory, use a shared backend,
+# e.g. RedisSessionBackend, when running multiple workers.
+app.config.AUTH_SESSION_BACKEND = InMemorySessionBackend()
+# allow session cookie over plain HTTP for local testing
+app.config.AUTH_COOKIE_SECURE = False
 auth.setup(app)
 
 app.blueprint(user, url_prefix='user')
@@ -16,13 +24,5 @@ app.blueprint(project, url_prefix='project')
 app.blueprint(home)
 
 
-# NOTE
-# For demonstration purpose, we use a mock-up globally-shared session object.
-session = {}
-@app.middleware('request')
-async def add_session(request):
-    request.ctx.session = session
-
-
 if __name__ == '__main__':
     app.run(host='127.0.0.1', port=8000, debug=True)
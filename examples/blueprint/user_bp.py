@@ -6,6 +6,9 @@ from core import auth
 
 user = Blueprint('user')
 
+# All routes in this blueprint require a logged in user, except login
+auth.protect(user, exclude=['user.login'])
+
 
 LOGIN_FORM = '''
 <h2>Please sign in, you can try:</h2>
@@ -43,14 +46,14 @@ async def login(request):
 
 
 @user.route('/logout')
-@auth.login_required
 async def logout(request):
     auth.logout_user(request)
     return response.redirect('/')
 
 
 @user.route('/')
-@auth.login_required(user_keyword='user')
-async def profile(request, user):
+async def profile(request):
+    # already loaded by the middleware installed by auth.protect()
+    user = await auth.current_user(request)
     text = '<a href="/user/logout">Logout</a><p>Welcome, %s</p>' % user.name
     return response.html(text)
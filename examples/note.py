@@ -1,20 +1,21 @@
 from datetime import datetime
 from sanic import Sanic, response
 
-from sanic_auth import Auth, User
+from sanic_auth import (
+    Auth, InMemoryRateLimiter, InMemorySessionBackend, User)
 
 
 app = Sanic(__name__)
 app.config.AUTH_LOGIN_ENDPOINT = 'login'
-auth = Auth(app)
-
 # NOTE
-# For demonstration purpose, we use a mock-up globally-shared session object.
-session = {}
-@app.middleware('request')
-async def add_session(request):
-    request.ctx.session = session
-
+# For demonstration purpose, sessions are kept in memory, use a shared backend,
+# e.g. RedisSessionBackend, when running multiple workers.
+app.config.AUTH_SESSION_BACKEND = InMemorySessionBackend()
+# allow session cookie over plain HTTP for local testing
+app.config.AUTH_COOKIE_SECURE = False
+# at most 5 login attempts per minute, by client IP and by username
+app.config.AUTH_RATE_LIMITER = InMemoryRateLimiter(limit=5, period=60)
+auth = Auth(app)
 
 
 LOGIN_FORM = '''
@@ -35,6 +36,7 @@ LOGIN_FORM = '''
 
 
 @app.route('/login', methods=['GET', 'POST'])
+@auth.rate_limit
 async def login(request):
     message = ''
     if request.method == 'POST':
@@ -1,66 +1,751 @@
 # -*- coding: utf-8 -*-
+from asyncio import ensure_future, sleep
 from collections import namedtuple
 from functools import partial, wraps
-from inspect import isawaitable
+from inspect import (
+    Parameter, isawaitable, iscoroutinefunction, signature)
+from time import perf_counter, time
+from urllib.parse import quote
 
 from sanic import response
+from sanic.exceptions import URLBuildError
+
+from .apikey import APIKeyStore
+from .audit import AuditLog, CallableSink, JSONLinesSink, SQLiteSink
+from .batch import BatchLoader
+from .cache import UserCache
+from .metrics import (
+    InMemoryMetrics, NamespacedMetrics, NullMetrics, PrometheusMetrics)
+from .offload import Offloader
+from .password import PasswordHasher, PasswordQueueFull
+from .ratelimit import InMemoryRateLimiter, RedisRateLimiter
+from .realms import Realms
+from .remember import (
+    InMemoryRememberStore, RememberStore, SQLiteRememberStore,
+    check_validator, hash_validator, make_token, split_token)
+from .revocation import (
+    GenerationStore, MmapGenerations, RedisGenerations,
+    SharedMemoryGenerations)
+from .session import (
+    InMemorySessionBackend, LazySession, RedisSessionBackend, SessionBackend,
+    SessionInterface)
+from .signing import TokenSigner
+from .websocket import ConnectionRegistry
 
 __version__ = '0.4.0.dev0'
 
-__all__ = ['Auth', 'User']
+__all__ = [
+    'APIKeyStore', 'AuditLog', 'Auth', 'BatchLoader', 'CallableSink',
+    'ConnectionRegistry', 'GenerationStore', 'InMemoryMetrics',
+    'InMemoryRateLimiter', 'InMemoryRememberStore',
+    'InMemorySessionBackend', 'JSONLinesSink', 'LazySession', 'LazyUser',
+    'MmapGenerations', 'NullMetrics', 'Offloader', 'PasswordHasher',
+    'PasswordQueueFull', 'PrometheusMetrics', 'Realms', 'RedisGenerations',
+    'RedisRateLimiter', 'RedisSessionBackend', 'RememberStore',
+    'SQLiteRememberStore', 'SQLiteSink', 'SessionBackend',
+    'SessionInterface', 'SharedMemoryGenerations', 'TokenSigner', 'User',
+    'UserCache',
+]
+
+
+class User(namedtuple('User', 'id name roles tenant', defaults=((), None))):
+    """A User proxy type, used by default :meth:`Auth.load_user`.
+
+    It is immutable and slotted, besides :code:`id` and :code:`name`, it can
+    carry optional claims, :code:`roles` (a tuple) and :code:`tenant`.
+    """
+    __slots__ = ()
+
+
+class LazyUser:
+    """Awaitable proxy of the current user, see :meth:`Auth.login_optional`.
+
+    Awaiting it resolves the user with :meth:`Auth.current_user`, so the
+    user is loaded on first use only, at most once per request, and it is
+    :code:`None` if no user logged in.
+    """
+    __slots__ = ('auth', 'request')
+
+    def __init__(self, auth, request):
+        self.auth = auth
+        self.request = request
+
+    def __await__(self):
+        return self._resolve().__await__()
+
+    async def _resolve(self):
+        user = self.auth.current_user(self.request)
+        if isawaitable(user):
+            user = await user
+        return user
+
+    def __repr__(self):
+        return '<LazyUser>'
+
+
+def _coroutine_function(func):
+    # return func itself if it is a coroutine function, or an adapter
+    if iscoroutinefunction(func):
+        return func
+
+    async def call(*args, **kwargs):
+        result = func(*args, **kwargs)
+        if isawaitable(result):
+            result = await result
+        return result
+    return call
+
 
+class _Rejected(Exception):
+    # carrying the response of request rejected before reaching the route
+    def __init__(self, response):
+        super().__init__(response)
+        self.response = response
 
-#: A User proxy type, used by default implementation of :meth:`Auth.load_user`
-User = namedtuple('User', 'id name'.split())
+
+# marker for "user not resolved yet in this request"
+_UNRESOLVED = object()
+
+# maximum number of login urls cached, per endpoint, scheme and host
+_MAX_LOGIN_URLS = 256
+
+
+def _route_handler(handler):
+    # websocket handlers are wrapped by sanic
+    if getattr(handler, 'is_websocket', False):
+        return handler.args[0]
+    return handler
+
+
+def _realm_config(app, realm):
+    # config getter of realm, falling back to application's configuration
+    if realm is None:
+        return app.config.get
+    overrides = app.config.get('AUTH_REALMS', {}).get(realm, {})
+
+    def get(key, default=None):
+        if key in overrides:
+            return overrides[key]
+        return app.config.get(key, default)
+    return get
 
 
 class Auth:
-    """Authentication Manager."""
-    def __init__(self, app=None):
+    """Authentication Manager.
+
+    More than one of them can be set up with the same application as named
+    realms, each configured by its entry in :code:`AUTH_REALMS`, see
+    :class:`Realms`.
+    """
+    def __init__(self, app=None, realm=None):
         self.app = None
+        self.batch_loader = None
+        self._loaders = {}
         if app is not None:
-            self.setup(app)
+            self.setup(app, realm)
 
-    def setup(self, app):
+    def setup(self, app, realm=None):
         """Setup with application's configuration.
 
         This method be called automatically if the application is provided
         upon initialization
+
+        If :code:`realm` is given, options in :code:`AUTH_REALMS[realm]`
+        override the ones of application, and the default
+        :code:`AUTH_TOKEN_NAME` is :code:`"_auth_<realm>"`.
         """
         if self.app is not None:
             raise RuntimeError('already initialized with an application')
         self.app = app
-        get = app.config.get
+        self.realm = realm
+        get = _realm_config(app, realm)
+        self.realm_hosts = tuple(get('AUTH_REALM_HOSTS', ()))
+        self.realm_prefixes = tuple(get('AUTH_REALM_PREFIXES', ()))
         self.login_endpoint = get('AUTH_LOGIN_ENDPOINT', 'auth.login')
         self.login_url = get('AUTH_LOGIN_URL', None)
+        self.login_external = get('AUTH_LOGIN_EXTERNAL', False)
+        self.login_hosts = frozenset(
+            host.lower() for host in get('AUTH_LOGIN_HOSTS', self.realm_hosts))
+        self.login_next_arg = get('AUTH_LOGIN_NEXT_ARG', None)
+        self._login_urls = {}
+        app.register_listener(self._resolve_login_url, 'before_server_start')
+        app.register_listener(self._check_user_keywords, 'before_server_start')
         session = get('AUTH_SESSION_NAME', get('SESSION_NAME', 'session'))
         self.session_name = session
-        self.auth_session_key = get('AUTH_TOKEN_NAME', '_auth')
+        self.auth_session_key = get(
+            'AUTH_TOKEN_NAME', '_auth' if realm is None else '_auth_' + realm)
+        self.user_ctx_name = self.auth_session_key + '_user'
+        self.cookie_secure = get('AUTH_COOKIE_SECURE', True)
+        backend = get('AUTH_SESSION_BACKEND', None)
+        if backend is not None:
+            # realms sharing the same session share the same interface
+            interfaces = vars(app.ctx).setdefault(
+                'auth_session_interfaces', {})
+            interface = interfaces.get(session)
+            if interface is None or interface.backend is not backend:
+                interface = interfaces[session] = SessionInterface(
+                    backend, name=session,
+                    cookie_name=get('AUTH_SESSION_COOKIE', 'session'),
+                    max_age=get('AUTH_SESSION_MAX_AGE', 14 * 24 * 3600),
+                    secure=self.cookie_secure)
+                interface.install(app)
+            self.session_interface = interface
+        else:
+            self.session_interface = None
+        cache_size = get('AUTH_USER_CACHE_SIZE', 0)
+        self.user_cache = get('AUTH_USER_CACHE', None)
+        if self.user_cache is None and cache_size:
+            ttl = get('AUTH_USER_CACHE_TTL', None)
+            self.user_cache = UserCache(cache_size, ttl)
+        stateless = get('AUTH_STATELESS', False)
+        # signed tokens cannot be taken back, so they must expire
+        self.token_max_age = get('AUTH_TOKEN_MAX_AGE',
+                                 24 * 3600 if stateless else None)
+        self.renew_window = get('AUTH_TOKEN_RENEW_WINDOW', None)
+        self.renew_ctx_name = self.auth_session_key + '_renewed'
+        self._revalidating = set()
+        if stateless:
+            if self.token_max_age is None:
+                raise RuntimeError(
+                    'AUTH_TOKEN_MAX_AGE is required in stateless mode')
+            self.signer = TokenSigner(get('AUTH_SECRET_KEYS', ()),
+                                      self.token_max_age)
+            self.token_ctx_name = self.auth_session_key + '_token'
+            self.cookie_name = get('AUTH_COOKIE_NAME', self.auth_session_key)
+            app.register_middleware(self._set_token_cookie, 'response')
+        else:
+            self.signer = None
+        metrics = get('AUTH_METRICS', None)
+        if isinstance(metrics, NullMetrics):
+            metrics = None
+        elif metrics is not None and realm is not None:
+            metrics = NamespacedMetrics(metrics, realm)
+        self.metrics = metrics
+        self.timings_ctx_name = self.auth_session_key + '_timings'
+        if metrics is not None and self.user_cache is not None:
+            cache = self.user_cache
+            metrics.add_gauge('user_cache_hits', lambda: cache.hits)
+            metrics.add_gauge('user_cache_misses', lambda: cache.misses)
+            metrics.add_gauge('user_cache_hit_ratio', lambda: cache.hit_ratio)
+        executor = get('AUTH_LOADER_EXECUTOR', None)
+        if executor is not None:
+            offloader = self.offloader = Offloader(
+                executor, get('AUTH_LOADER_WORKERS', 4),
+                get('AUTH_LOADER_TIMEOUT', None))
+            app.register_listener(self._close_offloader, 'after_server_stop')
+            if metrics is not None:
+                metrics.add_gauge('loader_queue_depth',
+                                  lambda: offloader.waiting)
+                metrics.add_gauge('loader_running', lambda: offloader.running)
+                metrics.add_gauge('loader_timeouts',
+                                  lambda: offloader.timeouts)
+            # loaders registered before setup
+            for name, (func, inline, options) in list(self._loaders.items()):
+                self._set_loader(name, func, inline, **options)
+        else:
+            self.offloader = None
+        self.api_keys = get('AUTH_API_KEYS', None)
+        self.api_key_header = get('AUTH_API_KEY_HEADER', 'X-API-Key')
+        if self.api_keys is not None:
+            app.register_listener(self._open_api_keys, 'before_server_start')
+        self.rate_limiter = get('AUTH_RATE_LIMITER', None)
+        self.rate_limit_field = get('AUTH_RATE_LIMIT_FIELD', 'username')
+        if getattr(self.rate_limiter, 'close', None) is not None:
+            app.register_listener(self._close_rate_limiter,
+                                  'after_server_stop')
+        self.password_hasher = get('AUTH_PASSWORD_HASHER', None)
+        if self.password_hasher is None:
+            self.password_hasher = PasswordHasher()
+        app.register_listener(self._close_password_hasher, 'after_server_stop')
+        self.reject_early = get('AUTH_REJECT_EARLY', False)
+        if self.reject_early:
+            app.add_signal(self._authenticate_early, 'http.routing.after')
+            app.exception(_Rejected)(self._rejected)
+        self.generations = get('AUTH_REVOCATION', None)
+        if self.generations is not None:
+            app.register_listener(self._open_generations,
+                                  'before_server_start')
+            app.register_listener(self._close_generations, 'after_server_stop')
+        self.connections = ConnectionRegistry()
+        self.websocket_check_interval = get('AUTH_WS_CHECK_INTERVAL', 60)
+        self._sweeper = None
+        self.remember_store = get('AUTH_REMEMBER_STORE', None)
+        self.remember_cookie_name = get('AUTH_REMEMBER_COOKIE',
+                                        self.auth_session_key + '_remember')
+        self.remember_max_age = get('AUTH_REMEMBER_MAX_AGE', 30 * 86400)
+        self.remember_ctx_name = self.auth_session_key + '_remember'
+        if self.remember_store is not None:
+            app.register_middleware(self._set_remember_cookie, 'response')
+            app.register_listener(self._open_remember_store,
+                                  'before_server_start')
+            app.register_listener(self._close_remember_store,
+                                  'after_server_stop')
+        audit = self.audit = get('AUTH_AUDIT', None)
+        if audit is not None:
+            app.register_listener(self._open_audit, 'before_server_start')
+            app.register_listener(self._close_audit, 'after_server_stop')
+            if metrics is not None:
+                metrics.add_gauge('audit_queue_depth', lambda: len(audit))
+                metrics.add_gauge('audit_dropped', lambda: audit.dropped)
 
-    def login_user(self, request, user):
+    def login_user(self, request, user, *, remember=False):
         """Log in a user.
 
         The user object will be serialized with :meth:`Auth.serialize` and the
         result, usually a token representing the logged in user, will be
         placed into the request session.
+
+        In stateless mode, the token is signed and sent to the client as a
+        cookie instead, the signed token is also returned, so it can be
+        handed to clients using the :code:`Authorization: Bearer` header.
+
+        If :code:`AUTH_REVOCATION` is configured, the current generation of
+        the user is issued along with the token, see :meth:`revoke_user`.
+        If :code:`AUTH_TOKEN_MAX_AGE` is set, the token expires, in session
+        mode too.
+
+        If :code:`remember` is :code:`True`, a remember-me token is issued
+        in a cookie as well, valid for :code:`AUTH_REMEMBER_MAX_AGE` seconds,
+        it logs the user in again once the session is gone, see
+        :meth:`current_user`.  :code:`AUTH_REMEMBER_STORE` must be configured.
+
+        If the serializer is asynchronous, or offloaded, an awaitable is
+        returned, see :meth:`serializer`.  With :code:`remember`, the user
+        is logged in right away, and an awaitable is returned as well, which
+        is done once the remember-me token is stored.
         """
-        self.get_session(request)[self.auth_session_key] = self.serialize(user)
+        if remember and self.remember_store is None:
+            raise RuntimeError('AUTH_REMEMBER_STORE is not configured')
+        token = self.serialize(user)
+        if isawaitable(token):
+            return self._login_user_later(request, token, remember)
+        self.forget_user(request)
+        self._issue(request, token, regenerate=True)
+        if self.audit is not None:
+            self._audit_soon(request, 'login', token)
+        result = None
+        if self.signer is not None:
+            result = getattr(request.ctx, self.token_ctx_name)[1]
+        if remember:
+            # stored even if the caller does not wait for it
+            return ensure_future(
+                self._remembered(self._remember(request, token), result))
+        return result
+
+    @staticmethod
+    async def _remembered(stored, result):
+        await stored
+        return result
+
+    async def _login_user_later(self, request, token, remember=False):
+        if isawaitable(token):
+            token = await token
+        self.forget_user(request)
+        self._issue(request, token, regenerate=True)
+        if remember:
+            await self._remember(request, token)
+        if self.audit is not None:
+            blocked = self._audit(request, 'login', token)
+            if blocked is not None:
+                await blocked
+        if self.signer is not None:
+            return getattr(request.ctx, self.token_ctx_name)[1]
+        return None
+
+    def _wrap(self, token, expires=None):
+        # the stored form of token, checked by _unwrap
+        envelope = None
+        if self.generations is not None:
+            envelope = {'token': token,
+                        'gen': self.generations.get(self.token_uid(token))}
+        if expires is not None:
+            envelope = envelope or {'token': token}
+            envelope['exp'] = expires
+        return token if envelope is None else envelope
+
+    def _issue(self, request, token, regenerate=False):
+        if self.signer is None:
+            expires = None
+            if self.token_max_age is not None:
+                expires = int(time() + self.token_max_age)
+            session = self.get_session(request)
+            session[self.auth_session_key] = self._wrap(token, expires)
+            if regenerate:
+                self._regenerate(session)
+        else:
+            stored = self._wrap(token)
+            setattr(request.ctx, self.token_ctx_name,
+                    (stored, self.signer.sign(stored)))
+
+    @staticmethod
+    def _regenerate(session):
+        # a new session id upon login or logout, against session fixation
+        regenerate = getattr(session, 'regenerate', None)
+        if regenerate is not None:
+            regenerate()
+
+    def _remember(self, request, token, expires=None):
+        # the cookie is set at once, return the awaitable of store
+        selector, validator, cookie = make_token()
+        if expires is None:
+            expires = int(time() + self.remember_max_age)
+        setattr(request.ctx, self.remember_ctx_name,
+                (selector, cookie, expires))
+        return self.remember_store.add(
+            selector, self.token_uid(token), hash_validator(validator),
+            self._wrap(token), expires)
+
+    async def _restore(self, request):
+        # log in again with the remember-me token, which is used only once,
+        # the cookie is deleted if the token is of no use
+        cookie = request.cookies.get(self.remember_cookie_name)
+        if cookie is None or \
+                request.headers.get('upgrade', '').lower() == 'websocket':
+            # the rotated token could not be sent along with handshake
+            return None
+        forget = (None, None, None)
+        selector = split_token(cookie)
+        if selector is None:
+            setattr(request.ctx, self.remember_ctx_name, forget)
+            return None
+        selector, validator = selector
+        store = self.remember_store
+        entry = await store.get(selector)
+        if entry is None:
+            setattr(request.ctx, self.remember_ctx_name, forget)
+            return None
+        uid, hashed, stored, expires = entry
+        if not check_validator(validator, hashed):
+            # the selector is known, so the token was likely stolen and
+            # rotated by someone else, forget the user on all devices
+            await store.delete_user(uid)
+            setattr(request.ctx, self.remember_ctx_name, forget)
+            return None
+        await store.delete(selector)
+        token = self._unwrap(stored)[0] if expires > time() else None
+        if token is None:
+            setattr(request.ctx, self.remember_ctx_name, forget)
+            return None
+        self._issue(request, token, regenerate=True)
+        await self._remember(request, token, expires)
+        if self.metrics is not None:
+            self.metrics.incr('remembered')
+        if self.audit is not None:
+            blocked = self._audit(request, 'remembered', token)
+            if blocked is not None:
+                await blocked
+        return token
+
+    def _set_remember_cookie(self, request, response):
+        pending = getattr(request.ctx, self.remember_ctx_name, None)
+        if pending is None:
+            return
+        selector, cookie, expires = pending
+        if cookie is None:
+            response.delete_cookie(self.remember_cookie_name)
+        else:
+            response.add_cookie(
+                self.remember_cookie_name, cookie, httponly=True,
+                secure=self.cookie_secure,
+                max_age=max(0, int(expires - time())))
+
+    async def _open_remember_store(self, app, loop=None):
+        await self.remember_store.open()
+
+    async def _close_remember_store(self, app, loop=None):
+        await self.remember_store.close()
 
     def logout_user(self, request):
         """Log out any logged in user in this session.
 
-        Return the user token or :code:`None` if no user logged in.
+        Return the user token or :code:`None` if no user logged in.  With a
+        lazily loaded session, the token is only returned if the session has
+        been loaded, e.g. by :meth:`current_user`.
+
+        All websocket connections of the user in this worker are closed, see
+        :meth:`websocket_login_required`, and the remember-me token of the
+        request, if any, is deleted.
+
+        In stateless mode, only the cookie is deleted, copies of the signed
+        token stay valid until they expire, unless :meth:`revoke_user` is
+        called as well.
+        """
+        self.forget_user(request)
+        if self.signer is None:
+            session = self.get_session(request)
+            token = self._unwrap(session.pop(self.auth_session_key, None))[0]
+            self._regenerate(session)
+        else:
+            token = self.get_token(request)
+            setattr(request.ctx, self.token_ctx_name, (None, None))
+        if token is not None:
+            self._disconnect(self.token_uid(token), 'logged out')
+        if self.remember_store is not None:
+            self._forget_remembered(request)
+        if self.audit is not None:
+            self._audit_soon(request, 'logout', token)
+        return token
+
+    def _forget_remembered(self, request):
+        selectors = []
+        cookie = request.cookies.get(self.remember_cookie_name)
+        if cookie is not None:
+            selectors.append((split_token(cookie) or (None,))[0])
+        pending = getattr(request.ctx, self.remember_ctx_name, None)
+        if pending is not None:
+            selectors.append(pending[0])
+        for selector in selectors:
+            if selector is not None:
+                ensure_future(self.remember_store.delete(selector))
+        if selectors:
+            setattr(request.ctx, self.remember_ctx_name, (None, None, None))
+
+    def get_token(self, request):
+        """Get the token of the logged in user, or :code:`None`.
+
+        The token is read from the session, or in stateless mode, verified
+        from the signed token in cookie or :code:`Authorization` header.
+        If :code:`AUTH_API_KEYS` is configured, an API key in the
+        :code:`X-API-Key` or :code:`Authorization: Bearer` header is looked
+        up first.
+
+        If :code:`AUTH_TOKEN_RENEW_WINDOW` is set, a token expiring within
+        the window is re-issued, at most once per request.
+
+        If the session is lazily loaded and not loaded yet, an awaitable is
+        returned instead.
         """
-        return self.get_session(request).pop(self.auth_session_key, None)
+        if self.api_keys is not None:
+            key = request.headers.get(self.api_key_header)
+            if key is not None:
+                return self.api_keys.verify(key)
+            scheme, _, key = request.headers.get(
+                'Authorization', '').partition(' ')
+            if scheme.lower() == 'bearer':
+                token = self.api_keys.verify(key)
+                if token is not None:
+                    return token
+        if self.signer is None:
+            if self.metrics is None:
+                session = self.get_session(request)
+            else:
+                session = self._timed(request, 'session', self.get_session,
+                                      request)
+            if getattr(session, 'loaded', True):
+                return self._checked(
+                    request, session.get(self.auth_session_key, None))
+            return self._get_token_later(request, session)
+        pending = getattr(request.ctx, self.token_ctx_name, None)
+        if pending is not None:
+            return self._unwrap(pending[0])[0]
+        signed = request.cookies.get(self.cookie_name)
+        if signed is None:
+            scheme, _, signed = request.headers.get(
+                'Authorization', '').partition(' ')
+            if scheme.lower() != 'bearer':
+                return None
+        loaded = self.signer.unsign_with_expiry(signed)
+        if loaded is None:
+            return None
+        return self._checked(request, *loaded)
+
+    async def _get_token_later(self, request, session):
+        if self.metrics is None:
+            await session.load()
+        else:
+            await self._timed(request, 'session_load', session.load)
+        return self._checked(
+            request, session.get(self.auth_session_key, None))
+
+    def _unwrap(self, stored, expires=None):
+        # return (token, expires), or (None, None) if revoked or expired
+        if isinstance(stored, dict) and 'token' in stored:
+            token = stored['token']
+            generation = stored.get('gen', 0)
+            expires = stored.get('exp', expires)
+            if expires is not None and expires < time():
+                return None, None
+        else:
+            # issued before revocation or expiry was enabled
+            token, generation = stored, 0
+        generations = self.generations
+        if generations is not None and token is not None and \
+                generation != generations.get(self.token_uid(token)):
+            if self.metrics is not None:
+                self.metrics.incr('revoked')
+            return None, None
+        return token, expires
+
+    def _checked(self, request, stored, expires=None):
+        token, expires = self._unwrap(stored, expires)
+        if expires is not None and self.renew_window is not None and \
+                expires - time() < self.renew_window:
+            self._renew(request, token)
+        return token
+
+    def _renew(self, request, token):
+        ctx = request.ctx
+        if getattr(ctx, self.renew_ctx_name, False):
+            return
+        setattr(ctx, self.renew_ctx_name, True)
+        # the session write, or the new cookie, goes with the response
+        self._issue(request, token)
+        if self.metrics is not None:
+            self.metrics.incr('renewed')
+        if self.user_cache is not None:
+            uid = self.token_uid(token)
+            if uid not in self._revalidating:
+                self._revalidating.add(uid)
+                self.app.add_task(self._revalidate(uid, token))
+
+    async def _revalidate(self, uid, token):
+        # reload the cached user off the request path
+        try:
+            self.invalidate_user(uid)
+            user = self._load(token)
+            if isawaitable(user):
+                await user
+        finally:
+            self._revalidating.discard(uid)
+
+    def _set_token_cookie(self, request, response):
+        pending = getattr(request.ctx, self.token_ctx_name, None)
+        if pending is None:
+            return
+        token, signed = pending
+        if signed is None:
+            response.delete_cookie(self.cookie_name)
+        else:
+            response.add_cookie(
+                self.cookie_name, signed, httponly=True,
+                secure=self.cookie_secure, max_age=self.signer.max_age)
 
     def current_user(self, request):
         """Get the current logged in user.
 
         Return :code:`None` if no user logged in.
+
+        The user is loaded at most once per request, the result is memoized
+        in :code:`request.ctx` and shared by all callers, including
+        :meth:`login_required`.  If the user loader is asynchronous, an
+        awaitable is returned, which can be awaited any number of times.
+
+        If no user logged in, but the request carries a remember-me token,
+        see :meth:`login_user`, the user is logged in again, and the token
+        is replaced by a new one.  An awaitable is returned in this case.
         """
-        token = self.get_session(request).get(self.auth_session_key, None)
-        if token is not None:
-            return self.load_user(token)
+        ctx = request.ctx
+        user = getattr(ctx, self.user_ctx_name, _UNRESOLVED)
+        if user is _UNRESOLVED:
+            user = self._resolve_user(request)
+            setattr(ctx, self.user_ctx_name, user)
+        return user
+
+    def is_authenticated(self, request):
+        """Check if there is a logged in user, without loading the user.
+
+        Only the presence of user token is checked, so it is cheaper than
+        :meth:`current_user`, but the user might have been deleted from the
+        data store, and remember-me tokens are not looked up.  If the session
+        is lazily loaded and not loaded yet, an awaitable is returned.
+        """
+        token = self.get_token(request)
+        if isawaitable(token):
+            return self._is_not_none(token)
+        return token is not None
+
+    @staticmethod
+    async def _is_not_none(awaitable):
+        return (await awaitable) is not None
+
+    def forget_user(self, request):
+        """Drop the user memoized by :meth:`current_user` for this request"""
+        ctx = vars(request.ctx)
+        name = self.user_ctx_name
+        ctx.pop(name, None)
+        ctx.pop(name + '_roles', None)
+        ctx.pop(name + '_permissions', None)
+
+    def _resolve_user(self, request):
+        token = self.get_token(request)
+        if isawaitable(token) or token is None and \
+                self.remember_store is not None and \
+                self.remember_cookie_name in request.cookies:
+            return ensure_future(self._resolve_user_later(request, token))
+        return self._user_from_token(request, token)
+
+    async def _resolve_user_later(self, request, token):
+        if isawaitable(token):
+            token = await token
+        if token is None and self.remember_store is not None:
+            token = await self._restore(request)
+        user = self._user_from_token(request, token)
+        if isawaitable(user):
+            user = await user
+        return user
+
+    def _user_from_token(self, request, token):
+        metrics = self.metrics
+        if token is None:
+            if metrics is not None:
+                metrics.incr('anonymous')
+            return None
+        user = self._load(token, request)
+        if isawaitable(user):
+            # wrap in a future so it can be awaited by more than one caller
+            user = ensure_future(user)
+            if metrics is not None:
+                user.add_done_callback(self._count_loaded)
+        elif metrics is not None:
+            metrics.incr('anonymous' if user is None else 'authenticated')
+        return user
+
+    def _count_loaded(self, future):
+        if not future.cancelled() and future.exception() is None:
+            user = future.result()
+            self.metrics.incr('anonymous' if user is None else 'authenticated')
+
+    def _load(self, token, request=None):
+        if self.batch_loader is None:
+            load = self.load_user
+        else:
+            load = self.batch_loader.load
+        if self.metrics is not None:
+            load = partial(self._timed, request, 'load_user', load)
+        cache = self.user_cache
+        if cache is not None:
+            return cache.get(token, load, self.token_uid(token), self.realm)
+        return load(token)
+
+    def _timed(self, request, name, func, *args):
+        start = perf_counter()
+        result = func(*args)
+        if isawaitable(result):
+            result = ensure_future(result)
+            result.add_done_callback(
+                lambda _: self._observe(request, name, perf_counter() - start))
+        else:
+            self._observe(request, name, perf_counter() - start)
+        return result
+
+    def _observe(self, request, name, seconds):
+        self.metrics.observe(name, seconds)
+        if request is not None:
+            ctx = vars(request.ctx)
+            timings = ctx.get(self.timings_ctx_name)
+            if timings is None:
+                timings = ctx[self.timings_ctx_name] = {}
+            timings[name] = timings.get(name, 0.0) + seconds
+
+    def request_timings(self, request):
+        """Get time spent in Sanic-Auth during the request, by operation.
+
+        Return a dict of seconds spent on :code:`"session"` access,
+        :code:`"session_load"` (lazily loaded sessions only),
+        :code:`"load_user"` and :code:`"handle_no_auth"`, only available if
+        :code:`AUTH_METRICS` is configured.
+        """
+        return dict(getattr(request.ctx, self.timings_ctx_name, {}))
 
     def login_required(self, route=None, *, user_keyword=None,
                        handle_no_auth=None):
@@ -84,44 +769,551 @@ class Auth:
         if route is None:
             return partial(self.login_required, user_keyword=user_keyword,
                            handle_no_auth=handle_no_auth)
+        return self._protect(route, None, user_keyword, handle_no_auth, None)
+
+    def login_optional(self, route=None, *, user_keyword='user'):
+        """Decorator to inject the user, if any, into route handler lazily.
+
+        Unlike :meth:`login_required`, anonymous visitors are let in, and the
+        handler is given a :class:`LazyUser` as the :code:`user_keyword`
+        argument, which is to be awaited for the user or :code:`None`.  The
+        user is not loaded unless the handler awaits it, and requests
+        without user token never reach :meth:`load_user`.
+
+        :param route:
+            the route handler
+        :param user_keyword:
+            keyword only arugment, the name of argument of the user proxy.
+        """
+        if route is None:
+            return partial(self.login_optional, user_keyword=user_keyword)
+
+        if iscoroutinefunction(route):
+            async def optional(request, *args, **kwargs):
+                kwargs[user_keyword] = LazyUser(self, request)
+                return await route(request, *args, **kwargs)
+        else:
+            async def optional(request, *args, **kwargs):
+                kwargs[user_keyword] = LazyUser(self, request)
+                resp = route(request, *args, **kwargs)
+                if isawaitable(resp):
+                    resp = await resp
+                return resp
+
+        return self._injecting(wraps(route)(optional), route, user_keyword)
+
+    def permission_required(self, *permissions, any_of=(), user_keyword=None,
+                            handle_no_auth=None, handle_forbidden=None):
+        """Decorator to make routes only accessible with given permissions.
+
+        Like :meth:`login_required`, and in addition, the authenticated user
+        must be granted all of :code:`permissions`, and at least one of
+        :code:`any_of` if it is not empty.  User permissions are loaded with
+        :meth:`load_permissions` at most once per request.
+
+        The required permissions are compiled into sets upon decoration, so
+        checking them does not depend on how many permissions a user has.
 
+        :param handle_forbidden:
+            keyword only arugment, if it is not :code:`None`, and set to a
+            function this will be used to handle a request from an
+            authenticated user without required permissions, instead of
+            :meth:`handle_forbidden`.
+        """
+        check = self._requirement('permissions', permissions, any_of)
+        return partial(self._protect, check=check, user_keyword=user_keyword,
+                       handle_no_auth=handle_no_auth,
+                       handle_forbidden=handle_forbidden)
+
+    def roles_required(self, *roles, any_of=(), user_keyword=None,
+                       handle_no_auth=None, handle_forbidden=None):
+        """Decorator to make routes only accessible with given roles.
+
+        Same as :meth:`permission_required`, with user roles loaded with
+        :meth:`load_roles` instead.
+        """
+        check = self._requirement('roles', roles, any_of)
+        return partial(self._protect, check=check, user_keyword=user_keyword,
+                       handle_no_auth=handle_no_auth,
+                       handle_forbidden=handle_forbidden)
+
+    def protect(self, target, exclude=(), *, handle_no_auth=None):
+        """Make all routes of a blueprint or application only accessible with
+        authenticated user.
+
+        Instead of wrapping each route handler, one request middleware is
+        installed on :code:`target`, it resolves the current user once per
+        request, which is then memoized for :meth:`current_user`, and
+        redirects visitors to login view if no user logged in.  The
+        middleware has a lower priority than the default, so it runs after
+        other request middleware, e.g. the one setting up the session.
+
+        :param target:
+            a blueprint or an application
+        :param exclude:
+            routes left public, either as endpoint names, the same as in
+            :code:`url_for`, e.g. :code:`"user.login"`, or as URI prefixes,
+            which start with :code:`"/"`.
+        :param handle_no_auth:
+            keyword only arugment, if it is not :code:`None`, and set to a
+            function this will be used to handle an unauthorized request.
+        """
         if handle_no_auth is not None:
             assert callable(handle_no_auth), 'handle_no_auth must be callable'
+        if isinstance(exclude, str):
+            exclude = [exclude]
+        names = frozenset(e for e in exclude if not e.startswith('/'))
+        prefixes = tuple(e for e in exclude if e.startswith('/'))
 
-        @wraps(route)
-        async def privileged(request, *args, **kwargs):
+        async def guard(request):
+            if request.route is None:
+                return None
+            if names and request.endpoint.partition('.')[2] in names:
+                return None
+            if prefixes and request.path.startswith(prefixes):
+                return None
             user = self.current_user(request)
             if isawaitable(user):
                 user = await user
+            if user is not None:
+                return None
+            return await self._reject(request, handle_no_auth)
 
-            if user is None:
-                if handle_no_auth:
-                    resp = handle_no_auth(request)
-                else:
-                    resp = self.handle_no_auth(request)
-            else:
-                if user_keyword is not None:
-                    if user_keyword in kwargs:
-                        raise RuntimeError(
-                            'override user keyword %r in route' % user_keyword)
-                    kwargs[user_keyword] = user
-                resp = route(request, *args, **kwargs)
+        # run after other request middleware, which may set up the session
+        target.middleware(guard, 'request', priority=-1)
+        return guard
+
+    def rate_limit(self, route=None, *, limiter=None, handle_limited=None):
+        """Decorator to limit login attempts by client IP and username.
+
+        Every request other than :code:`GET` and :code:`HEAD` counts as an
+        attempt, by client IP first, and then by the username in the form
+        field named by :code:`AUTH_RATE_LIMIT_FIELD`, so floods are rejected
+        before the form is parsed or any password is checked.  Requests over
+        the limit are handled by :meth:`handle_rate_limited`, after calling
+        :meth:`on_lockout`.
+
+        :param route:
+            the login route handler to be protected
+        :param limiter:
+            keyword only argument, the limiter to count attempts with,
+            :code:`AUTH_RATE_LIMITER` by default.
+        :param handle_limited:
+            keyword only arugment, if it is not :code:`None`, and set to a
+            function this will be used to handle a request over the limit.
+        """
+        if route is None:
+            return partial(self.rate_limit, limiter=limiter,
+                           handle_limited=handle_limited)
+        if handle_limited is not None:
+            assert callable(handle_limited), 'handle_limited must be callable'
 
+        @wraps(route)
+        async def limited(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                key = await self._over_limit(request, limiter)
+                if key is not None:
+                    if self.metrics is not None:
+                        self.metrics.incr('rate_limited')
+                    hooked = self.on_lockout(request, key)
+                    if isawaitable(hooked):
+                        await hooked
+                    resp = (handle_limited or self.handle_rate_limited)(
+                        request)
+                    if isawaitable(resp):
+                        resp = await resp
+                    return resp
+            resp = route(request, *args, **kwargs)
             if isawaitable(resp):
                 resp = await resp
             return resp
 
-        return privileged
+        return limited
+
+    async def _over_limit(self, request, limiter):
+        # return the first key over the limit, or None
+        limiter = limiter or self.rate_limiter
+        if limiter is None:
+            raise RuntimeError('AUTH_RATE_LIMITER is not configured')
+        key = 'ip:%s' % (request.remote_addr or request.ip)
+        allowed = limiter.hit(key)
+        if isawaitable(allowed):
+            allowed = await allowed
+        if not allowed:
+            return key
+        username = request.form.get(self.rate_limit_field)
+        if username:
+            key = 'user:%s' % username
+            allowed = limiter.hit(key)
+            if isawaitable(allowed):
+                allowed = await allowed
+            if not allowed:
+                return key
+        return None
+
+    async def _close_rate_limiter(self, app, loop=None):
+        await self.rate_limiter.close()
+
+    async def hash_password(self, password):
+        """Hash password in the pool of :code:`AUTH_PASSWORD_HASHER`.
+
+        Return the encoded hash to be stored along with the user.  The event
+        loop keeps serving other requests meanwhile.
+        """
+        return await self.password_hasher.hash(password)
+
+    async def verify_password(self, password, hashed, *, rehash=None):
+        """Check password against a hash made by :meth:`hash_password`.
+
+        :param rehash:
+            keyword only argument, if it is not :code:`None`, and the
+            password is valid but the hash is made with outdated algorithm
+            or parameters, it is called with a new hash of the password to
+            store it, the call may return an awaitable.
+        """
+        hasher = self.password_hasher
+        valid = await hasher.verify(password, hashed)
+        if valid and rehash is not None and hasher.needs_rehash(hashed):
+            updated = rehash(await hasher.hash(password))
+            if isawaitable(updated):
+                await updated
+        return valid
+
+    def _close_password_hasher(self, app, loop=None):
+        self.password_hasher.close()
+
+    def _protect(self, route, check, user_keyword, handle_no_auth,
+                 handle_forbidden):
+        if handle_no_auth is not None:
+            assert callable(handle_no_auth), 'handle_no_auth must be callable'
+        if handle_forbidden is not None:
+            assert callable(handle_forbidden), \
+                'handle_forbidden must be callable'
+        # specialized upon decoration, so that each call does the minimum,
+        # the user can still be awaitable or not, depending on the session
+        # and user cache of each request
+        current_user = self.current_user
+        reject = self._reject
+
+        if not iscoroutinefunction(route):
+            # sync routes, or ones returning awaitables, are rare enough to
+            # share one wrapper checking the response upon each call
+            async def privileged(request, *args, **kwargs):
+                user = current_user(request)
+                if isawaitable(user):
+                    user = await user
+                if user is None:
+                    return await reject(request, handle_no_auth)
+                if check is not None and not await check(request, user):
+                    return await self._forbid(request, handle_forbidden)
+                if user_keyword is not None:
+                    kwargs[user_keyword] = user
+                resp = route(request, *args, **kwargs)
+                if isawaitable(resp):
+                    resp = await resp
+                return resp
+        elif check is not None:
+            async def privileged(request, *args, **kwargs):
+                user = current_user(request)
+                if isawaitable(user):
+                    user = await user
+                if user is None:
+                    return await reject(request, handle_no_auth)
+                if not await check(request, user):
+                    return await self._forbid(request, handle_forbidden)
+                if user_keyword is not None:
+                    kwargs[user_keyword] = user
+                return await route(request, *args, **kwargs)
+        elif user_keyword is not None:
+            async def privileged(request, *args, **kwargs):
+                user = current_user(request)
+                if isawaitable(user):
+                    user = await user
+                if user is None:
+                    return await reject(request, handle_no_auth)
+                kwargs[user_keyword] = user
+                return await route(request, *args, **kwargs)
+        else:
+            async def privileged(request, *args, **kwargs):
+                user = current_user(request)
+                if isawaitable(user):
+                    user = await user
+                if user is None:
+                    return await reject(request, handle_no_auth)
+                return await route(request, *args, **kwargs)
+
+        privileged = wraps(route)(privileged)
+        privileged.auth_authenticate = (
+            self, self._authenticator(check, handle_no_auth, handle_forbidden))
+        return self._injecting(privileged, route, user_keyword)
+
+    def _authenticator(self, check, handle_no_auth, handle_forbidden):
+        current_user = self.current_user
+        reject = self._reject
+
+        async def authenticate(request):
+            # the same checks, used by AUTH_REJECT_EARLY
+            user = current_user(request)
+            if isawaitable(user):
+                user = await user
+            if user is None:
+                return await reject(request, handle_no_auth)
+            if check is not None and not await check(request, user):
+                return await self._forbid(request, handle_forbidden)
+            return None
+
+        return authenticate
+
+    def websocket_login_required(self, route=None, *, user_keyword=None,
+                                 handle_no_auth=None):
+        """Decorator to make websocket routes only accessible with
+        authenticated user.
+
+        The user is authenticated once, upon handshake, and kept for the
+        whole connection.  Connections of anonymous visitors are closed
+        with code 1008, or with :code:`AUTH_REJECT_EARLY`, rejected by
+        :code:`handle_no_auth` before the handshake.
+
+        While the handler runs, the connection is tracked in
+        :attr:`connections` by user id, and it is closed when the user logs
+        out by :meth:`logout_user`, or is revoked by :meth:`revoke_user`.
+        Tokens of all connections are checked every
+        :code:`AUTH_WS_CHECK_INTERVAL` seconds, connections with
+        tokens expired, or revoked in other workers, are closed as well.
+
+        :param route:
+            the websocket handler to be protected
+        :param user_keyword:
+            keyword only arugment, the name of argument to inject the user
+            as, like :meth:`login_required`.
+        :param handle_no_auth:
+            keyword only arugment, the function to reject requests with
+            before the handshake, used with :code:`AUTH_REJECT_EARLY`.
+        """
+        if route is None:
+            return partial(self.websocket_login_required,
+                           user_keyword=user_keyword,
+                           handle_no_auth=handle_no_auth)
+        if handle_no_auth is not None:
+            assert callable(handle_no_auth), 'handle_no_auth must be callable'
+        call = _coroutine_function(route)
+        connections = self.connections
+
+        async def connected(request, ws, *args, **kwargs):
+            # the response has gone with the handshake, nothing to renew
+            setattr(request.ctx, self.renew_ctx_name, True)
+            user = self.current_user(request)
+            if isawaitable(user):
+                user = await user
+            token = None if user is None else self.get_token(request)
+            if isawaitable(token):
+                token = await token
+            if token is None:
+                if self.metrics is not None:
+                    self.metrics.incr('rejected')
+                await ws.close(1008, 'unauthorized')
+                return None
+            uid = self.token_uid(token)
+            connections.add(uid, ws, request)
+            if self._sweeper is None:
+                self._sweeper = ensure_future(self._sweep_connections())
+            try:
+                if user_keyword is not None:
+                    kwargs[user_keyword] = user
+                return await call(request, ws, *args, **kwargs)
+            finally:
+                connections.discard(uid, ws)
+                if not len(connections) and self._sweeper is not None:
+                    self._sweeper.cancel()
+                    self._sweeper = None
+
+        connected = wraps(route)(connected)
+        connected.auth_authenticate = (
+            self, self._authenticator(None, handle_no_auth, None))
+        return self._injecting(connected, route, user_keyword)
+
+    async def _sweep_connections(self):
+        # close connections with tokens expired or revoked since handshake
+        while True:
+            await sleep(self.websocket_check_interval)
+            for uid, ws, request in self.connections.items():
+                try:
+                    token = self.get_token(request)
+                    if isawaitable(token):
+                        token = await token
+                except Exception:
+                    # e.g. the revocation store is down, one connection
+                    # must not stop checks of others, count and go on
+                    if self.metrics is not None:
+                        self.metrics.incr('websocket_check_failed')
+                    continue
+                if token is None:
+                    self.connections.discard(uid, ws)
+                    ensure_future(ws.close(1008, 'expired'))
+
+    def _disconnect(self, uid, reason):
+        if uid in self.connections:
+            ensure_future(self.connections.close(uid, 1008, reason))
+
+    async def _authenticate_early(self, request, handler=None, **context):
+        # run upon routing, before request body is read, or before the
+        # handshake of websocket
+        authenticate = getattr(_route_handler(handler), 'auth_authenticate',
+                               None)
+        if authenticate is None or authenticate[0] is not self:
+            return
+        if self.signer is None and \
+                getattr(request.ctx, self.session_name, None) is None:
+            if self.session_interface is None:
+                # session is set up by request middleware, too late
+                return
+            self.session_interface.open_session(request)
+        resp = await authenticate[1](request)
+        if resp is None:
+            return
+        stream = getattr(request, 'stream', None)
+        if getattr(stream, 'request_max_size', None) is not None:
+            # drop the connection rather than reading the unwanted body
+            stream.request_max_size = 0
+        raise _Rejected(resp)
+
+    def _rejected(self, request, exception):
+        return exception.response
+
+    def _injecting(self, wrapper, route, user_keyword):
+        # check the route takes the argument, the routes taking arguments of
+        # the same name from url are rejected when server starts
+        if user_keyword is not None:
+            try:
+                params = signature(route).parameters
+            except (TypeError, ValueError):
+                params = None
+            if params is not None:
+                assert user_keyword in params or any(
+                    p.kind is Parameter.VAR_KEYWORD for p in params.values()
+                ), 'route takes no argument named %r' % user_keyword
+            wrapper.auth_user_keyword = user_keyword
+        return wrapper
+
+    def _check_user_keywords(self, app, loop=None):
+        for route in app.router.routes:
+            keyword = getattr(_route_handler(route.handler),
+                              'auth_user_keyword', None)
+            if keyword is None:
+                continue
+            params = getattr(route, 'params', {}).values()
+            if any(param.name == keyword for param in params):
+                raise RuntimeError('override user keyword %r in route %r' % (
+                    keyword, route.path))
+
+    async def _forbid(self, request, handle_forbidden):
+        if self.metrics is not None:
+            self.metrics.incr('forbidden')
+        resp = (handle_forbidden or self.handle_forbidden)(request)
+        if isawaitable(resp):
+            resp = await resp
+        return resp
+
+    async def _reject(self, request, handle_no_auth):
+        handle_no_auth = handle_no_auth or self.handle_no_auth
+        if self.metrics is None:
+            resp = handle_no_auth(request)
+        else:
+            self.metrics.incr('rejected')
+            resp = self._timed(request, 'handle_no_auth', handle_no_auth,
+                               request)
+        if self.audit is not None:
+            blocked = self._audit(request, 'no_auth')
+            if blocked is not None:
+                await blocked
+        if isawaitable(resp):
+            resp = await resp
+        return resp
+
+    def _audit(self, request, event, token=None):
+        # queue an audit event, return an awaitable only if the queue is
+        # full and the policy is to block
+        return self.audit.emit({
+            'time': time(), 'event': event, 'realm': self.realm,
+            'uid': None if token is None else self.token_uid(token),
+            'ip': request.ip, 'path': request.path,
+        })
+
+    def _audit_soon(self, request, event, token=None):
+        blocked = self._audit(request, event, token)
+        if blocked is not None:
+            # the caller does not return an awaitable, wait in background
+            ensure_future(blocked)
+
+    async def _open_audit(self, app, loop=None):
+        await self.audit.open()
+
+    async def _close_audit(self, app, loop=None):
+        await self.audit.close()
+
+    def _requirement(self, kind, required, any_of):
+        required = frozenset(required)
+        any_of = frozenset(any_of)
+        assert required or any_of, 'no %s required' % kind
+
+        async def check(request, user):
+            granted = await self._granted(request, user, kind)
+            return required <= granted and (
+                not any_of or not any_of.isdisjoint(granted))
+        return check
+
+    async def _granted(self, request, user, kind):
+        name = '%s_%s' % (self.user_ctx_name, kind)
+        granted = getattr(request.ctx, name, None)
+        if granted is None:
+            if kind == 'roles':
+                granted = self.load_roles(user)
+            else:
+                granted = self.load_permissions(user)
+            if isawaitable(granted):
+                granted = await granted
+            granted = frozenset(granted or ())
+            setattr(request.ctx, name, granted)
+        return granted
 
     def serialize(self, user):
-        """Serialize the user, returns a token to be placed into session"""
-        return {'uid': user.id, 'name': user.name}
+        """Serialize the user, returns a token to be placed into session.
+
+        The token is a compact tuple of :code:`(id, name, roles, tenant)`, a
+        :class:`User` is such a tuple already, so it is used as is, for any
+        other user object, :code:`(user.id, user.name)` is returned.
+        """
+        if type(user) is User:
+            return user
+        return (user.id, user.name)
+
+    def serializer(self, user_serializer=None, *, inline=True):
+        """Decorator to set a custom user serializer.
 
-    def serializer(self, user_serializer):
-        """Decorator to set a custom user serializer"""
-        self.serialize = user_serializer
+        A sync serializer is called inline by default, unless
+        :code:`inline` is :code:`False`, then it runs in the pool of
+        :code:`AUTH_LOADER_EXECUTOR`, and :meth:`login_user` returns an
+        awaitable, like with an async serializer, which must be awaited.
+        """
+        if user_serializer is None:
+            return partial(self.serializer, inline=inline)
+        self._set_loader('serialize', user_serializer, inline)
         return user_serializer
 
+    def _set_loader(self, name, func, inline, **options):
+        # run sync func in the pool, unless told otherwise, or no pool, the
+        # raw one is kept for setup, in case the pool is not configured yet
+        self._loaders[name] = (func, inline, options)
+        offloader = getattr(self, 'offloader', None)
+        if not (inline or offloader is None or iscoroutinefunction(func)):
+            func = offloader.wrap(func)
+        if name == 'batch_loader':
+            func = BatchLoader(func, **options)
+        setattr(self, name, func)
+
+    def _close_offloader(self, app, loop=None):
+        self.offloader.close()
+
     def load_user(self, token):
         """Load user with token.
 
@@ -130,24 +1322,248 @@ class Auth:
 
         Override this with routine that loads user from database if needed.
         """
-        if token is not None:
+        if token is None:
+            return None
+        if type(token) is User:
+            return token
+        if isinstance(token, dict):
+            # token made by Sanic-Auth 0.3 and earlier
             return User(id=token['uid'], name=token['name'])
+        # e.g. a list decoded from JSON
+        if len(token) > 2:
+            return User(token[0], token[1], tuple(token[2]), *token[3:])
+        return User(*token)
+
+    def user_loader(self, load_user=None, *, inline=False):
+        """Decorator to set a custom user loader that loads user with token.
 
-    def user_loader(self, load_user):
-        """Decorator to set a custom user loader that loads user with token"""
-        self.load_user = load_user
+        If :code:`AUTH_LOADER_EXECUTOR` is configured, a sync loader runs in
+        its pool, so that blocking data access does not stall the event
+        loop, unless :code:`inline` is :code:`True`, e.g. for cheap loaders.
+        The same applies to all other loader decorators.
+        """
+        if load_user is None:
+            return partial(self.user_loader, inline=inline)
+        self._set_loader('load_user', load_user, inline)
         return load_user
 
+    def batch_user_loader(self, load_users=None, *, inline=False,
+                          max_batch_size=0):
+        """Decorator to set a custom user loader that loads users in batch.
+
+        The loader takes a list of tokens and returns a list of users in the
+        same order, with :code:`None` for missing users.  Once set, all user
+        loading, including :meth:`current_user` calls from concurrent
+        requests arriving in the same event loop iteration, is coalesced into
+        batches, of at most :code:`max_batch_size` tokens, if it is not
+        :code:`0`.
+        """
+        if load_users is None:
+            return partial(self.batch_user_loader, inline=inline,
+                           max_batch_size=max_batch_size)
+        self._set_loader('batch_loader', load_users, inline,
+                         max_batch_size=max_batch_size)
+        return load_users
+
+    async def load_users(self, tokens):
+        """Load users with a list of tokens.
+
+        Return a list of users in the same order, with :code:`None` for
+        missing users.  With a batch user loader, this takes one call to the
+        backend, otherwise :meth:`load_user` is called for each token.
+        """
+        users = [self._load(token) for token in tokens]
+        for i, user in enumerate(users):
+            if isawaitable(user):
+                users[i] = await user
+        return users
+
+    def token_uid(self, token):
+        """Get the user id out of a token.
+
+        Used to index cached users for :meth:`invalidate_user`, the default
+        implementation understands tokens made by the default
+        :meth:`serialize`, and treats any other token as the user id itself.
+        """
+        if isinstance(token, (tuple, list)):
+            return token[0]
+        if isinstance(token, dict):
+            return token.get('uid')
+        return token
+
+    def invalidate_user(self, uid):
+        """Drop user with id :code:`uid` from the user cache, if enabled.
+
+        Call this after the user is modified or deleted in the data store.
+        """
+        if self.user_cache is not None:
+            self.user_cache.invalidate(uid, self.realm)
+
+    def revoke_user(self, uid):
+        """Revoke all tokens of user with id :code:`uid`, in all workers.
+
+        The generation of the user is bumped in :code:`AUTH_REVOCATION`, so
+        tokens issued before are rejected from now on, e.g. to log the user
+        out everywhere.  Return the new generation, or an awaitable of it if
+        the store is asynchronous, e.g. :class:`RedisGenerations`.
+
+        Websocket connections of the user are closed right away in this
+        worker, and upon the next check in others.
+        """
+        if self.generations is None:
+            raise RuntimeError('AUTH_REVOCATION is not configured')
+        self.invalidate_user(uid)
+        self._disconnect(uid, 'revoked')
+        return self.generations.bump(uid)
+
+    async def _open_api_keys(self, app, loop=None):
+        await self.api_keys.open()
+
+    async def _open_generations(self, app, loop=None):
+        await self.generations.open()
+
+    async def _close_generations(self, app, loop=None):
+        await self.generations.close()
+
+    def load_roles(self, user):
+        """Load roles of the user, used by :meth:`roles_required`.
+
+        The default implementation returns :code:`user.roles`, or nothing if
+        the user object does not have that attribute.
+        """
+        return getattr(user, 'roles', ())
+
+    def roles_loader(self, load_roles=None, *, inline=False):
+        """Decorator to set a custom loader that loads roles of a user"""
+        if load_roles is None:
+            return partial(self.roles_loader, inline=inline)
+        self._set_loader('load_roles', load_roles, inline)
+        return load_roles
+
+    def load_permissions(self, user):
+        """Load permissions of the user, used by :meth:`permission_required`.
+
+        The default implementation returns :code:`user.permissions`, or
+        nothing if the user object does not have that attribute.
+        """
+        return getattr(user, 'permissions', ())
+
+    def permissions_loader(self, load_permissions=None, *, inline=False):
+        """Decorator to set a custom loader that loads permissions of a user"""
+        if load_permissions is None:
+            return partial(self.permissions_loader, inline=inline)
+        self._set_loader('load_permissions', load_permissions, inline)
+        return load_permissions
+
     def get_session(self, request):
-        """Get the session object associated with current request"""
-        return request.ctx.session
+        """Get the session object associated with current request.
+
+        It can be a dict-like object, or a lazily loaded one, such as
+        :class:`LazySession`, which is only loaded when the user token is
+        needed.
+        """
+        return getattr(request.ctx, self.session_name)
+
+    def login_url_for(self, request, endpoint=None):
+        """Get the url of login view to redirect unauthorized user to.
+
+        The url is built from :code:`endpoint`, or :code:`AUTH_LOGIN_ENDPOINT`
+        by default, unless :code:`AUTH_LOGIN_URL` is set.  Built urls are
+        cached, per host if :code:`AUTH_LOGIN_EXTERNAL` is set, the default
+        one is resolved when server starts.  If :code:`AUTH_LOGIN_NEXT_ARG` is
+        set, the path of current request is appended as query argument.
+
+        Absolute urls are built for the host of request only if it is one of
+        :code:`AUTH_LOGIN_HOSTS`, as the :code:`Host` header is up to the
+        client, otherwise for :code:`SERVER_NAME`, or a relative url is used
+        if that is not set either.
+        """
+        url = self.login_url
+        if url is None or endpoint is not None:
+            endpoint = endpoint or self.login_endpoint
+            if self.login_external:
+                key = (endpoint, request.scheme, self._login_host(request))
+            else:
+                key = endpoint
+            url = self._login_urls.get(key)
+            if url is None:
+                url = self._build_login_url(request.app, key)
+                if len(self._login_urls) < _MAX_LOGIN_URLS:
+                    self._login_urls[key] = url
+        if self.login_next_arg is not None:
+            target = request.path
+            if request.query_string:
+                target += '?' + request.query_string
+            url = '%s%s%s=%s' % (url, '&' if '?' in url else '?',
+                                 self.login_next_arg, quote(target, safe='/'))
+        return url
+
+    def _login_host(self, request):
+        # the host of request if configured, None for any other
+        host = request.host.lower()
+        hosts = self.login_hosts
+        if host in hosts or (':' in host and not host.endswith(']') and
+                             host.rpartition(':')[0] in hosts):
+            return host
+        return None
+
+    def _build_login_url(self, app, key):
+        if isinstance(key, tuple):
+            endpoint, scheme, host = key
+            if host is not None:
+                return app.url_for(endpoint, _external=True, _scheme=scheme,
+                                   _server=host)
+            if app.config.get('SERVER_NAME'):
+                return app.url_for(endpoint, _external=True)
+            return app.url_for(endpoint)
+        return app.url_for(key)
+
+    def _resolve_login_url(self, app, loop=None):
+        if self.login_url is not None or self.login_external:
+            return
+        try:
+            self._login_urls[self.login_endpoint] = self._build_login_url(
+                app, self.login_endpoint)
+        except URLBuildError:
+            # no such endpoint (yet), leave it to the first request
+            pass
 
     def handle_no_auth(self, request):
         """Handle unauthorized user"""
-        u = self.login_url or request.app.url_for(self.login_endpoint)
-        return response.redirect(u)
+        return response.redirect(self.login_url_for(request))
 
     def no_auth_handler(self, handle_no_auth):
         """Decorator to handle an unauthorized request"""
         self.handle_no_auth = handle_no_auth
         return handle_no_auth
+
+    def handle_forbidden(self, request):
+        """Handle authenticated user without required permissions or roles"""
+        return response.text('Forbidden', status=403)
+
+    def forbidden_handler(self, handle_forbidden):
+        """Decorator to handle a request lacking permissions or roles"""
+        self.handle_forbidden = handle_forbidden
+        return handle_forbidden
+
+    def handle_rate_limited(self, request):
+        """Handle a login attempt over the rate limit"""
+        return response.text('Too Many Requests', status=429)
+
+    def rate_limited_handler(self, handle_rate_limited):
+        """Decorator to handle a login attempt over the rate limit"""
+        self.handle_rate_limited = handle_rate_limited
+        return handle_rate_limited
+
+    def on_lockout(self, request, key):
+        """Called when an attempt is rejected by :meth:`rate_limit`.
+
+        :code:`key` is either :code:`"ip:<address>"` or
+        :code:`"user:<username>"`, the default implementation does nothing,
+        override it to log or alert, e.g. about attacks on an account.
+        """
+
+    def lockout_handler(self, on_lockout):
+        """Decorator to set a hook called upon rejected login attempts"""
+        self.on_lockout = on_lockout
+        return on_lockout
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""API keys for machine-to-machine authentication."""
+import hashlib
+import hmac
+from collections import OrderedDict
+from inspect import isawaitable
+from secrets import token_hex, token_urlsafe
+
+__all__ = ['APIKeyStore']
+
+
+def _split(key):
+    prefix, sep, secret = key.partition('.')
+    if not sep or not prefix or not secret:
+        return None, None
+    return prefix, secret
+
+
+def _digest(secret):
+    return hashlib.sha256(secret.encode('utf-8')).hexdigest()
+
+
+class APIKeyStore:
+    """Hashed API keys, indexed by their non-secret prefix.
+
+    A key looks like :code:`"<prefix>.<secret>"`, only the prefix and the
+    SHA-256 digest of the secret are stored, each mapped to a user token,
+    which is loaded with :meth:`Auth.load_user` like any other token.
+    Looking up a key takes one dict access by prefix and a constant-time
+    comparison of digests, recently verified keys are kept in a LRU cache so
+    that they are not hashed again.
+
+    :param fetch:
+        function returning an iterable of :code:`(prefix, digest, token)`,
+        or an awaitable of it, to load all keys when server starts and upon
+        :meth:`reload`, e.g. from a database.
+    :param cache_size: maximum number of verified keys cached
+    """
+    def __init__(self, fetch=None, cache_size=1024):
+        self.fetch = fetch
+        self.cache_size = cache_size
+        self._index = {}
+        self._verified = OrderedDict()
+
+    def __len__(self):
+        return len(self._index)
+
+    def __contains__(self, prefix):
+        return prefix in self._index
+
+    @staticmethod
+    def hash_key(key):
+        """Return :code:`(prefix, digest)` of a key, to be stored"""
+        prefix, secret = _split(key)
+        if prefix is None:
+            raise ValueError('malformed API key')
+        return prefix, _digest(secret)
+
+    def generate_key(self, token):
+        """Make a new key for user token, add it and return the key.
+
+        The key is only returned here, store its :meth:`hash_key` for
+        loading it later.
+        """
+        prefix = token_hex(4)
+        while prefix in self._index:
+            prefix = token_hex(4)
+        key = '%s.%s' % (prefix, token_urlsafe(32))
+        self.add(key, token)
+        return key
+
+    def add(self, key, token):
+        """Add a key for user token"""
+        prefix, digest = self.hash_key(key)
+        self._index[prefix] = (digest, token)
+
+    def remove(self, prefix):
+        """Revoke the key with :code:`prefix`"""
+        self._index.pop(prefix, None)
+
+    def load(self, records):
+        """Replace all keys with :code:`(prefix, digest, token)` records.
+
+        The new index is built aside and swapped in at once, so requests
+        being served never see a partially loaded store.
+        """
+        self._index = {prefix: (digest, token)
+                       for prefix, digest, token in records}
+        self._verified = OrderedDict()
+
+    async def reload(self):
+        """Load all keys again with :code:`fetch`"""
+        records = self.fetch()
+        if isawaitable(records):
+            records = await records
+        self.load(records)
+
+    def verify(self, key):
+        """Return user token of a valid key, :code:`None` otherwise"""
+        prefix, secret = _split(key)
+        entry = self._index.get(prefix)
+        if entry is None:
+            return None
+        verified = self._verified
+        if verified.get(key) is entry:
+            verified.move_to_end(key)
+            return entry[1]
+        if not hmac.compare_digest(_digest(secret), entry[0]):
+            return None
+        if self.cache_size:
+            verified[key] = entry
+            if len(verified) > self.cache_size:
+                verified.popitem(last=False)
+        return entry[1]
+
+    async def open(self):
+        """Called when server starts"""
+        if self.fetch is not None:
+            await self.reload()
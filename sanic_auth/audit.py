@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+"""Audit events, written in batches off the request path.
+
+A sink is any object with these methods:
+
+- :code:`write(events)`, write a list of events, dicts of JSON-compatible
+  values.  If it is a coroutine function, it is awaited in the event loop,
+  otherwise it is called in a dedicated thread
+- :code:`close()`, optional, called in the same way once all events are
+  written
+"""
+import asyncio
+import json
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from inspect import iscoroutinefunction
+from random import random
+
+__all__ = ['AuditLog', 'CallableSink', 'JSONLinesSink', 'SQLiteSink']
+
+
+class JSONLinesSink:
+    """Append events to a file, one JSON object per line"""
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def write(self, events):
+        if self._file is None:
+            self._file = open(self.path, 'a', encoding='utf-8')
+        self._file.writelines(
+            json.dumps(event, default=str) + '\n' for event in events)
+        self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class SQLiteSink:
+    """Insert events into a SQLite table, one transaction per batch.
+
+    :param path: path of database file
+    :param table: name of table, created if it does not exist, with columns
+        :code:`time`, :code:`event` and :code:`data`, the whole event as
+        JSON
+    """
+    def __init__(self, path, table='auth_audit'):
+        self.path = path
+        self.table = table
+        self._db = None
+
+    def write(self, events):
+        db = self._db
+        if db is None:
+            db = self._db = sqlite3.connect(self.path)
+            db.execute('CREATE TABLE IF NOT EXISTS %s (time REAL, event TEXT, '
+                       'data TEXT)' % self.table)
+        with db:
+            db.executemany(
+                'INSERT INTO %s VALUES (?, ?, ?)' % self.table,
+                [(event.get('time'), event.get('event'),
+                  json.dumps(event, default=str)) for event in events])
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+
+class CallableSink:
+    """Pass each batch of events to a function, sync or async"""
+    def __init__(self, func):
+        assert callable(func), 'func must be callable'
+        self.func = func
+        if iscoroutinefunction(func):
+            self.write = self._write_async
+
+    def write(self, events):
+        self.func(events)
+
+    async def _write_async(self, events):
+        await self.func(events)
+
+
+class AuditLog:
+    """Bounded queue of audit events, drained in batches to a sink.
+
+    :meth:`emit` never waits for the sink, events are written by a
+    background task while server is running, at most :code:`batch_size` at
+    a time, and the rest are flushed when server stops.
+
+    When the queue is full, what happens depends on :code:`policy`:
+
+    - :code:`"drop"`, new events are dropped
+    - :code:`"sample"`, once the queue is half full, only a
+      :code:`sample_rate` fraction of new events are kept, the rest are
+      dropped, so the busiest periods are still represented
+    - :code:`"block"`, no event is dropped, :meth:`emit` returns an
+      awaitable resolved once the event is queued, for the caller to wait on
+
+    :param sink: a sink, or a function taking a list of events
+    :param maxsize: maximum number of queued events
+    :param batch_size: maximum number of events written at once
+    """
+    POLICIES = ('drop', 'sample', 'block')
+
+    def __init__(self, sink, maxsize=10000, batch_size=100, policy='drop',
+                 sample_rate=0.1):
+        if policy not in self.POLICIES:
+            raise ValueError('unknown policy %r' % policy)
+        assert maxsize > 0 and batch_size > 0, \
+            'maxsize and batch_size must be positive'
+        if not hasattr(sink, 'write'):
+            sink = CallableSink(sink)
+        self.sink = sink
+        self.maxsize = maxsize
+        self.batch_size = batch_size
+        self.policy = policy
+        self.sample_rate = sample_rate
+        #: number of events queued
+        self.emitted = 0
+        #: number of events dropped by the policy
+        self.dropped = 0
+        #: number of events written
+        self.written = 0
+        #: number of events lost to errors of sink
+        self.failed = 0
+        self._queue = None
+        self._drainer = None
+        self._writing = None
+        self._executor = None
+
+    def __len__(self):
+        return 0 if self._queue is None else self._queue.qsize()
+
+    def _get_queue(self):
+        if self._queue is None:
+            self._queue = asyncio.Queue(self.maxsize)
+        return self._queue
+
+    def emit(self, event):
+        """Queue an event, a dict, without waiting for it to be written"""
+        queue = self._get_queue()
+        if self.policy == 'sample' and \
+                queue.qsize() * 2 >= self.maxsize and \
+                random() >= self.sample_rate:
+            self.dropped += 1
+            return None
+        try:
+            queue.put_nowait(event)
+        except asyncio.QueueFull:
+            if self.policy == 'block':
+                return self._put(event)
+            self.dropped += 1
+            return None
+        self.emitted += 1
+        return None
+
+    async def _put(self, event):
+        await self._queue.put(event)
+        self.emitted += 1
+
+    async def _write(self, events):
+        write = self.sink.write
+        try:
+            if iscoroutinefunction(write):
+                await write(events)
+            else:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        1, thread_name_prefix='sanic-auth-audit')
+                loop = asyncio.get_running_loop()
+                await loop.run_in_executor(self._executor, write, events)
+        except Exception:
+            # auditing must not take the server down, count and go on
+            self.failed += len(events)
+        else:
+            self.written += len(events)
+
+    def _take(self, events):
+        queue = self._queue
+        while len(events) < self.batch_size and not queue.empty():
+            events.append(queue.get_nowait())
+        return events
+
+    async def _drain(self):
+        queue = self._get_queue()
+        while True:
+            events = self._take([await queue.get()])
+            # shielded, so that stopping does not lose the batch
+            self._writing = asyncio.ensure_future(self._write(events))
+            await asyncio.shield(self._writing)
+            self._writing = None
+
+    async def flush(self):
+        """Write all queued events"""
+        queue = self._get_queue()
+        while not queue.empty():
+            await self._write(self._take([]))
+
+    async def open(self):
+        """Called when server starts"""
+        if self._drainer is None:
+            self._drainer = asyncio.ensure_future(self._drain())
+
+    async def close(self):
+        """Called when server stops, flush queued events and close sink"""
+        if self._drainer is not None:
+            self._drainer.cancel()
+            self._drainer = None
+        if self._writing is not None:
+            await self._writing
+            self._writing = None
+        await self.flush()
+        close = getattr(self.sink, 'close', None)
+        if close is not None:
+            if iscoroutinefunction(close):
+                await close()
+            elif self._executor is not None:
+                loop = asyncio.get_running_loop()
+                await loop.run_in_executor(self._executor, close)
+            else:
+                close()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        # the queue is bound to the loop of server
+        self._queue = None
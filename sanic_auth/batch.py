@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""Coalesce user loads into batches."""
+from asyncio import ensure_future, get_running_loop
+from functools import partial
+from inspect import isawaitable
+
+from .cache import make_key
+
+__all__ = ['BatchLoader']
+
+
+class BatchLoader:
+    """Collect loads issued in the same event loop iteration into one call.
+
+    :param batch_load:
+        function (or coroutine function) taking a list of tokens and returning
+        a list of users in the same order, :code:`None` for missing users.
+    :param max_batch_size:
+        maximum number of tokens passed to :code:`batch_load` at once,
+        :code:`0` means unlimited.
+    """
+    def __init__(self, batch_load, max_batch_size=0):
+        assert callable(batch_load), 'batch_load must be callable'
+        self.batch_load = batch_load
+        self.max_batch_size = max_batch_size
+        self._queue = {}
+
+    def load(self, token):
+        """Schedule token to be loaded, return a future of the user"""
+        key = make_key(token)
+        loop = get_running_loop()
+        # one future per caller, so that a cancelled caller does not cancel
+        # the load for the others
+        future = loop.create_future()
+        queued = self._queue.get(key)
+        if queued is not None:
+            queued[1].append(future)
+            return future
+        if not self._queue:
+            loop.call_soon(self._dispatch)
+        self._queue[key] = (token, [future])
+        return future
+
+    def _dispatch(self):
+        items = list(self._queue.values())
+        self._queue = {}
+        size = self.max_batch_size or len(items)
+        for i in range(0, len(items), size):
+            batch = items[i:i + size]
+            task = ensure_future(self._load_batch(batch))
+            task.add_done_callback(partial(self._cancel, batch))
+
+    @staticmethod
+    def _cancel(items, task):
+        # the batch is cancelled, maybe before it starts, so that callers do
+        # not wait forever
+        for _, futures in items:
+            for future in futures:
+                if not future.done():
+                    future.cancel()
+
+    async def _load_batch(self, items):
+        tokens = [token for token, _ in items]
+        try:
+            users = self.batch_load(tokens)
+            if isawaitable(users):
+                users = await users
+            users = list(users)
+            if len(users) != len(tokens):
+                raise ValueError(
+                    'batch loader returned %d users for %d tokens' % (
+                        len(users), len(tokens)))
+        except Exception as exc:
+            for _, futures in items:
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(exc)
+        else:
+            for (_, futures), user in zip(items, users):
+                for future in futures:
+                    if not future.done():
+                        future.set_result(user)
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""Bounded user cache shared across requests."""
+from asyncio import ensure_future, shield
+from collections import OrderedDict
+from functools import partial
+from inspect import isawaitable
+from time import monotonic
+
+__all__ = ['UserCache', 'make_key']
+
+
+def _freeze(value):
+    if isinstance(value, dict):
+        items = sorted((k, _freeze(v)) for k, v in value.items())
+        return (dict,) + tuple(items)
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+def make_key(token):
+    """Make a hashable key out of a user token.
+
+    Hashable tokens are used as is, containers are frozen into tuples, so
+    that the same token decoded by different session backends, e.g. a list
+    from JSON instead of a tuple, maps to the same key.
+    """
+    try:
+        hash(token)
+    except TypeError:
+        return _freeze(token)
+    return token
+
+
+class UserCache:
+    """LRU cache of loaded users with optional time-to-live.
+
+    Entries are keyed by user token, i.e. the result of
+    :meth:`Auth.serialize`, and indexed by user id for invalidation.
+    Concurrent loads of the same uncached token share one load, so an
+    asynchronous loader is called once no matter how many requests are
+    waiting for it, and cancelling one of them does not affect the others.
+
+    :param maxsize: maximum number of users kept in the cache
+    :param ttl: seconds before an entry expires, :code:`None` means never
+    """
+    def __init__(self, maxsize=1024, ttl=None):
+        assert maxsize > 0, 'maxsize must be positive'
+        self.maxsize = maxsize
+        self.ttl = ttl
+        #: number of lookups served from cache or from an in-flight load
+        self.hits = 0
+        #: number of lookups that called the loader
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._pending = {}
+        self._uids = {}
+        self._keys_by_uid = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def hit_ratio(self):
+        """Ratio of lookups served without calling the loader"""
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def get(self, token, load, uid=None, namespace=None):
+        """Get user by token, call :code:`load(token)` on cache miss.
+
+        Return the user, or an awaitable if the loader is asynchronous.
+        Missing users (:code:`None`) are not cached.  Users of different
+        :code:`namespace`, e.g. realms, are kept apart while sharing the
+        same :code:`maxsize`.
+        """
+        key = make_key(token)
+        if namespace is not None:
+            key = (namespace, key)
+            uid = (namespace, uid)
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires, user = entry
+            if expires is None or expires > monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return user
+            self._discard(key)
+
+        pending = self._pending.get(key)
+        if pending is not None:
+            self.hits += 1
+            # each caller gets its own shield, a cancelled caller does not
+            # cancel the load for the others
+            return shield(pending)
+
+        self.misses += 1
+        self._uids[key] = uid
+        self._keys_by_uid.setdefault(uid, set()).add(key)
+        try:
+            user = load(token)
+        except Exception:
+            # nothing is cached, nor to be indexed
+            self._discard(key)
+            raise
+        if isawaitable(user):
+            future = ensure_future(user)
+            self._pending[key] = future
+            future.add_done_callback(partial(self._loaded, key))
+            return shield(future)
+        self._store(key, user)
+        return user
+
+    def invalidate(self, uid, namespace=None):
+        """Drop all cached users with user id :code:`uid`"""
+        if namespace is not None:
+            uid = (namespace, uid)
+        for key in self._keys_by_uid.pop(uid, ()):
+            self._entries.pop(key, None)
+            self._pending.pop(key, None)
+            self._uids.pop(key, None)
+
+    def clear(self):
+        """Drop everything in the cache"""
+        self._entries.clear()
+        self._pending.clear()
+        self._uids.clear()
+        self._keys_by_uid.clear()
+
+    def _loaded(self, key, future):
+        if self._pending.get(key) is not future:
+            # invalidated while loading
+            return
+        del self._pending[key]
+        if future.cancelled() or future.exception() is not None:
+            self._discard(key)
+        else:
+            self._store(key, future.result())
+
+    def _store(self, key, user):
+        if user is None:
+            self._discard(key)
+            return
+        expires = None if self.ttl is None else monotonic() + self.ttl
+        entries = self._entries
+        entries[key] = (expires, user)
+        entries.move_to_end(key)
+        while len(entries) > self.maxsize:
+            self._discard(next(iter(entries)))
+
+    def _discard(self, key):
+        self._entries.pop(key, None)
+        if key in self._pending or key not in self._uids:
+            return
+        uid = self._uids.pop(key)
+        keys = self._keys_by_uid[uid]
+        keys.discard(key)
+        if not keys:
+            del self._keys_by_uid[uid]
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""Metrics sinks for instrumenting :class:`~sanic_auth.Auth`.
+
+A sink is any object with these methods:
+
+- :code:`observe(name, seconds)`, record a timing
+- :code:`incr(name, value=1)`, increase a counter
+- :code:`add_gauge(name, func)`, register a function returning a gauge value
+"""
+from bisect import bisect_left
+
+__all__ = [
+    'InMemoryMetrics', 'NamespacedMetrics', 'NullMetrics', 'PrometheusMetrics',
+]
+
+#: default histogram buckets, in seconds
+DEFAULT_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+    0.25, 0.5, 1.0, 2.5, float('inf'),
+)
+
+
+class NullMetrics:
+    """Sink discarding everything"""
+    def observe(self, name, seconds):
+        pass
+
+    def incr(self, name, value=1):
+        pass
+
+    def add_gauge(self, name, func):
+        pass
+
+
+class NamespacedMetrics:
+    """Sink prefixing all names with :code:`namespace`, before passing them
+    to another sink, so that one sink can be shared, e.g. by realms
+    """
+    def __init__(self, sink, namespace):
+        self.sink = sink
+        self.namespace = namespace
+
+    def observe(self, name, seconds):
+        self.sink.observe('%s_%s' % (self.namespace, name), seconds)
+
+    def incr(self, name, value=1):
+        self.sink.incr('%s_%s' % (self.namespace, name), value)
+
+    def add_gauge(self, name, func):
+        self.sink.add_gauge('%s_%s' % (self.namespace, name), func)
+
+
+class Histogram:
+    """Cumulative histogram of timings"""
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """Return list of :code:`(upper_bound, count)`"""
+        total = 0
+        result = []
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+
+class InMemoryMetrics:
+    """Sink aggregating timings into histograms, and counters, in memory.
+
+    :param buckets: sorted upper bounds of histogram buckets, in seconds
+    """
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        buckets = tuple(buckets)
+        if buckets[-1] != float('inf'):
+            buckets += (float('inf'),)
+        self.buckets = buckets
+        self.histograms = {}
+        self.counters = {}
+        self.gauges = {}
+
+    def observe(self, name, seconds):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram(self.buckets)
+        histogram.observe(seconds)
+
+    def incr(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def add_gauge(self, name, func):
+        self.gauges[name] = func
+
+    def snapshot(self):
+        """Return all metrics as a dict of plain data"""
+        return {
+            'timings': {
+                name: {'count': h.count, 'sum': h.sum,
+                       'buckets': h.cumulative()}
+                for name, h in self.histograms.items()
+            },
+            'counters': dict(self.counters),
+            'gauges': {name: func() for name, func in self.gauges.items()},
+        }
+
+
+def _format_bound(bound):
+    return '+Inf' if bound == float('inf') else repr(bound)
+
+
+class PrometheusMetrics(InMemoryMetrics):
+    """In-memory sink that renders metrics in Prometheus text format.
+
+    Serving the result of :meth:`render` is up to the application, e.g.
+    from a :code:`/metrics` route.
+
+    :param prefix: prefix of all metric names
+    """
+    def __init__(self, prefix='sanic_auth', buckets=DEFAULT_BUCKETS):
+        super().__init__(buckets)
+        self.prefix = prefix
+
+    def render(self):
+        """Return metrics in Prometheus text exposition format"""
+        lines = []
+        prefix = self.prefix
+        for name, histogram in sorted(self.histograms.items()):
+            metric = '%s_%s_seconds' % (prefix, name)
+            lines.append('# TYPE %s histogram' % metric)
+            for bound, count in histogram.cumulative():
+                lines.append('%s_bucket{le="%s"} %d' % (
+                    metric, _format_bound(bound), count))
+            lines.append('%s_sum %r' % (metric, histogram.sum))
+            lines.append('%s_count %d' % (metric, histogram.count))
+        for name, value in sorted(self.counters.items()):
+            metric = '%s_%s_total' % (prefix, name)
+            lines.append('# TYPE %s counter' % metric)
+            lines.append('%s %d' % (metric, value))
+        for name, func in sorted(self.gauges.items()):
+            metric = '%s_%s' % (prefix, name)
+            lines.append('# TYPE %s gauge' % metric)
+            lines.append('%s %r' % (metric, float(func())))
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""Running blocking functions off the event loop."""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial, wraps
+
+__all__ = ['Offloader']
+
+
+class Offloader:
+    """Run blocking functions, e.g. sync user loaders, in a thread pool.
+
+    At most :code:`max_workers` of them run at the same time, others wait
+    for their turn without occupying the pool.
+
+    :param executor: :code:`"thread"`, or a
+        :class:`concurrent.futures.Executor` to run functions in
+    :param max_workers: maximum number of concurrent calls
+    :param timeout: seconds to wait for a call before
+        :exc:`asyncio.TimeoutError` is raised, :code:`None` means forever.
+        The call itself keeps its worker until it returns.
+    """
+    def __init__(self, executor='thread', max_workers=4, timeout=None):
+        assert max_workers > 0, 'max_workers must be positive'
+        self.executor = executor
+        self.max_workers = max_workers
+        self.timeout = timeout
+        #: number of calls waiting for a worker
+        self.waiting = 0
+        #: number of calls running
+        self.running = 0
+        #: number of calls timed out
+        self.timeouts = 0
+        self._owned = None
+        self._semaphore = None
+
+    def _get_executor(self):
+        if not isinstance(self.executor, str):
+            return self.executor
+        if self._owned is None:
+            self._owned = ThreadPoolExecutor(
+                self.max_workers, thread_name_prefix='sanic-auth-loader')
+        return self._owned
+
+    def _done(self, semaphore, future):
+        self.running -= 1
+        semaphore.release()
+
+    async def run(self, func, *args):
+        """Call :code:`func(*args)` in the pool, return the result"""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_workers)
+        semaphore = self._semaphore
+        self.waiting += 1
+        try:
+            await semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.running += 1
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self._get_executor(), func, *args)
+        # released once the call returns, even if it timed out
+        future.add_done_callback(partial(self._done, semaphore))
+        try:
+            return await asyncio.wait_for(asyncio.shield(future),
+                                          self.timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise
+
+    def wrap(self, func):
+        """Return a coroutine function calling :code:`func` in the pool"""
+        @wraps(func)
+        async def offloaded(*args):
+            return await self.run(func, *args)
+        return offloaded
+
+    def close(self):
+        """Shut down the pool made by the offloader, if any"""
+        if self._owned is not None:
+            self._owned.shutdown(wait=False)
+            self._owned = None
+        self._semaphore = None
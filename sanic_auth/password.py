@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""Password hashing off the event loop."""
+import asyncio
+import hashlib
+import hmac
+import os
+from base64 import b64decode, b64encode
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+__all__ = ['PasswordHasher', 'PasswordQueueFull']
+
+
+class PasswordQueueFull(RuntimeError):
+    """Too many passwords waiting to be hashed"""
+
+
+def _b64encode(data):
+    return b64encode(data).decode('ascii').rstrip('=')
+
+
+def _b64decode(data):
+    return b64decode(data + '=' * (-len(data) % 4))
+
+
+def _derive(algorithm, params, password, salt):
+    password = password.encode('utf-8')
+    if algorithm == 'pbkdf2_sha256':
+        return hashlib.pbkdf2_hmac('sha256', password, salt, params[0])
+    if algorithm == 'scrypt':
+        n, r, p = params
+        return hashlib.scrypt(password, salt=salt, n=n, r=r, p=p,
+                              maxmem=128 * n * r * p + 1024 * 1024)
+    raise ValueError('unknown algorithm %r' % algorithm)
+
+
+def _parse(hashed):
+    algorithm, *params, salt, digest = hashed.split('$')
+    return algorithm, tuple(int(param) for param in params), salt, digest
+
+
+def hash_password(algorithm, params, password):
+    """Hash password in the calling thread, return the encoded hash"""
+    salt = os.urandom(16)
+    digest = _derive(algorithm, params, password, salt)
+    return '$'.join([algorithm] + [str(param) for param in params] +
+                    [_b64encode(salt), _b64encode(digest)])
+
+
+def verify_password(password, hashed):
+    """Verify password in the calling thread"""
+    try:
+        algorithm, params, salt, digest = _parse(hashed)
+        expected = _b64decode(digest)
+        actual = _derive(algorithm, params, password, _b64decode(salt))
+    except (TypeError, ValueError):
+        return False
+    return hmac.compare_digest(actual, expected)
+
+
+class PasswordHasher:
+    """Hash and verify passwords in a thread or process pool.
+
+    Hashes are encoded as :code:`<algorithm>$<params>$<salt>$<digest>`, so
+    the parameters used are kept along with each hash, and can be changed
+    at any time, see :meth:`needs_rehash`.
+
+    At most :code:`max_workers` passwords are hashed at the same time, at
+    most :code:`max_queue` more wait for their turn, beyond that
+    :exc:`PasswordQueueFull` is raised, so that a login storm is shed
+    instead of piling up.
+
+    :param algorithm: :code:`"pbkdf2_sha256"` or :code:`"scrypt"`
+    :param params: :code:`(iterations,)` for PBKDF2, or :code:`(n, r, p)`
+        for scrypt, sensible defaults if it is :code:`None`
+    :param executor: :code:`"thread"`, :code:`"process"`, or a
+        :class:`concurrent.futures.Executor` to run hashing in
+    :param max_workers: maximum number of concurrent hashings, default is
+        the number of CPUs
+    :param max_queue: maximum number of waiting hashings, :code:`None` means
+        no limit
+    """
+    DEFAULT_PARAMS = {
+        'pbkdf2_sha256': (600000,),
+        'scrypt': (2 ** 14, 8, 1),
+    }
+
+    def __init__(self, algorithm='pbkdf2_sha256', params=None,
+                 executor='thread', max_workers=None, max_queue=None):
+        if algorithm not in self.DEFAULT_PARAMS:
+            raise ValueError('unknown algorithm %r' % algorithm)
+        self.algorithm = algorithm
+        self.params = tuple(params or self.DEFAULT_PARAMS[algorithm])
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_queue = max_queue
+        self.executor = executor
+        self._owned = None
+        self._semaphore = None
+        self._waiting = 0
+
+    def _get_executor(self):
+        if not isinstance(self.executor, str):
+            return self.executor
+        if self._owned is None:
+            if self.executor == 'process':
+                self._owned = ProcessPoolExecutor(self.max_workers)
+            else:
+                self._owned = ThreadPoolExecutor(
+                    self.max_workers, thread_name_prefix='sanic-auth-hash')
+        return self._owned
+
+    async def _run(self, func, *args):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_workers)
+        semaphore = self._semaphore
+        if semaphore.locked():
+            if self.max_queue is not None and \
+                    self._waiting >= self.max_queue:
+                raise PasswordQueueFull('too many passwords to hash')
+        self._waiting += 1
+        try:
+            await semaphore.acquire()
+        finally:
+            self._waiting -= 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self._get_executor(), func, *args)
+        finally:
+            semaphore.release()
+
+    async def hash(self, password):
+        """Return the hash of password"""
+        return await self._run(
+            hash_password, self.algorithm, self.params, password)
+
+    async def verify(self, password, hashed):
+        """Check password against the hash"""
+        return await self._run(verify_password, password, hashed)
+
+    def needs_rehash(self, hashed):
+        """Whether the hash is made with other algorithm or parameters"""
+        try:
+            algorithm, params, _, _ = _parse(hashed)
+        except ValueError:
+            return True
+        return algorithm != self.algorithm or params != self.params
+
+    def close(self):
+        """Shut down the pool made by the hasher, if any"""
+        if self._owned is not None:
+            self._owned.shutdown(wait=False)
+            self._owned = None
+        self._semaphore = None
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""Rate limiters for login attempts.
+
+A limiter is any object with these methods:
+
+- :code:`hit(key)`, count an attempt, return whether it is allowed, or an
+  awaitable of it
+- :code:`reset(key)`, forget attempts, e.g. after a successful login, may
+  return an awaitable
+"""
+from collections import OrderedDict
+from time import monotonic, time
+
+from .resp import RedisPool
+
+__all__ = ['InMemoryRateLimiter', 'RedisRateLimiter']
+
+
+class InMemoryRateLimiter:
+    """Token bucket limiter in process memory.
+
+    Each key has a bucket of :code:`limit` attempts, refilled at
+    :code:`limit` per :code:`period` seconds.  At most :code:`maxsize` keys
+    are tracked, the least recently seen ones are evicted, updating a key
+    takes constant time.
+
+    Attempts are not shared between worker processes, use
+    :class:`RedisRateLimiter` for that.
+
+    :param limit: maximum number of attempts in a burst
+    :param period: seconds to refill all attempts
+    :param maxsize: maximum number of keys tracked
+    """
+    def __init__(self, limit=5, period=60, maxsize=10000):
+        assert limit > 0 and period > 0, 'limit and period must be positive'
+        self.limit = limit
+        self.period = period
+        self.rate = limit / period
+        self.maxsize = maxsize
+        self._buckets = OrderedDict()
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def hit(self, key):
+        now = monotonic()
+        buckets = self._buckets
+        bucket = buckets.get(key)
+        if bucket is None:
+            tokens = self.limit
+        else:
+            tokens, updated = bucket
+            tokens = min(self.limit, tokens + (now - updated) * self.rate)
+            buckets.move_to_end(key)
+        allowed = tokens >= 1
+        buckets[key] = (tokens - 1 if allowed else tokens, now)
+        if len(buckets) > self.maxsize:
+            buckets.popitem(last=False)
+        return allowed
+
+    def reset(self, key):
+        self._buckets.pop(key, None)
+
+
+class RedisRateLimiter:
+    """Sliding window limiter on a Redis-protocol server, shared by workers.
+
+    At most :code:`limit` attempts are allowed per :code:`period` seconds,
+    attempts in the previous window are weighted by how much it overlaps
+    the sliding window.  Counters expire on their own.
+
+    :param pool: a :class:`~sanic_auth.resp.RedisPool`, if it is
+        :code:`None`, one is made with the rest of keyword arguments.
+    :param prefix: prefix of keys of counters
+    """
+    def __init__(self, limit=5, period=60, pool=None, *, prefix='ratelimit:',
+                 **pool_options):
+        assert limit > 0 and period > 0, 'limit and period must be positive'
+        self.limit = limit
+        self.period = period
+        self.pool = RedisPool(**pool_options) if pool is None else pool
+        self.prefix = prefix
+
+    def _key(self, key, window):
+        return '%s%s:%d' % (self.prefix, key, window)
+
+    async def hit(self, key):
+        now = time()
+        window, elapsed = divmod(now, self.period)
+        window = int(window)
+        execute = self.pool.execute
+        current = self._key(key, window)
+        count = await execute('INCR', current)
+        if count == 1:
+            await execute('EXPIRE', current, int(self.period * 2))
+        previous = int(await execute('GET', self._key(key, window - 1)) or 0)
+        weight = 1 - elapsed / self.period
+        return previous * weight + count <= self.limit
+
+    async def reset(self, key):
+        window = int(time() // self.period)
+        await self.pool.execute('DEL', self._key(key, window),
+                                self._key(key, window - 1))
+
+    async def close(self):
+        await self.pool.close()
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""Selecting one of many :class:`~sanic_auth.Auth` realms per request."""
+from functools import partial, wraps
+
+from sanic.exceptions import NotFound
+
+__all__ = ['Realms']
+
+
+class Realms:
+    """Dispatch requests to :class:`~sanic_auth.Auth` realms.
+
+    A realm is selected by the host of request, or by the prefix of request
+    path, both are looked up in dispatch tables built as realms are added,
+    so selecting a realm does not depend on how many realms there are.
+    Requests matching no realm go to the :code:`default` one, or fail with
+    404 if there is none.
+
+    e.g.::
+
+        app.config.AUTH_REALMS = {
+            'acme': {'AUTH_REALM_HOSTS': ['acme.example.com']},
+            'globex': {'AUTH_REALM_PREFIXES': ['/globex']},
+        }
+        realms = Realms()
+        acme = realms.add(Auth(app, realm='acme'))
+        globex = realms.add(Auth(app, realm='globex'))
+
+        @app.route('/')
+        @realms.login_required(user_keyword='user')
+        async def index(request, user):
+            ...
+    """
+    def __init__(self, default=None):
+        self.default = default
+        self.realms = {}
+        self._hosts = {}
+        self._prefixes = {}
+
+    def add(self, auth, hosts=None, prefixes=None):
+        """Add a realm, selected by any of :code:`hosts` or path
+        :code:`prefixes`, by default :code:`AUTH_REALM_HOSTS` and
+        :code:`AUTH_REALM_PREFIXES` of the realm.  Return :code:`auth`.
+        """
+        self.realms[auth.realm] = auth
+        for host in auth.realm_hosts if hosts is None else hosts:
+            self._hosts[host.lower()] = auth
+        for prefix in auth.realm_prefixes if prefixes is None else prefixes:
+            prefix = '/' + prefix.strip('/')
+            # indexed by first path segment, longest prefix first
+            candidates = self._prefixes.setdefault(
+                prefix.split('/', 2)[1], [])
+            candidates.append((prefix, auth))
+            candidates.sort(key=lambda item: -len(item[0]))
+        return auth
+
+    def select(self, request):
+        """Return the realm of request, or :code:`None`"""
+        if self._hosts:
+            host = request.host.lower()
+            auth = self._hosts.get(host)
+            if auth is None and ':' in host and not host.endswith(']'):
+                auth = self._hosts.get(host.rpartition(':')[0])
+            if auth is not None:
+                return auth
+        if self._prefixes:
+            path = request.path
+            candidates = self._prefixes.get(path.split('/', 2)[1])
+            if candidates is not None:
+                for prefix, auth in candidates:
+                    if path == prefix or path.startswith(prefix + '/'):
+                        return auth
+        return self.default
+
+    def _select(self, request):
+        auth = self.select(request)
+        if auth is None:
+            raise NotFound('no realm for %s' % request.path)
+        return auth
+
+    def current_user(self, request):
+        """Get the current logged in user of the realm of request"""
+        return self._select(request).current_user(request)
+
+    def login_required(self, route=None, **options):
+        """Like :meth:`Auth.login_required`, in the realm of request"""
+        return self._dispatching('login_required', route, options)
+
+    def login_optional(self, route=None, **options):
+        """Like :meth:`Auth.login_optional`, in the realm of request"""
+        return self._dispatching('login_optional', route, options)
+
+    def _dispatching(self, decorator, route, options):
+        if route is None:
+            return partial(self._dispatching, decorator, options=options)
+        # the route is decorated by each realm on first use, as realms can
+        # be added after routes
+        wrapped = {}
+
+        @wraps(route)
+        async def dispatch(request, *args, **kwargs):
+            auth = self._select(request)
+            handler = wrapped.get(auth)
+            if handler is None:
+                handler = wrapped[auth] = getattr(auth, decorator)(
+                    route, **options)
+            return await handler(request, *args, **kwargs)
+
+        if 'user_keyword' in options or decorator == 'login_optional':
+            dispatch.auth_user_keyword = options.get('user_keyword', 'user')
+        return dispatch
@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+"""Long-lived "remember me" tokens, restoring logins after sessions expire.
+
+A remember-me token is :code:`<selector>.<validator>`, the selector is the
+key of the token in the store, looked up by index, the validator is only
+stored as its SHA-256 digest, and compared in constant time, so a leaked
+store cannot be used to forge tokens.
+"""
+import asyncio
+import hashlib
+import heapq
+import hmac
+import json
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from secrets import token_urlsafe
+from time import time
+
+__all__ = [
+    'InMemoryRememberStore', 'RememberStore', 'SQLiteRememberStore',
+    'check_validator', 'hash_validator', 'make_token', 'split_token',
+]
+
+
+def make_token():
+    """Return a new :code:`(selector, validator, token)`"""
+    selector = token_urlsafe(12)
+    validator = token_urlsafe(32)
+    return selector, validator, '%s.%s' % (selector, validator)
+
+
+def split_token(token):
+    """Return :code:`(selector, validator)` of token, or :code:`None`"""
+    selector, _, validator = token.partition('.')
+    if not selector or not validator:
+        return None
+    return selector, validator
+
+
+def hash_validator(validator):
+    """Return the digest of validator, as stored"""
+    return hashlib.sha256(validator.encode('utf-8')).hexdigest()
+
+
+def check_validator(validator, hashed):
+    """Check validator against the digest in constant time"""
+    return hmac.compare_digest(hash_validator(validator), hashed)
+
+
+class RememberStore:
+    """Interface of asynchronous remember-me token storage.
+
+    Entries are :code:`(uid, hashed, data, expires)`, where :code:`hashed`
+    is the digest of validator, :code:`data` is the stored user token, and
+    :code:`expires` is a timestamp.  Expired entries are removed by
+    :meth:`purge` every :code:`purge_interval` seconds while server is
+    running.
+    """
+    purge_interval = 3600
+    #: number of periodic purges failed, e.g. database locked by another
+    #: worker, retried next time
+    purge_failures = 0
+    _purger = None
+
+    async def get(self, selector):
+        """Return the entry of selector, :code:`None` if not found"""
+        raise NotImplementedError
+
+    async def add(self, selector, uid, hashed, data, expires):
+        """Add an entry"""
+        raise NotImplementedError
+
+    async def delete(self, selector):
+        """Delete the entry of selector"""
+        raise NotImplementedError
+
+    async def delete_user(self, uid):
+        """Delete all entries of user"""
+        raise NotImplementedError
+
+    async def purge(self, now=None):
+        """Delete entries expired by :code:`now`, return how many of them"""
+        raise NotImplementedError
+
+    async def _purge_periodically(self):
+        while True:
+            await asyncio.sleep(self.purge_interval)
+            try:
+                await self.purge()
+            except Exception:
+                self.purge_failures += 1
+
+    async def open(self):
+        """Called when server starts"""
+        if self.purge_interval and self._purger is None:
+            self._purger = asyncio.ensure_future(self._purge_periodically())
+
+    async def close(self):
+        """Called when server stops, release resources here"""
+        if self._purger is not None:
+            self._purger.cancel()
+            self._purger = None
+
+
+class InMemoryRememberStore(RememberStore):
+    """Remember-me tokens in process memory.
+
+    Tokens are not shared between worker processes, nor kept across
+    restarts, so this is meant for development and tests.  Expiry times are
+    kept in a heap, purging takes time in proportion to the number of
+    entries expired.
+    """
+    def __init__(self, purge_interval=3600):
+        self.purge_interval = purge_interval
+        self._entries = {}
+        self._users = {}
+        self._expiry = []
+
+    def __len__(self):
+        return len(self._entries)
+
+    async def get(self, selector):
+        return self._entries.get(selector)
+
+    async def add(self, selector, uid, hashed, data, expires):
+        self._entries[selector] = (uid, hashed, data, expires)
+        self._users.setdefault(uid, set()).add(selector)
+        heapq.heappush(self._expiry, (expires, selector))
+
+    async def delete(self, selector):
+        entry = self._entries.pop(selector, None)
+        if entry is not None:
+            selectors = self._users[entry[0]]
+            selectors.discard(selector)
+            if not selectors:
+                del self._users[entry[0]]
+
+    async def delete_user(self, uid):
+        for selector in self._users.pop(uid, ()):
+            del self._entries[selector]
+
+    async def purge(self, now=None):
+        now = time() if now is None else now
+        expiry = self._expiry
+        purged = 0
+        while expiry and expiry[0][0] <= now:
+            expires, selector = heapq.heappop(expiry)
+            entry = self._entries.get(selector)
+            # skip entries deleted or re-added since
+            if entry is not None and entry[3] == expires:
+                await self.delete(selector)
+                purged += 1
+        return purged
+
+
+class SQLiteRememberStore(RememberStore):
+    """Remember-me tokens in a SQLite database, shared by workers.
+
+    Entries are indexed by selector, user id and expiry time, so lookups,
+    deleting all tokens of a user and purging expired ones do not scan the
+    table.  Queries run in a dedicated thread, user tokens are encoded as
+    JSON.
+
+    :param path: path of database file
+    :param table: name of table, created if it does not exist
+    """
+    def __init__(self, path, table='auth_remember', purge_interval=3600):
+        self.path = path
+        self.table = table
+        self.purge_interval = purge_interval
+        self._db = None
+        self._executor = None
+
+    def _connect(self):
+        if self._db is None:
+            db = sqlite3.connect(self.path, check_same_thread=False,
+                                 isolation_level=None)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute(
+                'CREATE TABLE IF NOT EXISTS %s (selector TEXT PRIMARY KEY, '
+                'uid TEXT NOT NULL, hashed TEXT NOT NULL, data TEXT NOT NULL, '
+                'expires REAL NOT NULL)' % self.table)
+            db.execute('CREATE INDEX IF NOT EXISTS %s_uid ON %s (uid)' % (
+                self.table, self.table))
+            db.execute('CREATE INDEX IF NOT EXISTS %s_expires ON %s '
+                       '(expires)' % (self.table, self.table))
+            self._db = db
+        return self._db
+
+    def _execute(self, sql, *args):
+        cursor = self._connect().execute(sql % self.table, args)
+        return cursor.fetchone(), cursor.rowcount
+
+    async def _run(self, func, *args):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                1, thread_name_prefix='sanic-auth-remember')
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, partial(func, *args))
+
+    async def get(self, selector):
+        row, _ = await self._run(
+            self._execute,
+            'SELECT uid, hashed, data, expires FROM %s WHERE selector = ?',
+            selector)
+        if row is None:
+            return None
+        uid, hashed, data, expires = row
+        return uid, hashed, json.loads(data), expires
+
+    async def add(self, selector, uid, hashed, data, expires):
+        await self._run(self._execute,
+                        'INSERT INTO %s VALUES (?, ?, ?, ?, ?)', selector,
+                        str(uid), hashed, json.dumps(data), expires)
+
+    async def delete(self, selector):
+        await self._run(self._execute, 'DELETE FROM %s WHERE selector = ?',
+                        selector)
+
+    async def delete_user(self, uid):
+        await self._run(self._execute, 'DELETE FROM %s WHERE uid = ?',
+                        str(uid))
+
+    async def purge(self, now=None):
+        now = time() if now is None else now
+        _, count = await self._run(
+            self._execute, 'DELETE FROM %s WHERE expires <= ?', now)
+        return count
+
+    async def close(self):
+        await super().close()
+        if self._executor is not None:
+            if self._db is not None:
+                await self._run(self._db.close)
+                self._db = None
+            self._executor.shutdown(wait=False)
+            self._executor = None
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""Minimal asynchronous client for Redis-protocol (RESP) servers."""
+import asyncio
+
+__all__ = ['RedisError', 'RedisPool']
+
+
+class RedisError(Exception):
+    """Error reply from server"""
+
+
+def _encode(args):
+    parts = [b'*%d\r\n' % len(args)]
+    for arg in args:
+        if isinstance(arg, str):
+            arg = arg.encode('utf-8')
+        elif not isinstance(arg, bytes):
+            arg = str(arg).encode('ascii')
+        parts.append(b'$%d\r\n%s\r\n' % (len(arg), arg))
+    return b''.join(parts)
+
+
+async def _read_reply(reader):
+    line = await reader.readline()
+    if not line.endswith(b'\r\n'):
+        raise ConnectionError('connection closed by server')
+    kind, value = line[:1], line[1:-2]
+    if kind == b'+':
+        return value.decode('utf-8')
+    if kind == b'-':
+        raise RedisError(value.decode('utf-8'))
+    if kind == b':':
+        return int(value)
+    if kind == b'$':
+        length = int(value)
+        if length < 0:
+            return None
+        data = await reader.readexactly(length + 2)
+        return data[:-2]
+    if kind == b'*':
+        length = int(value)
+        if length < 0:
+            return None
+        return [await _read_reply(reader) for _ in range(length)]
+    raise ConnectionError('unknown reply type %r' % kind)
+
+
+class _Connection:
+    __slots__ = ('reader', 'writer')
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    async def execute(self, args):
+        self.writer.write(_encode(args))
+        await self.writer.drain()
+        return await _read_reply(self.reader)
+
+    def close(self):
+        self.writer.close()
+
+
+class RedisPool:
+    """Pool of connections to a Redis-protocol server.
+
+    Connections are opened on demand, at most :code:`maxsize` of them are in
+    use at the same time, other commands wait for one of them to be
+    released.  Connections are kept open and reused afterward.
+
+    :param host: server host
+    :param port: server port
+    :param db: database number selected upon connection
+    :param password: password to authenticate with, if any
+    :param maxsize: maximum number of connections
+    :param timeout: seconds to wait for connecting to server
+    """
+    def __init__(self, host='127.0.0.1', port=6379, *, db=0, password=None,
+                 maxsize=10, timeout=5.0):
+        assert maxsize > 0, 'maxsize must be positive'
+        self.host = host
+        self.port = port
+        self.db = db
+        self.password = password
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self._idle = []
+        self._semaphore = None
+
+    async def execute(self, *args):
+        """Execute a command, return the reply"""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.maxsize)
+        async with self._semaphore:
+            conn = self._idle.pop() if self._idle else await self._connect()
+            try:
+                reply = await conn.execute(args)
+            except RedisError:
+                self._idle.append(conn)
+                raise
+            except BaseException:
+                conn.close()
+                raise
+            self._idle.append(conn)
+            return reply
+
+    async def close(self):
+        """Close all idle connections"""
+        self._semaphore = None
+        idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+    async def _connect(self):
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port), self.timeout)
+        conn = _Connection(reader, writer)
+        try:
+            if self.password is not None:
+                await conn.execute(('AUTH', self.password))
+            if self.db:
+                await conn.execute(('SELECT', self.db))
+        except BaseException:
+            conn.close()
+            raise
+        return conn
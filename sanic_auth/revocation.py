@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+"""Per-user generation numbers shared by worker processes.
+
+A user token is issued along with the generation number of its user,
+bumping the generation revokes all tokens issued before, in all workers.
+Reading the generation of a user never does any I/O, so it can be checked
+on every request.
+"""
+import asyncio
+import mmap
+import os
+from multiprocessing import shared_memory
+from zlib import crc32
+
+from .resp import RedisError, RedisPool
+
+__all__ = [
+    'GenerationStore', 'MmapGenerations', 'RedisGenerations',
+    'SharedMemoryGenerations',
+]
+
+_ITEM_SIZE = 4
+
+
+def _key(uid):
+    return str(uid)
+
+
+class GenerationStore:
+    """Interface of generation storage"""
+    def get(self, uid):
+        """Return current generation of user, without any I/O"""
+        raise NotImplementedError
+
+    def bump(self, uid):
+        """Increase the generation of user, revoking all of user's tokens.
+
+        Return the new generation, or an awaitable of it.
+        """
+        raise NotImplementedError
+
+    async def open(self):
+        """Called when server starts"""
+
+    async def close(self):
+        """Called when server stops, release resources here"""
+
+
+class _ArrayGenerations(GenerationStore):
+    """Generations in a fixed size array of shared memory.
+
+    Users are hashed into :code:`slots`, users sharing a slot are revoked
+    together, pick a number of slots well above the number of users who are
+    expected to be revoked in the lifetime of the store.
+    """
+    def __init__(self, buf, slots):
+        self.slots = slots
+        self._array = memoryview(buf).cast('I')
+
+    def _slot(self, uid):
+        return crc32(_key(uid).encode('utf-8')) % self.slots
+
+    def get(self, uid):
+        return self._array[self._slot(uid)]
+
+    def bump(self, uid):
+        slot = self._slot(uid)
+        generation = (self._array[slot] + 1) & 0xffffffff
+        self._array[slot] = generation
+        return generation
+
+    def release(self):
+        """Release the memory view, must be called before closing"""
+        self._array.release()
+
+
+class SharedMemoryGenerations(_ArrayGenerations):
+    """Generations in :mod:`multiprocessing.shared_memory`.
+
+    All worker processes on the same host attach to the same block of shared
+    memory by :code:`name`, the first one creates it.
+
+    :param name: name of the shared memory block
+    :param slots: number of slots in the array
+    """
+    def __init__(self, name, slots=65536):
+        try:
+            self.shm = shared_memory.SharedMemory(
+                name, create=True, size=slots * _ITEM_SIZE)
+            self.shm.buf[:] = bytes(slots * _ITEM_SIZE)
+        except FileExistsError:
+            self.shm = shared_memory.SharedMemory(name)
+        super().__init__(self.shm.buf, slots)
+
+    async def close(self):
+        self.release()
+        self.shm.close()
+
+    def unlink(self):
+        """Destroy the shared memory block, once no process uses it"""
+        self.release()
+        self.shm.close()
+        self.shm.unlink()
+
+
+class MmapGenerations(_ArrayGenerations):
+    """Generations in a memory-mapped local file.
+
+    All worker processes on the same host map the same file at :code:`path`,
+    it is created if it does not exist, and it survives restarts.
+
+    :param path: path of the file
+    :param slots: number of slots in the array
+    """
+    def __init__(self, path, slots=65536):
+        size = slots * _ITEM_SIZE
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            if os.fstat(fd).st_size < size:
+                os.ftruncate(fd, size)
+            self.mmap = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+        super().__init__(self.mmap, slots)
+
+    async def close(self):
+        self.mmap.flush()
+
+
+class RedisGenerations(GenerationStore):
+    """Generations on a Redis-protocol server, mirrored in memory.
+
+    Each worker keeps a copy of all generations, and pulls changes made since
+    last time every :code:`refresh_interval` seconds, so a revocation takes
+    effect in other workers within that time.
+
+    :param pool: a :class:`~sanic_auth.resp.RedisPool`, if it is
+        :code:`None`, one is made with the rest of keyword arguments.
+    :param prefix: prefix of keys used
+    :param refresh_interval: seconds between pulling changes
+    """
+    #: bump a generation and log the change in one atomic step, so that no
+    #: worker sees a version before its change is logged
+    BUMP_SCRIPT = (
+        "local generation = redis.call('HINCRBY', KEYS[1], ARGV[1], 1)\n"
+        "local version = redis.call('INCR', KEYS[2])\n"
+        "redis.call('ZADD', KEYS[3], version, ARGV[1])\n"
+        "return generation\n"
+    )
+
+    def __init__(self, pool=None, *, prefix='auth:gen', refresh_interval=1.0,
+                 **pool_options):
+        self.pool = RedisPool(**pool_options) if pool is None else pool
+        self.prefix = prefix
+        self.refresh_interval = refresh_interval
+        self.version = 0
+        self._loaded = False
+        self._mirror = {}
+        self._refresher = None
+
+    def get(self, uid):
+        return self._mirror.get(_key(uid), 0)
+
+    async def bump(self, uid):
+        key = _key(uid)
+        prefix = self.prefix
+        generation = await self.pool.execute(
+            'EVAL', self.BUMP_SCRIPT, 3, prefix, prefix + ':version',
+            prefix + ':changes', key)
+        self._mirror[key] = max(self._mirror.get(key, 0), generation)
+        return generation
+
+    async def refresh(self):
+        """Pull generations changed since last refresh"""
+        execute = self.pool.execute
+        prefix = self.prefix
+        if not self._loaded:
+            version = int(await execute('GET', prefix + ':version') or 0)
+            items = await execute('HGETALL', prefix)
+            self._mirror = {
+                items[i].decode('utf-8'): int(items[i + 1])
+                for i in range(0, len(items), 2)
+            }
+            self.version = version
+            self._loaded = True
+            return
+        changes = await execute(
+            'ZRANGEBYSCORE', prefix + ':changes', '(%d' % self.version, '+inf',
+            'WITHSCORES')
+        if not changes:
+            return
+        keys = [key.decode('utf-8') for key in changes[::2]]
+        generations = await execute('HMGET', prefix, *keys)
+        for key, generation in zip(keys, generations):
+            self._mirror[key] = int(generation or 0)
+        self.version = max(self.version, int(float(changes[-1])))
+
+    async def _refresh_periodically(self):
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                await self.refresh()
+            except (ConnectionError, OSError, asyncio.TimeoutError,
+                    RedisError):
+                # e.g. LOADING after a restart of server, keep serving from
+                # the mirror, retry next time
+                pass
+
+    async def open(self):
+        await self.refresh()
+        if self._refresher is None:
+            self._refresher = asyncio.ensure_future(
+                self._refresh_periodically())
+
+    async def close(self):
+        if self._refresher is not None:
+            self._refresher.cancel()
+            self._refresher = None
+        await self.pool.close()
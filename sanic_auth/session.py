@@ -0,0 +1,318 @@
+# -*- coding: utf-8 -*-
+"""Server-side sessions, lazily loaded from pluggable asynchronous backends."""
+import asyncio
+import json
+from collections.abc import MutableMapping
+from secrets import token_urlsafe
+from time import monotonic
+
+from .resp import RedisPool
+
+__all__ = [
+    'InMemorySessionBackend', 'LazySession', 'RedisSessionBackend',
+    'Session', 'SessionBackend', 'SessionInterface',
+]
+
+# marker for keys deleted before the session is loaded
+_DELETED = object()
+
+
+class LazySession(MutableMapping):
+    """Session proxy, the session is fetched on first :meth:`load`.
+
+    :meth:`load` must be awaited before reading from it, but it can be
+    written to beforehand, changes are applied to the session upon loading.
+    Once loaded, all operations go to the fetched session.
+
+    This lets any session middleware defer loading session until
+    :class:`~sanic_auth.Auth` actually needs it, e.g.::
+
+        @app.middleware('request')
+        async def add_session(request):
+            sid = request.cookies.get('sid')
+            request.ctx.session = LazySession(lambda: store.get(sid))
+
+    :param fetch:
+        function returning an awaitable of the session, a dict-like object,
+        or :code:`None` for an empty one.  If :code:`fetch` itself is
+        :code:`None`, the session is empty and considered loaded.
+    """
+    def __init__(self, fetch):
+        self._fetch = fetch
+        #: whether session has been loaded
+        self.loaded = fetch is None
+        #: whether session has been changed, i.e. needs saving
+        self.modified = False
+        self._data = {}
+        self._changes = {}
+
+    async def load(self):
+        """Fetch the session, if it has not been loaded yet"""
+        if not self.loaded:
+            data = await self._fetch()
+            if data is None:
+                data = {}
+            for key, value in self._changes.items():
+                if value is _DELETED:
+                    data.pop(key, None)
+                else:
+                    data[key] = value
+            self._data = data
+            self._changes = {}
+            self.loaded = True
+        return self
+
+    def _check_loaded(self):
+        if not self.loaded:
+            raise RuntimeError('session is not loaded yet')
+
+    def __getitem__(self, key):
+        if not self.loaded:
+            value = self._changes.get(key, _DELETED)
+            if value is _DELETED:
+                self._check_loaded()
+            return value
+        return self._data[key]
+
+    def __setitem__(self, key, value):
+        if self.loaded:
+            self._data[key] = value
+        else:
+            self._changes[key] = value
+        self.modified = True
+
+    def __delitem__(self, key):
+        if self.loaded:
+            del self._data[key]
+        else:
+            self._changes[key] = _DELETED
+        self.modified = True
+
+    def pop(self, key, *default):
+        """Like :meth:`dict.pop`, but before the session is loaded, only
+        values set in this request can be returned
+        """
+        if self.loaded:
+            if key in self._data:
+                self.modified = True
+            return self._data.pop(key, *default)
+        value = self._changes.get(key, _DELETED)
+        self._changes[key] = _DELETED
+        self.modified = True
+        if value is _DELETED:
+            if default:
+                return default[0]
+            raise KeyError(key)
+        return value
+
+    def __iter__(self):
+        self._check_loaded()
+        return iter(self._data)
+
+    def __len__(self):
+        self._check_loaded()
+        return len(self._data)
+
+    def __repr__(self):
+        if not self.loaded:
+            return '<%s (not loaded)>' % type(self).__name__
+        return '<%s %r>' % (type(self).__name__, self._data)
+
+
+class Session(LazySession):
+    """Session data with dirty tracking, loaded from backend on demand.
+
+    A session without id is a new one, it is empty and considered loaded.
+    """
+    def __init__(self, backend, sid=None):
+        super().__init__(None if sid is None else self._load_data)
+        self.backend = backend
+        self.sid = sid
+        #: whether session is to be saved under a new id
+        self.regenerated = False
+
+    def regenerate(self):
+        """Save the session under a new id, dropping the old one.
+
+        Called when a user logs in or out, so that a session id planted
+        before login, i.e. session fixation, is never authenticated.
+        """
+        self.regenerated = True
+        self.modified = True
+
+    async def _load_data(self):
+        data = await self.backend.load(self.sid)
+        if data is None:
+            # unknown or expired, never reuse session id from client
+            self.sid = None
+        return data
+
+
+class SessionBackend:
+    """Interface of asynchronous session storage"""
+    async def load(self, sid):
+        """Return session data as a dict, :code:`None` if not found"""
+        raise NotImplementedError
+
+    async def save(self, sid, data, max_age):
+        """Save session data, expiring in :code:`max_age` seconds"""
+        raise NotImplementedError
+
+    async def delete(self, sid):
+        """Delete session data"""
+        raise NotImplementedError
+
+    async def open(self):
+        """Called when server starts"""
+
+    async def close(self):
+        """Called when server stops, release resources here"""
+
+
+class InMemorySessionBackend(SessionBackend):
+    """Session storage in process memory.
+
+    Sessions are not shared between worker processes, so this is meant for
+    development and single worker deployment.  Expired sessions are removed
+    every :code:`sweep_interval` seconds while server is running.
+    """
+    def __init__(self, sweep_interval=60):
+        self.sweep_interval = sweep_interval
+        self._sessions = {}
+        self._sweeper = None
+
+    async def load(self, sid):
+        entry = self._sessions.get(sid)
+        if entry is None:
+            return None
+        expires, data = entry
+        if expires is not None and expires <= monotonic():
+            del self._sessions[sid]
+            return None
+        return dict(data)
+
+    async def save(self, sid, data, max_age):
+        expires = None if max_age is None else monotonic() + max_age
+        self._sessions[sid] = (expires, dict(data))
+
+    async def delete(self, sid):
+        self._sessions.pop(sid, None)
+
+    def sweep(self):
+        """Remove expired sessions, return how many of them are removed"""
+        now = monotonic()
+        expired = [sid for sid, (expires, _) in self._sessions.items()
+                   if expires is not None and expires <= now]
+        for sid in expired:
+            del self._sessions[sid]
+        return len(expired)
+
+    async def _sweep_periodically(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            self.sweep()
+
+    async def open(self):
+        if self.sweep_interval and self._sweeper is None:
+            self._sweeper = asyncio.ensure_future(self._sweep_periodically())
+
+    async def close(self):
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            self._sweeper = None
+
+
+class RedisSessionBackend(SessionBackend):
+    """Session storage on a Redis-protocol server, data encoded as JSON.
+
+    :param pool: a :class:`~sanic_auth.resp.RedisPool`, if it is
+        :code:`None`, one is made with the rest of keyword arguments.
+    :param prefix: prefix of keys of sessions
+    """
+    def __init__(self, pool=None, *, prefix='session:', **pool_options):
+        self.pool = RedisPool(**pool_options) if pool is None else pool
+        self.prefix = prefix
+
+    async def load(self, sid):
+        data = await self.pool.execute('GET', self.prefix + sid)
+        if data is None:
+            return None
+        return json.loads(data)
+
+    async def save(self, sid, data, max_age):
+        args = ['SET', self.prefix + sid, json.dumps(data)]
+        if max_age is not None:
+            args += ['EX', int(max_age)]
+        await self.pool.execute(*args)
+
+    async def delete(self, sid):
+        await self.pool.execute('DEL', self.prefix + sid)
+
+    async def close(self):
+        await self.pool.close()
+
+
+class SessionInterface:
+    """Put a lazily loaded :class:`Session` on :code:`request.ctx`.
+
+    Nothing is read from the backend until the session is loaded, and
+    nothing is written unless the session is modified, so that requests that
+    do not need session do no session I/O at all.  Code reading session data
+    directly should :code:`await request.ctx.session.load()` first.
+
+    :param backend: a :class:`SessionBackend`
+    :param name: attribute name of session on :code:`request.ctx`
+    :param cookie_name: name of cookie carrying session id
+    :param max_age: seconds before an untouched session expires
+    :param secure: whether session cookie is only sent over HTTPS
+    """
+    def __init__(self, backend, *, name='session', cookie_name='session',
+                 max_age=14 * 24 * 3600, secure=True):
+        self.backend = backend
+        self.name = name
+        self.cookie_name = cookie_name
+        self.max_age = max_age
+        self.secure = secure
+
+    def install(self, app):
+        """Register middleware and listeners to the application"""
+        app.register_middleware(self.open_session, 'request')
+        app.register_middleware(self.save_session, 'response')
+        app.register_listener(self._open_backend, 'before_server_start')
+        app.register_listener(self._close_backend, 'after_server_stop')
+
+    def open_session(self, request):
+        if getattr(request.ctx, self.name, None) is not None:
+            # opened already, e.g. before routing
+            return
+        sid = request.cookies.get(self.cookie_name) or None
+        setattr(request.ctx, self.name, Session(self.backend, sid))
+
+    async def save_session(self, request, response):
+        session = getattr(request.ctx, self.name, None)
+        if session is None or not session.modified:
+            return
+        await session.load()
+        stale = session.sid
+        if getattr(session, 'regenerated', False):
+            session.sid = None
+            session.regenerated = False
+        if session:
+            if session.sid is None:
+                session.sid = token_urlsafe(32)
+            await self.backend.save(session.sid, session._data, self.max_age)
+            response.add_cookie(
+                self.cookie_name, session.sid, httponly=True,
+                secure=self.secure, max_age=self.max_age)
+        else:
+            session.sid = None
+            if stale is not None:
+                response.delete_cookie(self.cookie_name)
+        if stale is not None and stale != session.sid:
+            await self.backend.delete(stale)
+
+    async def _open_backend(self, app, loop=None):
+        await self.backend.open()
+
+    async def _close_backend(self, app, loop=None):
+        await self.backend.close()
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""Signed tokens for stateless authentication."""
+import hmac
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from hashlib import sha256
+from time import time
+
+__all__ = ['TokenSigner']
+
+
+def _b64encode(data):
+    return urlsafe_b64encode(data).rstrip(b'=')
+
+
+def _b64decode(data):
+    return urlsafe_b64decode(data + b'=' * (-len(data) % 4))
+
+
+def _to_bytes(key):
+    return key.encode('utf-8') if isinstance(key, str) else key
+
+
+class TokenSigner:
+    """Sign and verify compact HMAC-SHA256 tokens.
+
+    A signed token looks like :code:`<payload>.<signature>`, both parts are
+    URL-safe base64 without padding, the payload is the JSON encoded user
+    token along with its expiry time.
+
+    :param keys:
+        secret keys, the first one is used for signing, all of them are
+        accepted for verification, so keys can be rotated by prepending a
+        new key and dropping the oldest one later.
+    :param max_age:
+        seconds before a signed token expires, :code:`None` means never.
+    """
+    def __init__(self, keys, max_age=None):
+        if isinstance(keys, (str, bytes)):
+            keys = [keys]
+        keys = [_to_bytes(key) for key in keys]
+        if not keys or not all(keys):
+            raise ValueError('at least one non-empty secret key is required')
+        self.keys = keys
+        self.max_age = max_age
+
+    def _signature(self, key, payload):
+        return hmac.new(key, payload, sha256).digest()
+
+    def sign(self, token, max_age=None):
+        """Return signed token as :code:`str`"""
+        max_age = self.max_age if max_age is None else max_age
+        expires = None if max_age is None else int(time() + max_age)
+        payload = _b64encode(
+            json.dumps([token, expires], separators=(',', ':')).encode())
+        signature = _b64encode(self._signature(self.keys[0], payload))
+        return (payload + b'.' + signature).decode('ascii')
+
+    def unsign(self, signed):
+        """Verify signed token and return the user token inside.
+
+        Return :code:`None` if the signed token is malformed, expired or not
+        signed by any of the keys.
+        """
+        loaded = self.unsign_with_expiry(signed)
+        return None if loaded is None else loaded[0]
+
+    def unsign_with_expiry(self, signed):
+        """Like :meth:`unsign`, but return :code:`(token, expires)`, where
+        :code:`expires` is a timestamp or :code:`None`
+        """
+        try:
+            payload, _, signature = signed.encode('ascii').rpartition(b'.')
+            signature = _b64decode(signature)
+        except (AttributeError, UnicodeError, ValueError):
+            return None
+        if not payload:
+            return None
+        for key in self.keys:
+            if hmac.compare_digest(self._signature(key, payload), signature):
+                break
+        else:
+            return None
+        try:
+            token, expires = json.loads(_b64decode(payload))
+        except (TypeError, ValueError):
+            return None
+        if expires is not None and expires < time():
+            return None
+        return token, expires
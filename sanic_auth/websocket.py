@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""Registry of authenticated websocket connections."""
+import asyncio
+
+__all__ = ['ConnectionRegistry']
+
+
+class ConnectionRegistry:
+    """Open websocket connections, indexed by user id.
+
+    Connections are added by :meth:`Auth.websocket_login_required` for as
+    long as the handler runs, so that all sockets of a user can be found
+    without scanning the others, e.g. to push a message to every open tab
+    of the user, or to disconnect them all when the user logs out.
+
+    Connections are only tracked in the worker process serving them.
+    """
+    def __init__(self):
+        self._connections = {}
+
+    def __len__(self):
+        return sum(len(sockets) for sockets in self._connections.values())
+
+    def __contains__(self, uid):
+        return uid in self._connections
+
+    def add(self, uid, ws, request=None):
+        """Track connection :code:`ws` of user, made by :code:`request`"""
+        self._connections.setdefault(uid, {})[ws] = request
+
+    def discard(self, uid, ws):
+        """Stop tracking connection :code:`ws` of user, if tracked"""
+        sockets = self._connections.get(uid)
+        if sockets is not None:
+            sockets.pop(ws, None)
+            if not sockets:
+                del self._connections[uid]
+
+    def connections(self, uid):
+        """Return a list of open connections of user"""
+        return list(self._connections.get(uid, ()))
+
+    def items(self):
+        """Return a list of :code:`(uid, ws, request)` of all connections"""
+        return [(uid, ws, request)
+                for uid, sockets in self._connections.items()
+                for ws, request in sockets.items()]
+
+    async def send(self, uid, data):
+        """Send data to all connections of user, return how many got it"""
+        results = await asyncio.gather(
+            *(ws.send(data) for ws in self.connections(uid)),
+            return_exceptions=True)
+        return sum(not isinstance(result, Exception) for result in results)
+
+    async def close(self, uid, code=1000, reason=''):
+        """Close all connections of user, return how many are closed"""
+        sockets = self.connections(uid)
+        for ws in sockets:
+            self.discard(uid, ws)
+        await asyncio.gather(*(ws.close(code, reason) for ws in sockets),
+                             return_exceptions=True)
+        return len(sockets)
@@ -1,8 +1,12 @@
 # -*- coding: utf-8 -*-
+import asyncio
+import threading
+
 import pytest
 
 from sanic import Sanic
 from sanic.request import Request
+from sanic_auth import RedisGenerations
 
 
 @pytest.fixture(scope='function')
@@ -15,3 +19,106 @@ def app():
         request.ctx.session = session
 
     return test_app
+
+
+class FakeRedis:
+    """Stand-in Redis-protocol server, running in a thread"""
+    def __init__(self):
+        self.data = {}
+        self.commands = []
+        self.loop = asyncio.new_event_loop()
+        self.server = self.loop.run_until_complete(
+            asyncio.start_server(self.handle, '127.0.0.1', 0))
+        self.port = self.server.sockets[0].getsockname()[1]
+        self.thread = threading.Thread(target=self.loop.run_forever)
+        self.thread.start()
+
+    def close(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.server.close()
+        self.loop.close()
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                args = []
+                for _ in range(int(line[1:])):
+                    length = int((await reader.readline())[1:])
+                    args.append((await reader.readexactly(length + 2))[:-2])
+                command = args[0].decode().upper()
+                self.commands.append(command)
+                writer.write(self.reply(command, args[1:]))
+                await writer.drain()
+        finally:
+            writer.close()
+
+    def encode(self, value):
+        if value is None:
+            return b'$-1\r\n'
+        if isinstance(value, int):
+            return b':%d\r\n' % value
+        if isinstance(value, list):
+            return b'*%d\r\n' % len(value) + b''.join(
+                self.encode(v) for v in value)
+        return b'$%d\r\n%s\r\n' % (len(value), value)
+
+    def reply(self, command, args):
+        data = self.data
+        if command in ('PING', 'SELECT', 'AUTH'):
+            return b'+OK\r\n'
+        if command == 'GET':
+            return self.encode(data.get(args[0]))
+        if command == 'SET':
+            data[args[0]] = args[1]
+            return b'+OK\r\n'
+        if command == 'DEL':
+            return self.encode(sum(
+                data.pop(key, None) is not None for key in args))
+        if command == 'INCR':
+            data[args[0]] = b'%d' % (int(data.get(args[0], 0)) + 1)
+            return self.encode(int(data[args[0]]))
+        if command == 'EXPIRE':
+            return self.encode(int(args[0] in data))
+        if command == 'HINCRBY':
+            fields = data.setdefault(args[0], {})
+            fields[args[1]] = int(fields.get(args[1], 0)) + int(args[2])
+            return self.encode(fields[args[1]])
+        if command == 'HGETALL':
+            return self.encode([
+                v for field, value in data.get(args[0], {}).items()
+                for v in (field, b'%d' % value)])
+        if command == 'HMGET':
+            fields = data.get(args[0], {})
+            return self.encode([
+                None if field not in fields else b'%d' % fields[field]
+                for field in args[1:]])
+        if command == 'EVAL':
+            # only the script bumping a generation, run in one step
+            assert args[0] == RedisGenerations.BUMP_SCRIPT.encode()
+            hash_key, version_key, changes_key, field = args[2:]
+            generation = self.reply('HINCRBY', [hash_key, field, b'1'])
+            version = int(self.reply('INCR', [version_key])[1:-2])
+            self.reply('ZADD', [changes_key, b'%d' % version, field])
+            return generation
+        if command == 'ZADD':
+            data.setdefault(args[0], {})[args[2]] = float(args[1])
+            return self.encode(1)
+        if command == 'ZRANGEBYSCORE':
+            low = float(args[1].lstrip(b'('))
+            members = sorted((score, member) for member, score in
+                             data.get(args[0], {}).items() if score > low)
+            return self.encode([
+                v for score, member in members
+                for v in (member, b'%d' % score)])
+        return b'-ERR unknown command %s\r\n' % command.encode()
+
+
+@pytest.fixture(scope='function')
+def redis_server():
+    server = FakeRedis()
+    yield server
+    server.close()
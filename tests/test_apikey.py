@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from sanic import response
+from sanic_auth import APIKeyStore, Auth
+from sanic_auth import apikey as apikey_module
+
+
+def test_api_key_store(monkeypatch):
+    store = APIKeyStore(cache_size=1)
+    key = store.generate_key((1, 'bot'))
+    prefix, _, secret = key.partition('.')
+    assert prefix in store and len(store) == 1
+    assert secret not in repr(store._index)
+
+    hashed = []
+    digest = apikey_module._digest
+    monkeypatch.setattr(apikey_module, '_digest',
+                        lambda s: hashed.append(s) or digest(s))
+    assert store.verify(key) == (1, 'bot')
+    assert store.verify(key) == (1, 'bot')
+    assert len(hashed) == 1
+    assert store.verify(prefix + '.wrong') is None
+    assert store.verify('unknown.' + secret) is None
+    assert store.verify('malformed') is None
+
+    store.remove(prefix)
+    assert store.verify(key) is None
+    with pytest.raises(ValueError):
+        store.add('malformed', (2, 'bot'))
+
+
+def test_api_key_store_reload():
+    key = 'k1.' + 'a' * 32
+    other = 'k2.' + 'b' * 32
+    store = APIKeyStore()
+    assert store.verify(key) is None
+    store.load([APIKeyStore.hash_key(key) + (1,)])
+    assert store.verify(key) == 1
+    # rotated, the verified key is not served from cache anymore
+    digest = APIKeyStore.hash_key(other)[1]
+    store.load([('k1', digest, 1), ('k2', digest, 2)])
+    assert store.verify(key) is None
+    assert store.verify(other) == 2
+
+
+def test_api_key_auth(app):
+    key = 'k1.' + 'a' * 32
+    prefix, digest = APIKeyStore.hash_key(key)
+    app.config.AUTH_API_KEYS = APIKeyStore(
+        lambda: [(prefix, digest, (1, 'bot'))])
+    app.config.AUTH_LOGIN_URL = '/login'
+    auth = Auth(app)
+
+    @app.route('/user')
+    @auth.login_required(user_keyword='user')
+    async def user(request, user):
+        return response.text(user.name)
+
+    req, resp = app.test_client.get('/user', allow_redirects=False)
+    assert resp.status == 302
+
+    req, resp = app.test_client.get('/user', headers={'X-API-Key': key})
+    assert resp.status == 200 and resp.text == 'bot'
+
+    bearer = {'Authorization': 'Bearer %s' % key}
+    req, resp = app.test_client.get('/user', headers=bearer)
+    assert resp.status == 200 and resp.text == 'bot'
+
+    req, resp = app.test_client.get('/user', headers={'X-API-Key': key + 'x'},
+                                    allow_redirects=False)
+    assert resp.status == 302
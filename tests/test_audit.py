@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import json
+import sqlite3
+
+import pytest
+
+from sanic import response
+from sanic_auth import (
+    AuditLog, Auth, CallableSink, JSONLinesSink, SQLiteSink, User)
+from sanic_auth import audit as audit_module
+
+
+def test_drop():
+    batches = []
+    audit = AuditLog(batches.append, maxsize=3, batch_size=2)
+
+    async def run():
+        for i in range(4):
+            assert audit.emit({'n': i}) is None
+        assert len(audit) == 3
+        await audit.close()
+
+    asyncio.run(run())
+    assert batches == [[{'n': 0}, {'n': 1}], [{'n': 2}]]
+    assert (audit.emitted, audit.dropped, audit.written) == (3, 1, 3)
+
+
+def test_sample(monkeypatch):
+    monkeypatch.setattr(audit_module, 'random', lambda: 0.5)
+    batches = []
+    audit = AuditLog(batches.append, maxsize=4, policy='sample',
+                     sample_rate=0.6)
+
+    async def run():
+        for i in range(6):
+            audit.emit({'n': i})
+        assert audit.dropped == 2
+        audit.sample_rate = 0.1
+        audit.emit({'n': 6})
+        assert audit.dropped == 3
+        await audit.close()
+
+    asyncio.run(run())
+    assert [event['n'] for event in batches[0]] == [0, 1, 2, 3]
+
+
+def test_block():
+    written = []
+
+    async def write(events):
+        written.extend(events)
+
+    audit = AuditLog(write, maxsize=2, policy='block')
+
+    async def run():
+        audit.emit({'n': 0})
+        audit.emit({'n': 1})
+        blocked = audit.emit({'n': 2})
+        assert blocked is not None and audit.dropped == 0
+        await audit.open()
+        await asyncio.wait_for(blocked, 1)
+        await audit.close()
+
+    asyncio.run(run())
+    assert [event['n'] for event in written] == [0, 1, 2]
+
+
+def test_failing_sink():
+    def write(events):
+        raise OSError('disk full')
+
+    audit = AuditLog(CallableSink(write))
+
+    async def run():
+        audit.emit({'n': 0})
+        await audit.close()
+
+    asyncio.run(run())
+    assert (audit.written, audit.failed) == (0, 1)
+
+
+def test_file_sinks(tmp_path):
+    path = str(tmp_path / 'audit.jsonl')
+    db = str(tmp_path / 'audit.db')
+    events = [{'time': 1.0, 'event': 'login'}, {'time': 2.0, 'event': 'x'}]
+
+    async def run(audit):
+        for event in events:
+            audit.emit(event)
+        await audit.close()
+
+    asyncio.run(run(AuditLog(JSONLinesSink(path))))
+    with open(path) as f:
+        assert [json.loads(line) for line in f] == events
+    asyncio.run(run(AuditLog(SQLiteSink(db))))
+    rows = sqlite3.connect(db).execute(
+        'SELECT time, event FROM auth_audit').fetchall()
+    assert rows == [(1.0, 'login'), (2.0, 'x')]
+
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        AuditLog(print, policy='retry')
+
+
+def test_auth_audit(app):
+    events = []
+    app.config.AUTH_LOGIN_URL = '/login'
+    app.config.AUTH_AUDIT = AuditLog(events.extend)
+    auth = Auth(app)
+
+    @app.route('/login')
+    async def login(request):
+        auth.login_user(request, User(id=1, name='demo'))
+        return response.text('okay')
+
+    @app.route('/logout')
+    async def logout(request):
+        auth.logout_user(request)
+        return response.text('okay')
+
+    @app.route('/user')
+    @auth.login_required
+    async def user(request):
+        return response.text('okay')
+
+    app.test_client.get('/user', allow_redirects=False)
+    app.test_client.get('/login')
+    app.test_client.get('/user')
+    app.test_client.get('/logout')
+    assert [(e['event'], e['uid'], e['path']) for e in events] == [
+        ('no_auth', None, '/user'),
+        ('login', 1, '/login'),
+        ('logout', 1, '/logout'),
+    ]
+    assert events[0]['realm'] is None and events[0]['ip'] == '127.0.0.1'
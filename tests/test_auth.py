@@ -1,8 +1,12 @@
 # -*- coding: utf-8 -*-
+import json
+from inspect import isawaitable
+
 import pytest
 
-from sanic import response
-from sanic_auth import Auth, User
+import sanic_auth
+from sanic import Blueprint, Sanic, response
+from sanic_auth import Auth, InMemorySessionBackend, User
 
 
 def test_login(app):
@@ -144,20 +148,28 @@ def test_user_keyword(app):
     async def user(request, user):
         return response.text(user.name)
 
-    @app.route('/<user>')
-    @auth.login_required(user_keyword='user')
-    async def user_id(request, user):
-        return response.text(user.id)
-
     payload = {'name': 'demo', 'password': '1234'}
     req, resp = app.test_client.post('/login', data=payload)
     assert resp.status == 200 and resp.text == 'okay'
     req, resp = app.test_client.get('/user')
     assert resp.status == 200 and resp.text == 'demo'
 
-    req, resp = app.test_client.get(app.url_for('user_id', user=1))
+    with pytest.raises(AssertionError):
+        @auth.login_required(user_keyword='user')
+        async def no_user(request):
+            pass
+
+    other = Sanic('other_app')
+    auth = Auth(other)
+
+    @other.route('/<user>')
+    @auth.login_required(user_keyword='user')
+    async def user_id(request, user):
+        return response.text(user.id)
+
     # RuntimeError being raised because we try to overwrite user parameter
-    assert resp.status == 500
+    with pytest.raises(RuntimeError, match='override user keyword'):
+        other.test_client.get(other.url_for('user_id', user=1))
 
 
 def test_decorators(app):
@@ -261,3 +273,495 @@ def test_setup_once(app):
     auth = Auth(app)
     with pytest.raises(RuntimeError):
         auth.setup(app)
+
+
+@pytest.mark.parametrize('is_async', [False, True])
+def test_user_loaded_once_per_request(app, is_async):
+    auth = Auth(app)
+    calls = []
+
+    def find_user(token):
+        calls.append(token)
+        return User(*token)
+
+    if is_async:
+        @auth.user_loader
+        async def load_user(token):
+            return find_user(token)
+    else:
+        auth.user_loader(find_user)
+
+    @app.middleware('request')
+    async def preload_user(request):
+        user = auth.current_user(request)
+        if isawaitable(user):
+            await user
+
+    @app.post('/login')
+    async def login(request):
+        auth.login_user(request, User(id=1, name='demo'))
+        return response.text('okay')
+
+    @app.route('/user')
+    @auth.login_required(user_keyword='user')
+    async def user(request, user):
+        again = auth.current_user(request)
+        if isawaitable(again):
+            again = await again
+        assert again is user
+        return response.text(user.name)
+
+    req, resp = app.test_client.post('/login')
+    assert resp.status == 200 and resp.text == 'okay'
+    del calls[:]
+    req, resp = app.test_client.get('/user')
+    assert resp.status == 200 and resp.text == 'demo'
+    assert len(calls) == 1
+
+
+def test_login_logout_invalidate_memoized_user(app):
+    auth = Auth(app)
+
+    @app.route('/switch')
+    async def switch(request):
+        assert auth.current_user(request) is None
+        auth.login_user(request, User(id=1, name='demo'))
+        assert auth.current_user(request).name == 'demo'
+        auth.logout_user(request)
+        assert auth.current_user(request) is None
+        return response.text('okay')
+
+    req, resp = app.test_client.get('/switch')
+    assert resp.status == 200 and resp.text == 'okay'
+
+
+def test_default_serialize_and_load(app):
+    auth = Auth(app)
+    user = User(id=1, name='demo', roles=('admin',), tenant='acme')
+    token = auth.serialize(user)
+    assert token is user
+    assert auth.load_user(token) is user
+    # e.g. from a JSON session backend
+    assert auth.load_user(json.loads(json.dumps(token))) == user
+    assert auth.load_user([1, 'demo']) == User(id=1, name='demo')
+    # token made by earlier versions
+    assert auth.load_user({'uid': 1, 'name': 'demo'}) == (1, 'demo', (), None)
+    assert auth.load_user(None) is None
+
+    class Model:
+        id = 2
+        name = 'admin'
+
+    assert auth.serialize(Model()) == (2, 'admin')
+    assert auth.token_uid(auth.serialize(Model())) == 2
+
+    with pytest.raises(AttributeError):
+        user.roles = ()
+    with pytest.raises(AttributeError):
+        user.extra = None
+
+
+def test_roles_required(app):
+    app.config.AUTH_LOGIN_URL = '/login'
+    auth = Auth(app)
+
+    @app.route('/login/<name>')
+    async def login(request, name):
+        roles = ('admin', 'staff') if name == 'admin' else ('staff',)
+        auth.login_user(request, User(id=1, name=name, roles=roles))
+        return response.text('okay')
+
+    @app.route('/admin')
+    @auth.roles_required('admin', user_keyword='user')
+    async def admin(request, user):
+        return response.text(user.name)
+
+    @app.route('/staff')
+    @auth.roles_required(any_of=['admin', 'staff'])
+    async def staff(request):
+        return response.text('staff')
+
+    req, resp = app.test_client.get('/admin', allow_redirects=False)
+    assert resp.status == 302
+
+    app.test_client.get('/login/demo')
+    req, resp = app.test_client.get('/admin')
+    assert resp.status == 403
+    req, resp = app.test_client.get('/staff')
+    assert resp.status == 200 and resp.text == 'staff'
+
+    app.test_client.get('/login/admin')
+    req, resp = app.test_client.get('/admin')
+    assert resp.status == 200 and resp.text == 'admin'
+
+
+def test_permission_required(app):
+    auth = Auth(app)
+    calls = []
+
+    @auth.permissions_loader
+    async def load_permissions(user):
+        calls.append(user)
+        return {'read'} if user.name == 'demo' else {'read', 'write'}
+
+    @auth.forbidden_handler
+    def handle_forbidden(request):
+        return response.text('forbidden', status=403)
+
+    def handle_no_auth(request):
+        return response.text('no_auth', status=401)
+
+    def handle_no_write(request):
+        return response.text('read only', status=403)
+
+    @app.route('/login/<name>')
+    async def login(request, name):
+        auth.login_user(request, User(id=1, name=name))
+        return response.text('okay')
+
+    @app.route('/read')
+    @auth.permission_required('read', handle_no_auth=handle_no_auth)
+    @auth.permission_required('read')
+    async def read(request):
+        return response.text('read')
+
+    @app.route('/write')
+    @auth.permission_required('read', 'write',
+                              handle_forbidden=handle_no_write)
+    async def write(request):
+        return response.text('write')
+
+    @app.route('/delete')
+    @auth.permission_required('delete')
+    async def delete(request):
+        return response.text('delete')
+
+    req, resp = app.test_client.get('/read')
+    assert resp.status == 401 and resp.text == 'no_auth'
+
+    app.test_client.get('/login/demo')
+    del calls[:]
+    req, resp = app.test_client.get('/read')
+    assert resp.status == 200 and resp.text == 'read'
+    # loaded once for both decorators
+    assert len(calls) == 1
+    req, resp = app.test_client.get('/write')
+    assert resp.status == 403 and resp.text == 'read only'
+
+    app.test_client.get('/login/root')
+    req, resp = app.test_client.get('/write')
+    assert resp.status == 200 and resp.text == 'write'
+    req, resp = app.test_client.get('/delete')
+    assert resp.status == 403 and resp.text == 'forbidden'
+
+
+def test_protect_blueprint(app):
+    app.config.AUTH_LOGIN_ENDPOINT = 'user.login'
+    auth = Auth(app)
+    bp = Blueprint('user', url_prefix='/user')
+    auth.protect(bp, exclude=['user.login', '/user/public'])
+
+    @bp.route('/login')
+    async def login(request):
+        auth.login_user(request, User(id=1, name='demo'))
+        return response.text('okay')
+
+    @bp.route('/public/page')
+    async def public(request):
+        return response.text('public')
+
+    @bp.route('/profile')
+    async def profile(request):
+        return response.text(auth.current_user(request).name)
+
+    @app.route('/home')
+    async def home(request):
+        return response.text('home')
+
+    app.blueprint(bp)
+
+    req, resp = app.test_client.get('/user/profile', allow_redirects=False)
+    assert resp.status == 302
+    assert resp.headers['Location'] == app.url_for('user.login')
+    req, resp = app.test_client.get('/user/public/page')
+    assert resp.status == 200 and resp.text == 'public'
+    req, resp = app.test_client.get('/home')
+    assert resp.status == 200 and resp.text == 'home'
+
+    app.test_client.get('/user/login')
+    req, resp = app.test_client.get('/user/profile')
+    assert resp.status == 200 and resp.text == 'demo'
+
+
+def test_protect_app(app):
+    auth = Auth(app)
+    calls = []
+
+    def handle_no_auth(request):
+        return response.text('unauthorized', status=401)
+
+    auth.protect(app, exclude='login', handle_no_auth=handle_no_auth)
+
+    @auth.user_loader
+    def load_user(token):
+        calls.append(token)
+        return User(*token)
+
+    @app.route('/login')
+    async def login(request):
+        auth.login_user(request, User(id=1, name='demo'))
+        return response.text('okay')
+
+    @app.route('/profile')
+    @auth.login_required(user_keyword='user')
+    async def profile(request, user):
+        return response.text(user.name)
+
+    req, resp = app.test_client.get('/profile')
+    assert resp.status == 401 and resp.text == 'unauthorized'
+    app.test_client.get('/login')
+    req, resp = app.test_client.get('/profile')
+    assert resp.status == 200 and resp.text == 'demo'
+    assert len(calls) == 1
+
+
+def test_login_url_cached(app):
+    app.config.AUTH_LOGIN_ENDPOINT = 'login'
+    app.config.AUTH_LOGIN_NEXT_ARG = 'next'
+    auth = Auth(app)
+
+    @app.route('/login')
+    async def login(request):
+        return response.text('login')
+
+    @app.route('/admin/login')
+    async def admin_login(request):
+        return response.text('admin login')
+
+    def handle_no_admin(request):
+        return response.redirect(auth.login_url_for(request, 'admin_login'))
+
+    @app.route('/user')
+    @auth.login_required
+    async def user(request):
+        return response.text('user')
+
+    @app.route('/admin')
+    @auth.login_required(handle_no_auth=handle_no_admin)
+    async def admin(request):
+        return response.text('admin')
+
+    req, resp = app.test_client.get('/user?a=1&b=2', allow_redirects=False)
+    assert resp.status == 302
+    assert resp.headers['Location'] == '/login?next=/user%3Fa%3D1%26b%3D2'
+    assert auth._login_urls == {'login': '/login'}
+
+    req, resp = app.test_client.get('/admin', allow_redirects=False)
+    assert resp.headers['Location'] == '/admin/login?next=/admin'
+    assert auth._login_urls['admin_login'] == '/admin/login'
+
+
+def test_login_url_external(app):
+    app.config.AUTH_LOGIN_ENDPOINT = 'login'
+    app.config.AUTH_LOGIN_EXTERNAL = True
+    app.config.AUTH_LOGIN_HOSTS = ['example.com', 'example.org']
+    auth = Auth(app)
+
+    @app.route('/login')
+    async def login(request):
+        return response.text('login')
+
+    @app.route('/user')
+    @auth.login_required
+    async def user(request):
+        return response.text('user')
+
+    def location(host):
+        req, resp = app.test_client.get(
+            '/user', headers={'Host': host}, allow_redirects=False)
+        return resp.headers['Location']
+
+    for host in ['example.com', 'Example.org:8000']:
+        assert location(host) == 'http://%s/login' % host.lower()
+    # not configured, the Host header is not to be trusted
+    assert location('evil.com') == '/login'
+    assert len(auth._login_urls) == 3
+
+    auth._login_urls.clear()
+    app.config.SERVER_NAME = 'example.com'
+    assert location('evil.com') == 'http://example.com/login'
+
+
+def test_session_token_expiry(app, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(sanic_auth, 'time', lambda: now[0])
+    app.config.AUTH_LOGIN_URL = '/login'
+    app.config.AUTH_TOKEN_MAX_AGE = 100
+    app.config.AUTH_TOKEN_RENEW_WINDOW = 30
+    app.config.AUTH_USER_CACHE_SIZE = 10
+    auth = Auth(app)
+    loaded = []
+
+    @auth.user_loader
+    async def load_user(token):
+        loaded.append(token)
+        return User(*token)
+
+    @app.post('/login')
+    async def login(request):
+        auth.login_user(request, User(id=1, name='demo'))
+        return response.text('okay')
+
+    @app.route('/user')
+    @auth.login_required(user_keyword='user')
+    async def user(request, user):
+        return response.text(user.name)
+
+    req, resp = app.test_client.post('/login')
+    session = req.ctx.session
+    for t in (1010.0, 1050.0):
+        now[0] = t
+        req, resp = app.test_client.get('/user')
+        assert resp.text == 'demo'
+    assert session['_auth']['exp'] == 1100 and len(loaded) == 1
+
+    # renewed and re-validated in background
+    now[0] = 1080.0
+    req, resp = app.test_client.get('/user')
+    assert resp.text == 'demo'
+    assert len(loaded) == 2
+
+    assert session['_auth']['exp'] == 1180
+
+    now[0] = 1160.0
+    req, resp = app.test_client.get('/user')
+    assert resp.text == 'demo'
+    assert session['_auth']['exp'] == 1260
+
+    now[0] = 1261.0
+    req, resp = app.test_client.get('/user', allow_redirects=False)
+    assert resp.status == 302
+
+
+def test_login_optional(app):
+    auth = Auth(app)
+    calls = []
+
+    @auth.user_loader
+    async def load_user(token):
+        calls.append(token)
+        return User(*token)
+
+    @app.post('/login')
+    async def login(request):
+        auth.login_user(request, User(id=1, name='demo'))
+        return response.text('okay')
+
+    @app.route('/')
+    @auth.login_optional
+    async def index(request, user):
+        if request.args.get('personalized'):
+            user = await user
+            return response.text(user.name if user else 'anonymous')
+        return response.text('hello')
+
+    for query in ('', '?personalized=1'):
+        req, resp = app.test_client.get('/' + query)
+        assert resp.status == 200
+    assert resp.text == 'anonymous' and calls == []
+
+    app.test_client.post('/login')
+    req, resp = app.test_client.get('/')
+    assert resp.text == 'hello' and calls == []
+    req, resp = app.test_client.get('/?personalized=1')
+    assert resp.text == 'demo' and len(calls) == 1
+
+
+def test_sync_routes(app):
+    app.config.AUTH_LOGIN_URL = '/login'
+    auth = Auth(app)
+
+    @app.post('/login')
+    async def login(request):
+        auth.login_user(request, User(id=1, name='demo', roles=('admin',)))
+        return response.text('okay')
+
+    @app.route('/user')
+    @auth.login_required(user_keyword='user')
+    def user(request, user):
+        return response.text(user.name)
+
+    async def later(request, user):
+        return response.text('later')
+
+    @app.route('/later')
+    @auth.roles_required('admin', any_of=('admin', 'guest'))
+    def returning_awaitable(request):
+        return later(request, None)
+
+    @app.route('/optional')
+    @auth.login_optional
+    def optional(request, user):
+        return response.text(repr(user))
+
+    req, resp = app.test_client.get('/user', allow_redirects=False)
+    assert resp.status == 302
+    app.test_client.post('/login')
+    req, resp = app.test_client.get('/user')
+    assert resp.status == 200 and resp.text == 'demo'
+    req, resp = app.test_client.get('/later')
+    assert resp.status == 200 and resp.text == 'later'
+    req, resp = app.test_client.get('/optional')
+    assert resp.text == '<LazyUser>'
+
+
+def test_reject_early():
+    app = Sanic('reject_early_app')
+    app.config.AUTH_SESSION_BACKEND = InMemorySessionBackend()
+    app.config.AUTH_COOKIE_SECURE = False
+    app.config.AUTH_LOGIN_URL = '/login'
+    app.config.AUTH_REJECT_EARLY = True
+    auth = Auth(app)
+    bodies = []
+
+    @app.post('/login')
+    async def login(request):
+        auth.login_user(request, User(id=1, name='demo'))
+        return response.text('okay')
+
+    @app.post('/upload', stream=True)
+    @auth.login_required
+    async def upload(request):
+        size = 0
+        while True:
+            chunk = await request.stream.read()
+            if chunk is None:
+                break
+            size += len(chunk)
+        return response.text(str(size))
+
+    @app.post('/form')
+    @auth.roles_required('uploader')
+    async def form(request):
+        return response.text(str(len(request.body)))
+
+    @app.middleware('response')
+    async def record_body(request, response):
+        if request.path == '/form':
+            bodies.append(len(request.body))
+
+    data = b'x' * 1000
+    req, resp = app.test_client.post('/upload', data=data,
+                                     allow_redirects=False)
+    assert resp.status == 302 and resp.headers['location'] == '/login'
+    req, resp = app.test_client.post('/form', data=data,
+                                     allow_redirects=False)
+    assert resp.status == 302 and bodies == [0]
+
+    req, resp = app.test_client.post('/login')
+    cookie = {'Cookie': 'session=' + resp.cookies['session']}
+    req, resp = app.test_client.post('/upload', data=data, headers=cookie)
+    assert resp.status == 200 and resp.text == '1000'
+    # authenticated, but not authorized
+    req, resp = app.test_client.post('/form', data=data, headers=cookie)
+    assert resp.status == 403 and bodies == [0, 0]
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+import asyncio
+
+import pytest
+
+from sanic import response
+from sanic_auth import Auth, BatchLoader, User
+
+
+USER_DB = {1: 'demo', 2: 'admin'}
+
+
+def test_batch_loader_coalesces():
+    batches = []
+
+    async def batch_load(tokens):
+        batches.append(tokens)
+        return [USER_DB.get(token) for token in tokens]
+
+    loader = BatchLoader(batch_load)
+
+    async def main():
+        users = await asyncio.gather(
+            loader.load(1), loader.load(2), loader.load(3), loader.load(1))
+        assert users == ['demo', 'admin', None, 'demo']
+        assert await loader.load(2) == 'admin'
+
+    asyncio.run(main())
+    assert batches == [[1, 2, 3], [2]]
+
+
+def test_batch_loader_max_batch_size():
+    batches = []
+
+    def batch_load(tokens):
+        batches.append(tokens)
+        return tokens
+
+    loader = BatchLoader(batch_load, max_batch_size=2)
+
+    async def main():
+        return await asyncio.gather(*[loader.load(i) for i in range(5)])
+
+    assert asyncio.run(main()) == list(range(5))
+    assert batches == [[0, 1], [2, 3], [4]]
+
+
+def test_batch_loader_cancelled_waiter():
+    batches = []
+
+    async def batch_load(tokens):
+        batches.append(tokens)
+        await asyncio.sleep(0.01)
+        return [USER_DB.get(token) for token in tokens]
+
+    loader = BatchLoader(batch_load)
+
+    async def main():
+        first = loader.load(1)
+        second = loader.load(1)
+        first.cancel()
+        assert await second == 'demo'
+
+    asyncio.run(main())
+    assert batches == [[1]]
+
+
+def test_batch_loader_error():
+    loader = BatchLoader(lambda tokens: [])
+
+    async def main():
+        with pytest.raises(ValueError):
+            await loader.load(1)
+
+    asyncio.run(main())
+
+
+def test_batch_loader_cancelled_batch():
+    async def batch_load(tokens):
+        await asyncio.sleep(10)
+
+    loader = BatchLoader(batch_load)
+
+    async def main():
+        future = loader.load(1)
+        # the batch is being loaded
+        await asyncio.sleep(0.01)
+        for task in asyncio.all_tasks() - {asyncio.current_task()}:
+            task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await asyncio.wait_for(future, 1)
+
+    asyncio.run(main())
+
+
+def test_load_users(app):
+    auth = Auth(app)
+    batches = []
+
+    @auth.batch_user_loader(max_batch_size=2)
+    def load_users(tokens):
+        batches.append(tokens)
+        return [User(*token) if token[0] in USER_DB else None
+                for token in tokens]
+
+    tokens = [(1, 'demo'), (2, 'admin'), (3, 'nobody')]
+    users = asyncio.run(auth.load_users(tokens))
+    assert [user and user.name for user in users] == ['demo', 'admin', None]
+    assert len(batches) == 2
+
+    @app.post('/login')
+    async def login(request):
+        auth.login_user(request, User(id=1, name='demo'))
+        return response.text('okay')
+
+    @app.route('/user')
+    @auth.login_required(user_keyword='user')
+    async def user(request, user):
+        return response.text(user.name)
+
+    app.test_client.post('/login')
+    req, resp = app.test_client.get('/user')
+    assert resp.status == 200 and resp.text == 'demo'
+    assert len(batches) == 3
+
+
+def test_load_users_without_batch_loader(app):
+    auth = Auth(app)
+    users = asyncio.run(auth.load_users([(1, 'demo')]))
+    assert users == [User(id=1, name='demo')]
@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+import asyncio
+
+import pytest
+
+from sanic import response
+from sanic_auth import Auth, User, UserCache
+from sanic_auth import cache as cache_module
+
+
+def test_lru_eviction():
+    cache = UserCache(maxsize=2)
+    calls = []
+
+    def load(token):
+        calls.append(token)
+        return token.upper()
+
+    assert cache.get('a', load, 'a') == 'A'
+    assert cache.get('b', load, 'b') == 'B'
+    assert cache.get('a', load, 'a') == 'A'
+    assert cache.get('c', load, 'c') == 'C'
+    assert len(cache) == 2
+    # 'b' was the least recently used one
+    assert cache.get('b', load, 'b') == 'B'
+    assert calls == ['a', 'b', 'c', 'b']
+    assert (cache.hits, cache.misses) == (1, 4)
+
+
+def test_ttl(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(cache_module, 'monotonic', lambda: now[0])
+    cache = UserCache(ttl=10)
+    calls = []
+
+    def load(token):
+        calls.append(token)
+        return token
+
+    cache.get('a', load)
+    now[0] += 5
+    cache.get('a', load)
+    assert len(calls) == 1
+    now[0] += 10
+    cache.get('a', load)
+    assert len(calls) == 2
+
+
+def test_dict_token_and_invalidate():
+    cache = UserCache()
+    calls = []
+
+    def load(token):
+        calls.append(token)
+        return User(id=token['uid'], name=token['name'])
+
+    token = {'uid': 1, 'name': 'demo'}
+    cache.get(token, load, 1)
+    cache.get(dict(token), load, 1)
+    assert len(calls) == 1
+    cache.invalidate(1)
+    assert len(cache) == 0
+    cache.get(token, load, 1)
+    assert len(calls) == 2
+
+
+def test_missing_user_not_cached():
+    cache = UserCache()
+    assert cache.get('nobody', lambda token: None) is None
+    assert len(cache) == 0
+
+
+def test_failing_loader():
+    cache = UserCache(maxsize=2)
+
+    def load(token):
+        raise LookupError(token)
+
+    for uid in range(10):
+        with pytest.raises(LookupError):
+            cache.get((uid, 'demo'), load, uid=uid)
+    assert len(cache) == 0
+    assert cache._uids == {} and cache._keys_by_uid == {}
+
+
+def test_single_flight():
+    cache = UserCache()
+    calls = []
+
+    async def load(token):
+        calls.append(token)
+        await asyncio.sleep(0.01)
+        return token
+
+    async def main():
+        users = await asyncio.gather(*[cache.get('a', load) for _ in range(5)])
+        assert users == ['a'] * 5
+        assert cache.get('a', load) == 'a'
+
+    asyncio.run(main())
+    assert calls == ['a']
+    assert (cache.hits, cache.misses) == (5, 1)
+
+
+def test_cancelled_waiter():
+    cache = UserCache()
+    calls = []
+
+    async def load(token):
+        calls.append(token)
+        await asyncio.sleep(0.01)
+        return token
+
+    async def wait(token):
+        return await cache.get(token, load)
+
+    async def main():
+        first = asyncio.ensure_future(wait('a'))
+        second = asyncio.ensure_future(wait('a'))
+        await asyncio.sleep(0)
+        first.cancel()
+        assert await second == 'a'
+        assert first.cancelled()
+        assert cache.get('a', load) == 'a'
+
+    asyncio.run(main())
+    assert calls == ['a']
+
+
+def test_invalidate_while_loading():
+    cache = UserCache()
+
+    async def load(token):
+        await asyncio.sleep(0.01)
+        return token
+
+    async def main():
+        pending = cache.get('a', load, 'a')
+        cache.invalidate('a')
+        assert await pending == 'a'
+        assert len(cache) == 0
+
+    asyncio.run(main())
+
+
+def test_auth_user_cache(app):
+    app.config.AUTH_USER_CACHE_SIZE = 10
+    auth = Auth(app)
+    calls = []
+
+    @auth.user_loader
+    async def load_user(token):
+        calls.append(token)
+        return User(*token)
+
+    @app.post('/login')
+    async def login(request):
+        auth.login_user(request, User(id=1, name='demo'))
+        return response.text('okay')
+
+    @app.route('/user')
+    @auth.login_required(user_keyword='user')
+    async def user(request, user):
+        return response.text(user.name)
+
+    @app.route('/update')
+    async def update(request):
+        auth.invalidate_user(1)
+        return response.text('okay')
+
+    app.test_client.post('/login')
+    for _ in range(3):
+        req, resp = app.test_client.get('/user')
+        assert resp.status == 200 and resp.text == 'demo'
+    assert len(calls) == 1
+    app.test_client.get('/update')
+    req, resp = app.test_client.get('/user')
+    assert resp.status == 200 and resp.text == 'demo'
+    assert len(calls) == 2
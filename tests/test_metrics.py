@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from sanic import response
+from sanic_auth import (
+    Auth, InMemoryMetrics, NullMetrics, PrometheusMetrics, User)
+
+
+def test_in_memory_metrics():
+    metrics = InMemoryMetrics(buckets=[0.1, 1])
+    metrics.observe('load_user', 0.05)
+    metrics.observe('load_user', 0.5)
+    metrics.observe('load_user', 5)
+    metrics.incr('rejected')
+    metrics.incr('rejected', 2)
+    metrics.add_gauge('answer', lambda: 42)
+    snapshot = metrics.snapshot()
+    timing = snapshot['timings']['load_user']
+    assert timing['count'] == 3 and timing['sum'] == pytest.approx(5.55)
+    assert timing['buckets'] == [(0.1, 1), (1, 2), (float('inf'), 3)]
+    assert snapshot['counters'] == {'rejected': 3}
+    assert snapshot['gauges'] == {'answer': 42}
+
+
+def test_prometheus_metrics():
+    metrics = PrometheusMetrics(prefix='auth', buckets=[0.1])
+    metrics.observe('session', 0.05)
+    metrics.incr('authenticated')
+    metrics.add_gauge('user_cache_hit_ratio', lambda: 0.5)
+    assert metrics.render() == '\n'.join([
+        '# TYPE auth_session_seconds histogram',
+        'auth_session_seconds_bucket{le="0.1"} 1',
+        'auth_session_seconds_bucket{le="+Inf"} 1',
+        'auth_session_seconds_sum 0.05',
+        'auth_session_seconds_count 1',
+        '# TYPE auth_authenticated_total counter',
+        'auth_authenticated_total 1',
+        '# TYPE auth_user_cache_hit_ratio gauge',
+        'auth_user_cache_hit_ratio 0.5',
+    ]) + '\n'
+
+
+def test_auth_metrics(app):
+    metrics = app.config.AUTH_METRICS = InMemoryMetrics()
+    app.config.AUTH_USER_CACHE_SIZE = 10
+    app.config.AUTH_LOGIN_URL = '/login'
+    auth = Auth(app)
+
+    @auth.user_loader
+    async def load_user(token):
+        return User(*token)
+
+    @app.route('/login')
+    async def login(request):
+        auth.login_user(request, User(id=1, name='demo'))
+        return response.text('okay')
+
+    @app.route('/logout')
+    async def logout(request):
+        auth.logout_user(request)
+        return response.text('okay')
+
+    @app.route('/user')
+    @auth.login_required(user_keyword='user')
+    async def user(request, user):
+        timings = auth.request_timings(request)
+        return response.json(sorted(timings))
+
+    req, resp = app.test_client.get('/user', allow_redirects=False)
+    assert resp.status == 302
+    app.test_client.get('/login')
+    req, resp = app.test_client.get('/user')
+    assert resp.json == ['load_user', 'session']
+    app.test_client.get('/user')
+    app.test_client.get('/logout')
+
+    snapshot = metrics.snapshot()
+    assert snapshot['counters'] == {
+        'anonymous': 1, 'authenticated': 2, 'rejected': 1}
+    assert snapshot['timings']['load_user']['count'] == 1
+    assert snapshot['timings']['handle_no_auth']['count'] == 1
+    assert snapshot['gauges']['user_cache_hit_ratio'] == 0.5
+
+
+def test_null_metrics_disables_instrumentation(app):
+    app.config.AUTH_METRICS = NullMetrics()
+    auth = Auth(app)
+    assert auth.metrics is None
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import threading
+import time
+
+import pytest
+
+from sanic import response
+from sanic_auth import Auth, InMemoryMetrics, Offloader, User
+
+
+def test_offloader():
+    release = threading.Event()
+
+    async def main():
+        offloader = Offloader(max_workers=1, timeout=0.05)
+        first = asyncio.ensure_future(offloader.run(release.wait))
+        second = asyncio.ensure_future(offloader.run(lambda: 'done'))
+        await asyncio.sleep(0.01)
+        assert (offloader.running, offloader.waiting) == (1, 1)
+        with pytest.raises(asyncio.TimeoutError):
+            await first
+        assert offloader.timeouts == 1
+        # the worker is still busy with the timed out call
+        assert not second.done()
+        release.set()
+        assert await second == 'done'
+        assert (offloader.running, offloader.waiting) == (0, 0)
+        offloader.close()
+
+    asyncio.run(main())
+
+
+def test_offloaded_loaders(app):
+    metrics = InMemoryMetrics()
+    app.config.AUTH_LOADER_EXECUTOR = 'thread'
+    app.config.AUTH_METRICS = metrics
+    auth = Auth(app)
+    threads = []
+
+    @auth.user_loader
+    def load_user(token):
+        # e.g. a blocking query
+        time.sleep(0.01)
+        threads.append(threading.current_thread().name)
+        return User(*token)
+
+    @auth.serializer(inline=False)
+    def serialize(user):
+        threads.append(threading.current_thread().name)
+        return (user.id, user.name)
+
+    @auth.roles_loader(inline=True)
+    def load_roles(user):
+        threads.append(threading.current_thread().name)
+        return ['admin']
+
+    @app.post('/login')
+    async def login(request):
+        await auth.login_user(request, User(id=1, name='demo'))
+        return response.text('okay')
+
+    @app.route('/user')
+    @auth.roles_required('admin', user_keyword='user')
+    async def user(request, user):
+        return response.text(user.name)
+
+    app.test_client.post('/login')
+    req, resp = app.test_client.get('/user')
+    assert resp.status == 200 and resp.text == 'demo'
+    serialized, loaded, roles = threads
+    assert serialized.startswith('sanic-auth-loader')
+    assert loaded.startswith('sanic-auth-loader')
+    assert roles == threading.main_thread().name
+    assert metrics.snapshot()['gauges']['loader_queue_depth'] == 0
+
+
+def test_loaders_before_setup(app):
+    app.config.AUTH_LOADER_EXECUTOR = 'thread'
+    auth = Auth()
+    threads = []
+
+    @auth.user_loader
+    def load_user(token):
+        threads.append(threading.current_thread().name)
+        return User(*token)
+
+    @auth.batch_user_loader
+    def load_users(tokens):
+        threads.append(threading.current_thread().name)
+        return [User(*token) for token in tokens]
+
+    auth.setup(app)
+
+    async def main():
+        assert (await auth.load_user((1, 'demo'))).name == 'demo'
+        assert (await auth.batch_loader.load((2, 'other'))).id == 2
+        auth.offloader.close()
+
+    asyncio.run(main())
+    assert len(threads) == 2
+    assert all(name.startswith('sanic-auth-loader') for name in threads)
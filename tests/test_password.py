@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import threading
+
+import pytest
+
+from sanic import response
+from sanic_auth import Auth, PasswordHasher, PasswordQueueFull
+from sanic_auth import password as password_module
+
+
+def test_password_hasher():
+    async def main():
+        hasher = PasswordHasher(params=(1000,))
+        hashed = await hasher.hash('secret')
+        assert hashed.startswith('pbkdf2_sha256$1000$')
+        assert hashed != await hasher.hash('secret')
+        assert await hasher.verify('secret', hashed)
+        assert not await hasher.verify('wrong', hashed)
+        assert not await hasher.verify('secret', 'garbage')
+        assert not hasher.needs_rehash(hashed)
+        assert PasswordHasher(params=(2000,)).needs_rehash(hashed)
+
+        scrypt = PasswordHasher('scrypt', params=(16, 8, 1),
+                                executor='process', max_workers=1)
+        hashed = await scrypt.hash('secret')
+        assert hashed.startswith('scrypt$16$8$1$')
+        assert await scrypt.verify('secret', hashed)
+        # hashes of any algorithm can be verified
+        assert await hasher.verify('secret', hashed)
+        assert hasher.needs_rehash(hashed)
+        scrypt.close()
+        hasher.close()
+
+    asyncio.run(main())
+    with pytest.raises(ValueError):
+        PasswordHasher('md5')
+
+
+def test_password_queue(monkeypatch):
+    release = threading.Event()
+    verify = password_module.verify_password
+
+    def slow_verify(password, hashed):
+        release.wait()
+        return verify(password, hashed)
+
+    monkeypatch.setattr(password_module, 'verify_password', slow_verify)
+
+    async def main():
+        hasher = PasswordHasher(params=(1000,), max_workers=1, max_queue=1)
+        hashed = await hasher.hash('secret')
+        first = asyncio.ensure_future(hasher.verify('secret', hashed))
+        second = asyncio.ensure_future(hasher.verify('secret', hashed))
+        await asyncio.sleep(0.01)
+        with pytest.raises(PasswordQueueFull):
+            await hasher.verify('secret', hashed)
+        release.set()
+        assert await first and await second
+        hasher.close()
+
+    asyncio.run(main())
+
+
+def test_verify_password_rehash(app):
+    app.config.AUTH_PASSWORD_HASHER = PasswordHasher(params=(1000,))
+    auth = Auth(app)
+    stored = {'hash': password_module.hash_password(
+        'pbkdf2_sha256', (500,), '1234')}
+
+    @app.post('/login')
+    async def login(request):
+        def save(hashed):
+            stored['hash'] = hashed
+        valid = await auth.verify_password(
+            request.form.get('password'), stored['hash'], rehash=save)
+        return response.text('okay' if valid else 'failed')
+
+    req, resp = app.test_client.post('/login', data={'password': '4321'})
+    assert resp.text == 'failed'
+    assert stored['hash'].startswith('pbkdf2_sha256$500$')
+    req, resp = app.test_client.post('/login', data={'password': '1234'})
+    assert resp.text == 'okay'
+    assert stored['hash'].startswith('pbkdf2_sha256$1000$')
+    req, resp = app.test_client.post('/login', data={'password': '1234'})
+    assert resp.text == 'okay'
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+import asyncio
+
+from sanic import response
+from sanic_auth import Auth, InMemoryRateLimiter, RedisRateLimiter
+from sanic_auth import ratelimit
+
+
+def test_in_memory_rate_limiter(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(ratelimit, 'monotonic', lambda: now[0])
+    limiter = InMemoryRateLimiter(limit=2, period=10, maxsize=2)
+    assert limiter.hit('a') and limiter.hit('a')
+    assert not limiter.hit('a')
+    now[0] += 5
+    assert limiter.hit('a')
+    assert not limiter.hit('a')
+    limiter.reset('a')
+    assert limiter.hit('a')
+
+    limiter.hit('b')
+    limiter.hit('c')
+    assert len(limiter) == 2 and 'a' not in limiter._buckets
+
+
+def test_redis_rate_limiter(redis_server, monkeypatch):
+    now = [1005.0]
+    monkeypatch.setattr(ratelimit, 'time', lambda: now[0])
+
+    async def main():
+        limiter = RedisRateLimiter(limit=2, period=10, port=redis_server.port)
+        assert await limiter.hit('a') and await limiter.hit('a')
+        assert not await limiter.hit('a')
+        # half of previous window counted
+        now[0] = 1015.0
+        assert not await limiter.hit('a')
+        now[0] = 1019.0
+        assert await limiter.hit('b')
+        await limiter.reset('a')
+        assert await limiter.hit('a')
+        await limiter.close()
+
+    asyncio.run(main())
+
+
+def test_rate_limit(app):
+    app.config.AUTH_RATE_LIMITER = InMemoryRateLimiter(limit=2, period=60)
+    auth = Auth(app)
+    attempts = []
+    lockouts = []
+
+    @auth.lockout_handler
+    def on_lockout(request, key):
+        lockouts.append(key)
+
+    @app.route('/login', methods=['GET', 'POST'])
+    @auth.rate_limit
+    async def login(request):
+        attempts.append(request.method)
+        return response.text('login')
+
+    for _ in range(3):
+        req, resp = app.test_client.get('/login')
+        assert resp.status == 200
+
+    form = {'username': 'demo', 'password': 'guess'}
+    for _ in range(2):
+        req, resp = app.test_client.post('/login', data=form)
+        assert resp.status == 200
+    req, resp = app.test_client.post('/login', data=form)
+    assert resp.status == 429
+    assert attempts == ['GET'] * 3 + ['POST'] * 2
+    assert lockouts == ['ip:127.0.0.1']
+
+    auth.rate_limiter.reset('ip:127.0.0.1')
+    req, resp = app.test_client.post('/login', data=form)
+    assert resp.status == 429
+    assert lockouts[-1] == 'user:demo'
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+from sanic import Sanic, response
+from sanic_auth import (
+    Auth, InMemoryMetrics, InMemorySessionBackend, Realms, User, UserCache)
+
+
+def test_realms():
+    app = Sanic('realms_app')
+    cache = UserCache(maxsize=10)
+    metrics = InMemoryMetrics()
+    app.config.AUTH_SESSION_BACKEND = InMemorySessionBackend()
+    app.config.AUTH_COOKIE_SECURE = False
+    app.config.AUTH_USER_CACHE = cache
+    app.config.AUTH_METRICS = metrics
+    app.config.AUTH_REALMS = {
+        'acme': {'AUTH_REALM_HOSTS': ['acme.test'],
+                 'AUTH_LOGIN_URL': '/acme-login'},
+        'globex': {'AUTH_REALM_PREFIXES': ['/globex'],
+                   'AUTH_LOGIN_URL': '/globex/login'},
+    }
+    realms = Realms()
+    acme = realms.add(Auth(app, realm='acme'))
+    globex = realms.add(Auth(app, realm='globex'))
+    assert acme.session_interface is globex.session_interface
+    assert acme.auth_session_key == '_auth_acme'
+
+    @acme.user_loader
+    def load_acme_user(token):
+        return User(token[0], 'acme ' + token[1])
+
+    @globex.user_loader
+    def load_globex_user(token):
+        return User(token[0], 'globex ' + token[1])
+
+    @app.post('/login')
+    @app.post('/globex/login', name='globex_login')
+    async def login(request):
+        auth = realms.select(request)
+        auth.login_user(request, User(id=1, name='demo'))
+        return response.text(auth.realm)
+
+    @app.route('/user')
+    @app.route('/globex/user', name='globex_user')
+    @realms.login_required(user_keyword='user')
+    async def user(request, user):
+        return response.text(user.name)
+
+    acme_host = {'Host': 'acme.test'}
+    req, resp = app.test_client.get('/user', headers=acme_host,
+                                    allow_redirects=False)
+    assert resp.status == 302 and resp.headers['location'] == '/acme-login'
+    req, resp = app.test_client.get('/globex/user', allow_redirects=False)
+    assert resp.status == 302 and resp.headers['location'] == '/globex/login'
+    req, resp = app.test_client.get('/user')
+    assert resp.status == 404
+
+    req, resp = app.test_client.post('/login', headers=acme_host)
+    assert resp.text == 'acme'
+    acme_cookie = {'Cookie': 'session=' + resp.cookies['session']}
+    acme_session = dict(acme_cookie, Host='acme.test')
+    req, resp = app.test_client.post('/globex/login')
+    assert resp.text == 'globex'
+    globex_session = {'Cookie': 'session=' + resp.cookies['session']}
+
+    req, resp = app.test_client.get('/user', headers=acme_session)
+    assert resp.text == 'acme demo'
+    req, resp = app.test_client.get('/globex/user', headers=globex_session)
+    assert resp.text == 'globex demo'
+    # sessions of one realm do not log in the other
+    req, resp = app.test_client.get('/globex/user', headers=acme_cookie,
+                                    allow_redirects=False)
+    assert resp.status == 302
+
+    # same token, apart in the shared cache
+    assert len(cache) == 2
+    acme.invalidate_user(1)
+    assert len(cache) == 1
+    counters = metrics.snapshot()['counters']
+    assert counters['acme_authenticated'] == 1
+    assert counters['globex_authenticated'] == 1
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import sqlite3
+
+import pytest
+
+import sanic_auth
+from sanic import response
+from sanic_auth import (
+    Auth, InMemoryRememberStore, SQLiteRememberStore, User)
+from sanic_auth.remember import (
+    check_validator, hash_validator, make_token, split_token)
+
+
+def test_tokens():
+    selector, validator, token = make_token()
+    assert split_token(token) == (selector, validator)
+    assert split_token('garbage') is None
+    assert split_token('.validator') is None
+    hashed = hash_validator(validator)
+    assert validator not in hashed
+    assert check_validator(validator, hashed)
+    assert not check_validator(validator + 'x', hashed)
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def store(request, tmp_path):
+    if request.param == 'memory':
+        return InMemoryRememberStore()
+    return SQLiteRememberStore(str(tmp_path / 'remember.db'))
+
+
+def test_store(store):
+    async def run():
+        await store.add('a', 1, 'hashed-a', [1, 'demo'], 100)
+        await store.add('b', 1, 'hashed-b', [1, 'demo'], 200)
+        await store.add('c', 2, 'hashed-c', [2, 'other'], 300)
+        uid, hashed, data, expires = await store.get('a')
+        assert (hashed, data, expires) == ('hashed-a', [1, 'demo'], 100)
+        assert await store.get('x') is None
+        await store.delete('a')
+        assert await store.get('a') is None
+        await store.delete_user(1)
+        assert await store.get('b') is None
+        await store.add('d', 2, 'hashed-d', [2, 'other'], 400)
+        assert await store.purge(350) == 1
+        assert await store.get('c') is None
+        assert await store.get('d') is not None
+        await store.close()
+
+    asyncio.run(run())
+
+
+def test_purge_failures():
+    store = InMemoryRememberStore(purge_interval=0.01)
+    calls = []
+
+    async def purge(now=None):
+        calls.append(now)
+        if len(calls) == 1:
+            raise sqlite3.OperationalError('database is locked')
+        return 0
+
+    store.purge = purge
+
+    async def run():
+        await store.open()
+        await asyncio.sleep(0.05)
+        assert not store._purger.done()
+        await store.close()
+
+    asyncio.run(run())
+    assert store.purge_failures == 1 and len(calls) > 1
+
+
+def test_remember_me(app, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(sanic_auth, 'time', lambda: now[0])
+    store = InMemoryRememberStore()
+    app.config.AUTH_LOGIN_URL = '/login'
+    app.config.AUTH_REMEMBER_STORE = store
+    app.config.AUTH_REMEMBER_MAX_AGE = 1000
+    app.config.AUTH_COOKIE_SECURE = False
+    auth = Auth(app)
+
+    @app.post('/login')
+    async def login(request):
+        await auth.login_user(request, User(id=1, name='demo'), remember=True)
+        return response.text('okay')
+
+    @app.post('/login-sync')
+    async def login_sync(request):
+        # issued at once, stored without being awaited
+        auth.login_user(request, User(id=1, name='demo'), remember=True)
+        assert request.ctx.session.get('_auth') is not None
+        return response.text('okay')
+
+    @app.route('/logout')
+    async def logout(request):
+        auth.logout_user(request)
+        return response.text('okay')
+
+    @app.route('/expire')
+    async def expire(request):
+        request.ctx.session.clear()
+        return response.text('okay')
+
+    @app.route('/user')
+    @auth.login_required(user_keyword='user')
+    async def user(request, user):
+        return response.text(user.name)
+
+    def get_user(cookie):
+        app.test_client.get('/expire')
+        return app.test_client.get(
+            '/user', headers={'Cookie': '_auth_remember=' + cookie},
+            allow_redirects=False)[1]
+
+    def forgotten(resp):
+        return resp.status == 302 and \
+            'max-age=0' in resp.headers['set-cookie'].lower()
+
+    req, resp = app.test_client.post('/login')
+    first = resp.cookies['_auth_remember']
+    assert len(store) == 1
+
+    resp = get_user(first)
+    assert resp.status == 200 and resp.text == 'demo'
+    second = resp.cookies['_auth_remember']
+    assert second != first and len(store) == 1
+    # rotated, so it is used only once
+    assert forgotten(get_user(first))
+    assert forgotten(get_user('garbage'))
+
+    resp = get_user(second)
+    assert resp.status == 200
+    third = resp.cookies['_auth_remember']
+    now[0] = 2001.0
+    assert forgotten(get_user(third))
+    now[0] = 1000.0
+
+    req, resp = app.test_client.post('/login-sync')
+    stolen = resp.cookies['_auth_remember']
+    app.test_client.post('/login')
+    assert len(store) == 2
+    # a wrong validator of a known selector, all tokens of user are gone
+    selector, validator = split_token(stolen)
+    assert forgotten(get_user(selector + '.' + validator[::-1]))
+    assert len(store) == 0
+
+    req, resp = app.test_client.post('/login')
+    fourth = resp.cookies['_auth_remember']
+    req, resp = app.test_client.get(
+        '/logout', headers={'Cookie': '_auth_remember=' + fourth})
+    assert 'max-age=0' in resp.headers['set-cookie'].lower()
+    assert get_user(fourth).status == 302
+
+
+def test_remember_not_configured(app):
+    auth = Auth(app)
+
+    @app.post('/login')
+    async def login(request):
+        with pytest.raises(RuntimeError):
+            auth.login_user(request, User(id=1, name='demo'), remember=True)
+        return response.text('okay')
+
+    req, resp = app.test_client.post('/login')
+    assert resp.status == 200
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import os
+
+from sanic import response
+from sanic_auth import (
+    Auth, MmapGenerations, RedisGenerations, SharedMemoryGenerations, User)
+from sanic_auth.resp import RedisError
+
+
+def test_shared_memory_generations():
+    name = 'sanic_auth_test_%d' % os.getpid()
+    first = SharedMemoryGenerations(name, slots=64)
+    second = SharedMemoryGenerations(name, slots=64)
+    try:
+        assert first.get(1) == 0 and second.get('1') == 0
+        assert first.bump(1) == 1
+        assert second.get(1) == 1
+        assert second.bump(1) == 2 and first.get(1) == 2
+    finally:
+        asyncio.run(second.close())
+        first.unlink()
+
+
+def test_redis_refresh_errors():
+    store = RedisGenerations(refresh_interval=0.01)
+    calls = []
+
+    async def refresh():
+        calls.append(len(calls))
+        if len(calls) == 1:
+            raise RedisError('LOADING Redis is loading the dataset')
+
+    store.refresh = refresh
+
+    async def main():
+        refresher = asyncio.ensure_future(store._refresh_periodically())
+        await asyncio.sleep(0.05)
+        assert not refresher.done()
+        refresher.cancel()
+
+    asyncio.run(main())
+    assert len(calls) > 1
+
+
+def test_mmap_generations(tmp_path):
+    path = str(tmp_path / 'generations')
+    first = MmapGenerations(path, slots=64)
+    first.bump('alice')
+    second = MmapGenerations(path, slots=64)
+    assert second.get('alice') == 1
+    second.bump('alice')
+    assert first.get('alice') == 2
+    for store in (first, second):
+        asyncio.run(store.close())
+        store.release()
+        store.mmap.close()
+    # survives restarts
+    third = MmapGenerations(path, slots=64)
+    assert third.get('alice') == 2
+    third.release()
+    third.mmap.close()
+
+
+def test_redis_generations(redis_server):
+    async def main():
+        first = RedisGenerations(port=redis_server.port, refresh_interval=60)
+        second = RedisGenerations(port=redis_server.port, refresh_interval=60)
+        await second.open()
+        del redis_server.commands[:]
+        # nothing bumped yet, but not loaded in full again
+        await second.refresh()
+        assert 'HGETALL' not in redis_server.commands
+        await first.bump(1)
+        # bumped in one atomic step
+        assert redis_server.commands[-1] == 'EVAL'
+        assert 'HINCRBY' not in redis_server.commands
+        await second.refresh()
+        assert second.get(1) == 1 and second.version == 1
+        assert await first.bump(1) == 2 and first.get(1) == 2
+        await first.bump(2)
+        assert second.get(1) == 1
+        del redis_server.commands[:]
+        await second.refresh()
+        assert second.get(1) == 2 and second.get(2) == 1
+        assert second.version == 3
+        # only changes are pulled
+        assert 'HGETALL' not in redis_server.commands
+        await first.close()
+        await second.close()
+
+    asyncio.run(main())
+
+
+def test_revoke_user(app, tmp_path):
+    generations = MmapGenerations(str(tmp_path / 'generations'), slots=64)
+    app.config.AUTH_REVOCATION = generations
+    app.config.AUTH_LOGIN_URL = '/login'
+    auth = Auth(app)
+
+    @app.post('/login')
+    async def login(request):
+        auth.login_user(request, User(id=1, name='demo'))
+        return response.text('okay')
+
+    @app.route('/revoke')
+    async def revoke(request):
+        auth.revoke_user(1)
+        return response.text('okay')
+
+    @app.route('/user')
+    @auth.login_required(user_keyword='user')
+    async def user(request, user):
+        return response.text(user.name)
+
+    app.test_client.post('/login')
+    req, resp = app.test_client.get('/user')
+    assert resp.status == 200 and resp.text == 'demo'
+
+    # e.g. from another worker
+    MmapGenerations(str(tmp_path / 'generations'), slots=64).bump(1)
+    req, resp = app.test_client.get('/user', allow_redirects=False)
+    assert resp.status == 302
+
+    app.test_client.post('/login')
+    req, resp = app.test_client.get('/user')
+    assert resp.status == 200 and resp.text == 'demo'
+    app.test_client.get('/revoke')
+    req, resp = app.test_client.get('/user', allow_redirects=False)
+    assert resp.status == 302
@@ -0,0 +1,269 @@
+# -*- coding: utf-8 -*-
+import asyncio
+
+import pytest
+
+from sanic import Sanic, response
+from sanic_auth import (
+    Auth, InMemorySessionBackend, LazySession, RedisSessionBackend, User)
+from sanic_auth import session as session_module
+from sanic_auth.resp import RedisError, RedisPool
+from sanic_auth.session import Session
+
+
+class CountingBackend(InMemorySessionBackend):
+    def __init__(self):
+        super().__init__()
+        self.calls = []
+
+    async def load(self, sid):
+        self.calls.append('load')
+        return await super().load(sid)
+
+    async def save(self, sid, data, max_age):
+        self.calls.append('save')
+        return await super().save(sid, data, max_age)
+
+    async def delete(self, sid):
+        self.calls.append('delete')
+        return await super().delete(sid)
+
+
+def test_lazy_session():
+    backend = InMemorySessionBackend()
+
+    async def main():
+        await backend.save('sid', {'a': 1, 'b': 2}, None)
+        session = Session(backend, 'sid')
+        assert not session.loaded
+        with pytest.raises(RuntimeError):
+            session['a']
+        session['c'] = 3
+        assert session['c'] == 3
+        assert session.pop('b', None) is None
+        assert session.modified
+        await session.load()
+        assert dict(session) == {'a': 1, 'c': 3}
+
+        session = Session(backend, 'unknown')
+        await session.load()
+        assert session.sid is None and len(session) == 0
+
+        session = Session(backend)
+        assert session.loaded and not session.modified
+
+    asyncio.run(main())
+
+
+def test_in_memory_backend_expiry(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(session_module, 'monotonic', lambda: now[0])
+    backend = InMemorySessionBackend()
+
+    async def main():
+        await backend.save('a', {'x': 1}, 10)
+        await backend.save('b', {'x': 2}, 20)
+        await backend.save('c', {'x': 3}, None)
+        now[0] += 15
+        assert await backend.load('a') is None
+        assert backend.sweep() == 0
+        now[0] += 10
+        assert backend.sweep() == 1
+        assert await backend.load('c') == {'x': 3}
+
+    asyncio.run(main())
+
+
+def test_redis_pool(redis_server):
+    async def main():
+        pool = RedisPool(port=redis_server.port, db=1, password='secret',
+                         maxsize=2)
+        assert await pool.execute('SET', 'key', 'value') == 'OK'
+        values = await asyncio.gather(
+            *[pool.execute('GET', 'key') for _ in range(10)])
+        assert values == [b'value'] * 10
+        assert await pool.execute('DEL', 'key', 'other') == 1
+        assert await pool.execute('GET', 'key') is None
+        with pytest.raises(RedisError):
+            await pool.execute('NOSUCHCOMMAND')
+        assert len(pool._idle) == 2
+        await pool.close()
+
+    asyncio.run(main())
+    # two connections, each authenticated and selected db once
+    assert redis_server.commands.count('AUTH') == 2
+    assert redis_server.commands.count('SELECT') == 2
+
+
+def make_app(name, backend):
+    app = Sanic(name)
+    app.config.AUTH_SESSION_BACKEND = backend
+    app.config.AUTH_COOKIE_SECURE = False
+    app.config.AUTH_LOGIN_URL = '/login'
+    auth = Auth(app)
+
+    @app.route('/login')
+    async def login(request):
+        auth.login_user(request, User(id=1, name='demo'))
+        return response.text('okay')
+
+    @app.route('/logout')
+    async def logout(request):
+        auth.logout_user(request)
+        return response.text('okay')
+
+    @app.route('/user')
+    @auth.login_required(user_keyword='user')
+    async def user(request, user):
+        return response.text(user.name)
+
+    @app.route('/public')
+    async def public(request):
+        return response.text('public')
+
+    return app
+
+
+def test_auth_session_backend():
+    backend = CountingBackend()
+    app = make_app('session_app', backend)
+
+    req, resp = app.test_client.get('/public')
+    req, resp = app.test_client.get('/user', allow_redirects=False)
+    assert resp.status == 302
+    # no session cookie, no session I/O
+    assert backend.calls == []
+
+    req, resp = app.test_client.get('/login')
+    sid = resp.cookies['session']
+    assert backend.calls == ['save']
+    cookie = {'Cookie': 'session=%s' % sid}
+
+    del backend.calls[:]
+    app.test_client.get('/public', headers=cookie)
+    assert backend.calls == []
+    req, resp = app.test_client.get('/user', headers=cookie)
+    assert resp.status == 200 and resp.text == 'demo'
+    # read only
+    assert backend.calls == ['load']
+
+    del backend.calls[:]
+    req, resp = app.test_client.get('/logout', headers=cookie)
+    assert backend.calls == ['load', 'delete']
+    req, resp = app.test_client.get('/user', headers=cookie,
+                                    allow_redirects=False)
+    assert resp.status == 302
+
+
+def test_session_fixation():
+    backend = InMemorySessionBackend()
+    app = make_app('fixation_app', backend)
+
+    @app.route('/visit')
+    async def visit(request):
+        session = await request.ctx.session.load()
+        session['visits'] = session.get('visits', 0) + 1
+        return response.text(str(session['visits']))
+
+    req, resp = app.test_client.get('/visit')
+    planted = resp.cookies['session']
+    req, resp = app.test_client.get(
+        '/login', headers={'Cookie': 'session=%s' % planted})
+    sid = resp.cookies['session']
+    assert sid != planted
+    req, resp = app.test_client.get(
+        '/user', headers={'Cookie': 'session=%s' % planted},
+        allow_redirects=False)
+    assert resp.status == 302
+    cookie = {'Cookie': 'session=%s' % sid}
+    req, resp = app.test_client.get('/user', headers=cookie)
+    assert resp.text == 'demo'
+    # session data is kept
+    req, resp = app.test_client.get('/visit', headers=cookie)
+    assert resp.text == '2'
+
+    req, resp = app.test_client.get('/logout', headers=cookie)
+    assert resp.cookies['session'] not in (sid, planted)
+    req, resp = app.test_client.get('/user', headers=cookie,
+                                    allow_redirects=False)
+    assert resp.status == 302
+
+
+def test_auth_redis_session_backend(redis_server):
+    backend = RedisSessionBackend(port=redis_server.port, prefix='s:')
+    app = make_app('redis_session_app', backend)
+
+    req, resp = app.test_client.get('/login')
+    sid = resp.cookies['session']
+    assert list(redis_server.data) == [b's:' + sid.encode()]
+    req, resp = app.test_client.get(
+        '/user', headers={'Cookie': 'session=%s' % sid})
+    assert resp.status == 200 and resp.text == 'demo'
+
+
+def test_lazy_session_proxy():
+    app = Sanic('lazy_session_app')
+    app.config.AUTH_LOGIN_URL = '/login'
+    store = {'sid': {}}
+    fetched = []
+    loaded = []
+
+    async def fetch(sid):
+        fetched.append(sid)
+        return store.get(sid)
+
+    @app.middleware('request')
+    async def add_session(request):
+        sid = request.cookies.get('sid')
+        request.ctx.session = LazySession(lambda: fetch(sid))
+
+    auth = Auth(app)
+
+    @auth.user_loader
+    def load_user(token):
+        loaded.append(token)
+        return User(*token)
+
+    @app.route('/login')
+    async def login(request):
+        auth.login_user(request, User(id=1, name='demo'))
+        await request.ctx.session.load()
+        return response.text('okay')
+
+    @app.route('/public')
+    async def public(request):
+        return response.text('public')
+
+    @app.route('/check')
+    async def check(request):
+        authenticated = await auth.is_authenticated(request)
+        return response.text('yes' if authenticated else 'no')
+
+    cookie = {'Cookie': 'sid=sid'}
+    app.test_client.get('/public', headers=cookie)
+    assert fetched == []
+    req, resp = app.test_client.get('/check', headers=cookie)
+    assert resp.text == 'no' and fetched == ['sid']
+
+    app.test_client.get('/login', headers=cookie)
+    assert store['sid'] == {'_auth': (1, 'demo', (), None)}
+    req, resp = app.test_client.get('/check', headers=cookie)
+    assert resp.text == 'yes'
+    assert loaded == []
+
+
+def test_is_authenticated(app):
+    auth = Auth(app)
+
+    @auth.user_loader
+    def load_user(token):
+        raise AssertionError('user should not be loaded')
+
+    @app.route('/check')
+    async def check(request):
+        before = auth.is_authenticated(request)
+        auth.login_user(request, User(id=1, name='demo'))
+        return response.json([before, auth.is_authenticated(request)])
+
+    req, resp = app.test_client.get('/check')
+    assert resp.json == [False, True]
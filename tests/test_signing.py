@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+import sanic_auth
+from sanic import response
+from sanic_auth import Auth, TokenSigner, User
+from sanic_auth import signing
+
+
+def test_sign_and_unsign():
+    signer = TokenSigner('secret')
+    signed = signer.sign({'uid': 1, 'name': 'demo'})
+    assert signer.unsign(signed) == {'uid': 1, 'name': 'demo'}
+    assert signer.unsign(signed + 'x') is None
+    assert signer.unsign(signed[1:]) is None
+    assert signer.unsign('garbage') is None
+    assert signer.unsign('') is None
+    assert TokenSigner('other secret').unsign(signed) is None
+
+
+def test_expiry(monkeypatch):
+    signer = TokenSigner('secret', max_age=60)
+    signed = signer.sign('token')
+    assert signer.unsign(signed) == 'token'
+    now = signing.time()
+    monkeypatch.setattr(signing, 'time', lambda: now + 61)
+    assert signer.unsign(signed) is None
+
+
+def test_key_rotation():
+    old = TokenSigner(['old'])
+    signed = old.sign('token')
+    rotated = TokenSigner(['new', 'old'])
+    assert rotated.unsign(signed) == 'token'
+    assert old.unsign(rotated.sign('token')) is None
+    assert TokenSigner(['new']).unsign(signed) is None
+
+
+def test_no_keys():
+    with pytest.raises(ValueError):
+        TokenSigner([])
+
+
+def test_stateless_auth(app):
+    app.config.AUTH_STATELESS = True
+    app.config.AUTH_SECRET_KEYS = ['secret']
+    app.config.AUTH_COOKIE_SECURE = False
+    app.config.AUTH_LOGIN_URL = '/login'
+    auth = Auth(app)
+    assert auth.token_max_age == 24 * 3600
+
+    @app.post('/login')
+    async def login(request):
+        signed = auth.login_user(request, User(id=1, name='demo'))
+        return response.text(signed)
+
+    @app.route('/logout')
+    async def logout(request):
+        token = auth.logout_user(request)
+        return response.text(token[1] if token else '')
+
+    @app.route('/user')
+    @auth.login_required(user_keyword='user')
+    async def user(request, user):
+        return response.text(user.name)
+
+    req, resp = app.test_client.get('/user', allow_redirects=False)
+    assert resp.status == 302
+
+    req, resp = app.test_client.post('/login')
+    signed = resp.text
+    assert resp.cookies['_auth'] == signed
+
+    cookie = {'Cookie': '_auth=%s' % signed}
+    req, resp = app.test_client.get('/user', headers=cookie)
+    assert resp.status == 200 and resp.text == 'demo'
+
+    bearer = {'Authorization': 'Bearer %s' % signed}
+    req, resp = app.test_client.get('/user', headers=bearer)
+    assert resp.status == 200 and resp.text == 'demo'
+
+    forged = {'Authorization': 'Bearer %sx' % signed}
+    req, resp = app.test_client.get('/user', headers=forged,
+                                    allow_redirects=False)
+    assert resp.status == 302
+
+    req, resp = app.test_client.get('/logout', headers=cookie)
+    assert resp.text == 'demo'
+    assert 'max-age=0' in resp.headers['set-cookie'].lower()
+
+
+def test_stateless_never_expiring(app):
+    app.config.AUTH_STATELESS = True
+    app.config.AUTH_SECRET_KEYS = ['secret']
+    app.config.AUTH_TOKEN_MAX_AGE = None
+    with pytest.raises(RuntimeError):
+        Auth(app)
+
+
+def test_sliding_renewal(app, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(sanic_auth, 'time', lambda: now[0])
+    monkeypatch.setattr(signing, 'time', lambda: now[0])
+    app.config.AUTH_STATELESS = True
+    app.config.AUTH_SECRET_KEYS = ['secret']
+    app.config.AUTH_COOKIE_SECURE = False
+    app.config.AUTH_LOGIN_URL = '/login'
+    app.config.AUTH_TOKEN_MAX_AGE = 100
+    app.config.AUTH_TOKEN_RENEW_WINDOW = 30
+    auth = Auth(app)
+
+    @app.post('/login')
+    async def login(request):
+        return response.text(auth.login_user(request, User(id=1, name='demo')))
+
+    @app.route('/user')
+    @auth.login_required(user_keyword='user')
+    async def user(request, user):
+        return response.text(user.name)
+
+    req, resp = app.test_client.post('/login')
+    signed = resp.text
+    bearer = {'Authorization': 'Bearer %s' % signed}
+
+    # not within the window, nothing is re-issued
+    now[0] = 1050.0
+    req, resp = app.test_client.get('/user', headers=bearer)
+    assert resp.text == 'demo' and 'set-cookie' not in resp.headers
+
+    now[0] = 1080.0
+    req, resp = app.test_client.get('/user', headers=bearer)
+    assert resp.text == 'demo'
+    renewed = resp.cookies['_auth']
+    assert TokenSigner('secret').unsign_with_expiry(renewed) == (
+        [1, 'demo', [], None], 1180)
+
+    now[0] = 1101.0
+    req, resp = app.test_client.get('/user', headers=bearer,
+                                    allow_redirects=False)
+    assert resp.status == 302
+    bearer = {'Authorization': 'Bearer %s' % renewed}
+    req, resp = app.test_client.get('/user', headers=bearer)
+    assert resp.text == 'demo'
@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+import asyncio
+
+import pytest
+from websockets.exceptions import ConnectionClosed
+
+import sanic_auth
+from sanic import Sanic, response
+from sanic_auth import (
+    Auth, ConnectionRegistry, InMemoryMetrics, InMemorySessionBackend, User)
+
+
+class FakeSocket:
+    def __init__(self):
+        self.sent = []
+        self.closed = None
+
+    async def send(self, data):
+        if self.closed is not None:
+            raise RuntimeError('closed')
+        self.sent.append(data)
+
+    async def close(self, code=1000, reason=''):
+        self.closed = code
+
+
+def connect(app, uri, mimic):
+    # the test client raises if the server has closed the connection, and
+    # fails to serve the app again afterwards
+    closed = []
+
+    async def recording(ws):
+        try:
+            await mimic(ws)
+        finally:
+            closed.append(ws.close_code)
+
+    try:
+        app.test_client.websocket(uri, mimic=recording)
+    except ValueError as exc:
+        closed.append(str(exc))
+    return closed
+
+
+def test_connection_registry():
+    registry = ConnectionRegistry()
+    first, second, other = FakeSocket(), FakeSocket(), FakeSocket()
+    registry.add(1, first)
+    registry.add(1, second)
+    registry.add(2, other)
+    assert len(registry) == 3 and 1 in registry
+    assert set(registry.connections(1)) == {first, second}
+
+    loop = asyncio.new_event_loop()
+    assert loop.run_until_complete(registry.send(1, 'hello')) == 2
+    assert first.sent == second.sent == ['hello'] and other.sent == []
+    assert loop.run_until_complete(registry.close(1, 1008)) == 2
+    assert first.closed == second.closed == 1008 and other.closed is None
+    assert 1 not in registry and len(registry) == 1
+    assert loop.run_until_complete(registry.send(1, 'hello')) == 0
+    registry.discard(2, other)
+    registry.discard(2, other)
+    assert len(registry) == 0
+    loop.close()
+
+
+def test_websocket_login_required(app):
+    app.config.AUTH_LOGIN_URL = '/login'
+    auth = Auth(app)
+    seen = []
+
+    @app.route('/login')
+    async def login(request):
+        auth.login_user(request, User(id=1, name='demo'))
+        return response.text('okay')
+
+    @app.websocket('/feed')
+    @auth.websocket_login_required(user_keyword='user')
+    async def feed(request, ws, user):
+        await ws.send(user.name)
+        while True:
+            message = await ws.recv()
+            seen.append((message, len(auth.connections)))
+            if message == 'logout':
+                auth.logout_user(request)
+
+    app.test_client.get('/login')
+
+    async def logged_in(ws):
+        assert await ws.recv() == 'demo'
+        await ws.send('hello')
+        await ws.send('logout')
+        with pytest.raises(ConnectionClosed):
+            await ws.recv()
+
+    assert connect(app, '/feed', logged_in)[0] == 1008
+    assert seen == [('hello', 1), ('logout', 1)]
+    assert len(auth.connections) == 0 and auth._sweeper is None
+
+
+def test_websocket_anonymous(app):
+    auth = Auth(app)
+
+    @app.websocket('/feed')
+    @auth.websocket_login_required
+    async def feed(request, ws):
+        await ws.send('welcome')
+
+    async def anonymous(ws):
+        with pytest.raises(ConnectionClosed):
+            await ws.recv()
+
+    assert connect(app, '/feed', anonymous)[0] == 1008
+    assert len(auth.connections) == 0
+
+
+def test_websocket_check_interval(app, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(sanic_auth, 'time', lambda: now[0])
+    app.config.AUTH_LOGIN_URL = '/login'
+    app.config.AUTH_TOKEN_MAX_AGE = 100
+    app.config.AUTH_WS_CHECK_INTERVAL = 0.01
+    auth = Auth(app)
+
+    @app.route('/login')
+    async def login(request):
+        auth.login_user(request, User(id=1, name='demo'))
+        return response.text('okay')
+
+    @app.websocket('/feed')
+    @auth.websocket_login_required
+    async def feed(request, ws):
+        while True:
+            await ws.send(await ws.recv())
+
+    app.test_client.get('/login')
+
+    async def expiring(ws):
+        await ws.send('ping')
+        assert await ws.recv() == 'ping'
+        now[0] = 1101.0
+        with pytest.raises(ConnectionClosed):
+            await asyncio.wait_for(ws.recv(), 1)
+
+    assert connect(app, '/feed', expiring)[0] == 1008
+    assert len(auth.connections) == 0
+
+
+def test_websocket_check_failed(app):
+    metrics = InMemoryMetrics()
+    app.config.AUTH_METRICS = metrics
+    app.config.AUTH_WS_CHECK_INTERVAL = 0.01
+    auth = Auth(app)
+    broken, expired = FakeSocket(), FakeSocket()
+    auth.connections.add(1, broken, 'broken')
+    auth.connections.add(2, expired, 'expired')
+
+    def get_token(request):
+        if request == 'broken':
+            raise ConnectionError('store is down')
+        return None
+
+    auth.get_token = get_token
+
+    async def main():
+        sweeper = asyncio.ensure_future(auth._sweep_connections())
+        await asyncio.sleep(0.05)
+        assert not sweeper.done()
+        sweeper.cancel()
+
+    asyncio.run(main())
+    assert expired.closed == 1008 and broken.closed is None
+    assert 1 in auth.connections and 2 not in auth.connections
+    assert metrics.snapshot()['counters']['websocket_check_failed'] >= 1
+
+
+def test_websocket_reject_early():
+    app = Sanic('websocket_reject_early_app')
+    app.config.AUTH_SESSION_BACKEND = InMemorySessionBackend()
+    app.config.AUTH_COOKIE_SECURE = False
+    app.config.AUTH_LOGIN_URL = '/login'
+    app.config.AUTH_REJECT_EARLY = True
+    auth = Auth(app)
+
+    @app.websocket('/feed')
+    @auth.websocket_login_required(
+        handle_no_auth=lambda request: response.text('no', status=401))
+    async def feed(request, ws):
+        await ws.send('welcome')
+
+    with pytest.raises(ValueError, match=r'InvalidStatusCode\(401'):
+        app.test_client.websocket('/feed')